@@ -1,6 +1,11 @@
 import sys
 from fst import FST
-from fsmutils import composechars, trace
+from fsmutils import composechars, trace, cached_fst
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 kFRENCH_TRANS = {0: "zero", 1: "un", 2: "deux", 3: "trois", 4:
                  "quatre", 5: "cinq", 6: "six", 7: "sept", 8: "huit",
@@ -13,12 +18,30 @@ kFRENCH_TRANS = {0: "zero", 1: "un", 2: "deux", 3: "trois", 4:
 
 kFRENCH_AND = 'et'
 
+# Scale words for each group of three digits, from the right: (singular,
+# plural).  "mille" is invariable and is never preceded by "un".
+kFRENCH_SCALES = [None, ('mille', 'mille'), ('million', 'millions'),
+                  ('milliard', 'milliards'), ('billion', 'billions'),
+                  ('billiard', 'billiards'), ('trillion', 'trillions')]
+
 def prepare_input(integer):
     assert isinstance(integer, int) and integer < 1000 and integer >= 0, \
       "Integer out of bounds"
     # print list("%03i" % integer)
     return list("%03i" % integer)
 
+def prepare_groups(integer):
+    """
+    Splits integer into groups of three digits, most significant first,
+    each in the form returned by prepare_input
+    """
+    assert isinstance(integer, (int, long)) and integer >= 0 and \
+      integer < 1000 ** len(kFRENCH_SCALES), "Integer out of bounds"
+    digits = str(integer)
+    digits = '0' * (-len(digits) % 3) + digits
+    return [list(digits[i:i+3]) for i in xrange(0, len(digits), 3)]
+
+@cached_fst
 def french_count():
     f = FST('french')
     states = ['start', 'final','cent','x','y']
@@ -61,8 +84,9 @@ def french_count():
 
     #tenth to ones place arcs
     #adding all empty states
+    #(c = 7 and d = 9 read a 0 as 'dix' below, so they get no empty arc)
     for state in tens :
-        if state != 'e' :
+        if state not in ('c', 'd', 'e') :
             f.add_arc(state, 'final',(str('0')), ())
 
     # adding for state a = 2-6
@@ -107,13 +131,128 @@ def french_count():
 
     return f
 
+@cached_fst
+def french_scale(scale):
+    """
+    Returns an FST that reads a group of three digits and writes the
+    scale word for it (e.g. "millions" for scale 2), agreeing in number
+    with the group.  It accepts any group but 000, which is not read
+    out.
+    """
+    singular, plural = kFRENCH_SCALES[scale]
+    f = FST('french-scale-%d' % scale)
+    # z1/z2: only zeroes so far; p1/p2: a non-zero digit has been read
+    for state in ['start', 'z1', 'z2', 'p1', 'p2', 'final']:
+        f.add_state(state)
+    f.initial_state = 'start'
+    f.set_final('final')
+
+    f.add_arc('start', 'z1', '0', ())
+    f.add_arc('z1', 'z2', '0', ())
+    f.add_arc('z2', 'final', '1', [singular])
+    for i in range(1, 10):
+        f.add_arc('start', 'p1', [str(i)], ())
+        f.add_arc('z1', 'p2', [str(i)], ())
+    for i in range(2, 10):
+        f.add_arc('z2', 'final', [str(i)], [plural])
+    for i in range(0, 10):
+        f.add_arc('p1', 'p2', [str(i)], ())
+        f.add_arc('p2', 'final', [str(i)], [plural])
+    return f
+
+def french_number(integer):
+    """
+    Returns the French words for integer, which can be as large as
+    10^21 - 1.  The number is read out three digits at a time with
+    french_count, each non-zero group followed by its scale word.
+    """
+    groups = prepare_groups(integer)
+    if integer == 0:
+        return " ".join(_machine(french_count).transduce(groups[0]))
+    words = []
+    for (i, group) in enumerate(groups):
+        scale = len(groups) - 1 - i
+        if group == ['0', '0', '0']:
+            continue
+        if not (scale == 1 and group == ['0', '0', '1']):
+            words.extend(_machine(french_count).transduce(group))
+        if scale:
+            words.extend(_machine(french_scale, scale).transduce(group))
+    return " ".join(words)
+
+_machines = {}
+
+def _machine(builder, *args):
+    """Loads each machine from the builder cache only once per process."""
+    key = (builder.__name__,) + args
+    if key not in _machines:
+        _machines[key] = builder(*args)
+    return _machines[key]
+
+_french_tables = None
+
+def french_tables():
+    """
+    Returns one table per scale, each a list of 1000 strings: the words
+    for a group of three digits at that scale (with its scale word),
+    preceded by a space, or '' for 000.  The tables are built once, from
+    french_count and french_scale.
+    """
+    global _french_tables
+    if _french_tables is None:
+        f = _machine(french_count)
+        base = [" ".join(f.transduce(prepare_input(group)))
+                for group in xrange(1000)]
+        _french_tables = []
+        for scale in xrange(len(kFRENCH_SCALES)):
+            table = ['']
+            for group in xrange(1, 1000):
+                words = [] if (scale == 1 and group == 1) else [base[group]]
+                if scale:
+                    words.extend(_machine(french_scale, scale).transduce(
+                        prepare_input(group)))
+                table.append(" " + " ".join(words))
+            _french_tables.append(table)
+    return _french_tables
+
+def french_count_many(integers, sep=None):
+    """
+    Returns the French words for each of integers (a list, or a NumPy
+    integer array) as a list, or, if sep is given, as a single string
+    with sep after each number.  Numbers are assembled from the
+    precomputed french_tables, so no FST is run; NumPy arrays are
+    assembled a whole scale at a time.
+    """
+    tables = french_tables()
+    if (numpy is not None and isinstance(integers, numpy.ndarray) and
+            integers.dtype.kind in 'iu'):
+        integers = integers.reshape(-1)
+        if len(integers) and integers.min() < 0:
+            raise AssertionError("Integer out of bounds")
+        top = len(str(int(integers.max()))) if len(integers) else 1
+        words = numpy.zeros(len(integers), dtype=object)
+        words[:] = ''
+        for scale in reversed(xrange((top + 2) // 3)):
+            groups = (integers // 1000 ** scale) % 1000
+            words = words + numpy.array(tables[scale], dtype=object)[groups]
+        words = [w[1:] or 'zero' for w in words.tolist()]
+    else:
+        words = []
+        for integer in integers:
+            groups = prepare_groups(integer)
+            pieces = [tables[len(groups) - 1 - i][int(''.join(group))]
+                      for (i, group) in enumerate(groups)]
+            words.append(''.join(pieces)[1:] or 'zero')
+    if sep is None:
+        return words
+    return ''.join(w + sep for w in words)
+
 if __name__ == '__main__':
     string_input = raw_input()
     user_input = int(string_input)
-    f = french_count()
     if string_input:
         print user_input, '-->',
-        print " ".join(f.transduce(prepare_input(user_input)))
+        print french_number(user_input)
 
     # for user_input in range(250,301) : 
     #     f = french_count()
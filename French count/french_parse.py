@@ -0,0 +1,202 @@
+"""
+Parsing French number words back into integers.
+
+The words for 0-999 are recognized by the inverse of french_count():
+its output strings are split into single words, the machine is
+inverted so that it reads words and writes digits, and the result is
+made deterministic with cascade() and compiled with CompiledFST, so a
+group is recognized in one pass over its words.  A small spelling
+machine in front of it accepts the usual variants of the words
+french_count() writes: zero with its accent, and the plurals
+"quatre-vingts" and "deux cents" at the end of a group.  Scale words
+(mille, millions, ...) between groups are handled by french_parse and
+find_numbers.
+"""
+import re
+import sys
+from fst import FST
+from fsmutils import cached_fst, cascade, CompiledFST
+from french_count import french_count, kFRENCH_SCALES
+
+# Maps every scale word, singular or plural, to its scale.
+kSCALE_WORDS = dict((word, scale)
+                    for (scale, words) in enumerate(kFRENCH_SCALES) if words
+                    for word in words)
+
+# (variant, word, after): a spelling accepted for a word.  If after is
+# given, the variant must follow one of those words and end the group:
+# "vingt" and "cent" take an s when they are multiplied and end a
+# number (quatre-vingts, deux cents), or come before million etc.
+kSPELLING_VARIANTS = [(u'z\xe9ro', 'zero', None),
+                      ('vingts', 'vingt', ['quatre']),
+                      ('cents', 'cent', ['deux', 'trois', 'quatre', 'cinq',
+                                         'six', 'sept', 'huit', 'neuf'])]
+
+kWORD_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+kJOINER_RE = re.compile(r'^[\s-]+$', re.UNICODE)
+
+@cached_fst
+def french_parse_fst():
+    """
+    Returns a deterministic FST that reads the French words for a number
+    from 0 to 999, one word per symbol, and writes its three digits.
+    The spellings in kSPELLING_VARIANTS are accepted too.
+    """
+    f = french_count()
+    words = FST('french-words')
+    for state in f.states():
+        words.add_state(state, is_final=f.is_final(state))
+    words.initial_state = f.initial_state
+    for arc in f.arcs():
+        src, dst, in_string, out_string = f.arc_info(arc)
+        out_words = tuple(word for out in out_string for word in out.split())
+        words.add_arc(src, dst, in_string, out_words)
+
+    # Rewrites the variants to the words above.  State ('after', word)
+    # is reached by reading word; a variant that ends a group leads to
+    # the state 'end', which has no way out.
+    vocabulary = sorted(set(word for arc in words.arcs()
+                            for word in words.out_string(arc)))
+    states = ['start'] + [('after', word) for word in vocabulary]
+    spelling = FST('french-spelling')
+    for state in states + ['end']:
+        spelling.add_state(state, is_final=True)
+    spelling.initial_state = 'start'
+    for state in states:
+        for word in vocabulary:
+            spelling.add_arc(state, ('after', word), (word,), (word,))
+        for (variant, word, after) in kSPELLING_VARIANTS:
+            if after is None:
+                spelling.add_arc(state, ('after', word), (variant,), (word,))
+            elif state[1] in after:
+                spelling.add_arc(state, 'end', (variant,), (word,))
+    return cascade(spelling, words.inverted())
+
+_parse_table = None
+
+def _table():
+    global _parse_table
+    if _parse_table is None:
+        _parse_table = CompiledFST(french_parse_fst())
+    return _parse_table
+
+def _group_value(table, state, digits):
+    # The digits written so far, plus the final state's finalizing string
+    return int(''.join(digits) +
+               ''.join(table.outputs[table.finalizing[state]]))
+
+def tokenize(text):
+    """
+    Returns the words of text as a list of (word, start, end), with the
+    words lower-cased.  Hyphens separate words ("quatre-vingt-dix").
+    """
+    return [(m.group().lower(), m.start(), m.end())
+            for m in kWORD_RE.finditer(text)]
+
+def match_number(words, start=0, end=None):
+    """
+    Finds the longest number phrase in words[start:end] that starts at
+    words[start].  Returns (end of the phrase, integer), or None if no
+    number starts there.  Groups must come in decreasing order of
+    scale, "mille" is not preceded by "un", and zero only stands alone.
+    """
+    table = _table()
+    if end is None:
+        end = len(words)
+    best = None
+    total = 0
+    last_scale = None
+    state, digits, group_len = 0, [], 0
+    i = start
+    while i < end:
+        word = words[i]
+        if word in kSCALE_WORDS:
+            scale = kSCALE_WORDS[word]
+            if last_scale is not None and scale >= last_scale:
+                break
+            if group_len == 0:
+                if scale != 1:
+                    break
+                value = 1
+            else:
+                if not table.final[state]:
+                    break
+                value = _group_value(table, state, digits)
+                if value == 0 or (scale == 1 and value == 1):
+                    break
+            total += value * 1000 ** scale
+            last_scale = scale
+            state, digits, group_len = 0, [], 0
+            i += 1
+            best = (i, total)
+            continue
+        sym = table.symbol_ids.get(word, table.unknown)
+        digits.extend(table.outputs[table.output[state][sym]])
+        state = table.transition[state][sym]
+        if state == table.dead:
+            break
+        group_len += 1
+        i += 1
+        if table.final[state]:
+            value = _group_value(table, state, digits)
+            if value == 0 and last_scale is not None:
+                break
+            best = (i, total + value)
+    return best
+
+def french_parse(text):
+    """
+    Returns the integer written out in French in text, e.g. 97 for
+    "quatre vingt dix sept".
+
+    @raise ValueError: if text is not exactly one number.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf8')
+    words = [word for (word, _, _) in tokenize(text)]
+    match = match_number(words)
+    if match is None or match[0] != len(words):
+        raise ValueError('Not a French number: %r' % (text,))
+    return match[1]
+
+def find_numbers(text):
+    """
+    Generates (start, end, integer) for each number written out in
+    French in text, scanning from left to right and taking the longest
+    phrase at each position.  The words of a phrase may only be
+    separated by spaces and hyphens.
+    """
+    tokens = tokenize(text)
+    words = [word for (word, _, _) in tokens]
+    # segment[i] is the end of the run of joinable words containing i
+    segment = [0] * len(tokens)
+    end = len(tokens)
+    for i in reversed(xrange(len(tokens))):
+        segment[i] = end
+        if i and not kJOINER_RE.match(text[tokens[i-1][2]:tokens[i][1]]):
+            end = i
+    i = 0
+    while i < len(tokens):
+        match = match_number(words, i, segment[i])
+        if match is None:
+            i += 1
+            continue
+        yield (tokens[i][1], tokens[match[0] - 1][2], match[1])
+        i = match[0]
+
+def replace_numbers(text, render=str):
+    """Returns text with every French number in it replaced by
+    render(integer)."""
+    pieces = []
+    last = 0
+    for (start, end, integer) in find_numbers(text):
+        pieces.append(text[last:start])
+        pieces.append(render(integer))
+        last = end
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+if __name__ == '__main__':
+    for line in sys.stdin:
+        text = line.rstrip('\n').decode('utf8')
+        print replace_numbers(text).encode('utf8')
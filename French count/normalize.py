@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Streaming normalizer that writes out the numbers in French text.
+
+Every run of digits, including numbers grouped with thousands
+separators ("1 250 000", "1.250.000", or with a non-breaking space),
+is replaced by its French words, e.g. "12 500" -> "douze mille cinq
+cent".  Text is read and written incrementally, in chunks of lines
+that can be spread across worker processes; the output keeps the
+order of the input, and only a few chunks are in memory at once.
+
+    python normalize.py --infile corpus.txt.gz --outfile out.txt.gz -w 4
+"""
+import argparse
+import re
+import sys
+from itertools import islice
+
+from fsmutils import prepfile, ordered_map
+from french_count import french_count_many, kFRENCH_SCALES
+
+# A group of one to three digits followed by groups of exactly three
+# digits, all separated by the same separator, or a plain run of
+# digits.  The (?<!\d) / (?!\d) guards stop "1 2345" being read as a
+# grouped number.
+kNUMBER_RE = re.compile(ur'(?<!\d)(?:\d{1,3}(?:( |\u00a0|\u202f|\.)\d{3})'
+                        ur'(?:\1\d{3})*|\d+)(?!\d)', re.UNICODE)
+
+kLIMIT = 1000 ** len(kFRENCH_SCALES)
+
+def normalize_lines(lines):
+    """
+    Returns lines (a list of unicode strings) with every number written
+    out in French.  Numbers too large to verbalize are left alone.  All
+    the numbers in lines are verbalized in one call to
+    french_count_many.
+    """
+    matches = []
+    for (i, line) in enumerate(lines):
+        for m in kNUMBER_RE.finditer(line):
+            value = int(re.sub(ur'\D', u'', m.group()))
+            if value < kLIMIT:
+                matches.append((i, m.start(), m.end(), value))
+    if not matches:
+        return lines
+    words = french_count_many([value for (_, _, _, value) in matches])
+    output = list(lines)
+    # Replace from the right, so earlier offsets stay valid.
+    for ((i, start, end, _), word) in reversed(zip(matches, words)):
+        output[i] = output[i][:start] + word + output[i][end:]
+    return output
+
+def normalize_text(text):
+    """Returns text with every number written out in French."""
+    return normalize_lines([text])[0]
+
+def chunks(lines, size):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write out the numbers in French text.")
+    parser.add_argument("--infile", "-i",
+                        type=argparse.FileType('r'), default=sys.stdin,
+                        help="input file (may be .gz)")
+    parser.add_argument("--outfile", "-o",
+                        type=argparse.FileType('w'), default=sys.stdout,
+                        help="output file (may be .gz)")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                        help="processes used to normalize the text")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=10000, help="lines sent to a worker at once")
+    args = parser.parse_args()
+
+    infile = prepfile(args.infile, 'r')
+    outfile = prepfile(args.outfile, 'w')
+    for lines in ordered_map(normalize_lines,
+                             chunks(infile, args.chunk_size),
+                             workers=args.workers):
+        outfile.writelines(lines)
+    outfile.close()
+
+if __name__ == '__main__':
+    main()
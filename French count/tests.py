@@ -0,0 +1,184 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+import fsmutils
+from french_count import (french_count, french_number, prepare_input,
+                          prepare_groups, french_count_many)
+from french_parse import french_parse, find_numbers, replace_numbers
+from normalize import normalize_text, normalize_lines
+from verbalizer import verbalize, verbalize_many, verbalizer_fst
+
+EXAMPLES = [(0, 'zero'), (1, 'un'), (17, 'dix sept'), (21, 'vingt et un'),
+            (71, 'soixante et onze'), (80, 'quatre vingt'),
+            (81, 'quatre vingt un'), (99, 'quatre vingt dix neuf'),
+            (100, 'cent'), (101, 'cent un'), (180, 'cent quatre vingt'),
+            (201, 'deux cent un'), (300, 'trois cent'),
+            (1000, 'mille'), (1001, 'mille un'), (2000, 'deux mille'),
+            (21000, 'vingt et un mille'), (100000, 'cent mille'),
+            (1000000, 'un million'), (2000000, 'deux millions'),
+            (1000001, 'un million un'),
+            (201000301, 'deux cent un millions trois cent un'),
+            (1200000000, 'un milliard deux cent millions'),
+            (10 ** 12, 'un billion'), (10 ** 15, 'un billiard'),
+            (10 ** 18, 'un trillion'), (3 * 10 ** 18, 'trois trillions')]
+
+
+def setUpModule():
+    # Keep the builder cache out of the user's ~/.cache/fst.
+    global saved_cache_dir
+    saved_cache_dir = fsmutils.FST_CACHE_DIR
+    fsmutils.FST_CACHE_DIR = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(fsmutils.FST_CACHE_DIR)
+    fsmutils.FST_CACHE_DIR = saved_cache_dir
+
+
+class TestFrenchCount(unittest.TestCase):
+
+    def test_examples(self):
+        for (integer, words) in EXAMPLES:
+            self.assertEqual(french_number(integer), words)
+
+    def test_below_thousand(self):
+        f = french_count()
+        for integer in range(1000):
+            self.assertEqual(french_number(integer),
+                             ' '.join(f.transduce(prepare_input(integer))))
+
+    def test_groups(self):
+        self.assertEqual(prepare_groups(7), [['0', '0', '7']])
+        self.assertEqual(prepare_groups(1234567),
+                         [['0', '0', '1'], ['2', '3', '4'], ['5', '6', '7']])
+        self.assertRaises(AssertionError, prepare_groups, -1)
+        self.assertRaises(AssertionError, prepare_groups, 10 ** 21)
+        self.assertEqual(len(french_number(10 ** 21 - 1).split()), 48)
+
+
+class TestFrenchCountMany(unittest.TestCase):
+
+    def test_matches_french_number(self):
+        rng = random.Random(0)
+        integers = [integer for (integer, _) in EXAMPLES]
+        integers += [rng.randrange(10 ** rng.randint(1, 18))
+                     for _ in range(2000)]
+        expected = [french_number(integer) for integer in integers]
+        self.assertEqual(french_count_many(integers), expected)
+        self.assertEqual(french_count_many(numpy.array(integers)), expected)
+        self.assertEqual(french_count_many(
+            numpy.array(integers, dtype=numpy.uint64)), expected)
+        self.assertEqual(french_count_many([10 ** 21 - 1]),
+                         [french_number(10 ** 21 - 1)])
+
+    def test_buffer(self):
+        self.assertEqual(french_count_many([5, 17], sep='\n'),
+                         'cinq\ndix sept\n')
+        self.assertEqual(french_count_many(numpy.array([], dtype=int)), [])
+        self.assertRaises(AssertionError, french_count_many,
+                          numpy.array([3, -1]))
+
+
+class TestFrenchParse(unittest.TestCase):
+
+    def test_round_trip(self):
+        for integer in range(1000):
+            self.assertEqual(french_parse(french_number(integer)), integer)
+        for (integer, words) in EXAMPLES:
+            self.assertEqual(french_parse(words), integer)
+        self.assertEqual(french_parse('Quatre-vingt-dix-sept'), 97)
+
+    def test_rejects(self):
+        for text in ['', 'un mille', 'mille mille', 'cent zero', 'vingt un',
+                     'dix sept cent', 'deux millions milliards']:
+            self.assertRaises(ValueError, french_parse, text)
+
+    def test_spellings(self):
+        for (text, integer) in [('quatre vingts', 80), ('Quatre-vingts', 80),
+                                ('deux cents', 200), (u'z\xe9ro', 0),
+                                ('z\xc3\xa9ro', 0),
+                                ('neuf cent quatre-vingts', 980),
+                                ('quatre-vingts mille', 80000),
+                                ('deux cents millions trois cents', 200000300)]:
+            self.assertEqual(french_parse(text), integer)
+        for text in ['deux cents trois', 'quatre-vingts-dix', 'vingts',
+                     'cents', 'trois vingts', u'cent z\xe9ro']:
+            self.assertRaises(ValueError, french_parse, text)
+        self.assertEqual(replace_numbers(u'quatre-vingts ans, z\xe9ro euro'),
+                         u'80 ans, 0 euro')
+
+    def test_find_numbers(self):
+        text = ('Il a paye quatre-vingt-dix-sept euros et vingt et un '
+                'centimes, puis mille deux cent; un, deux.')
+        self.assertEqual([integer for (_, _, integer) in find_numbers(text)],
+                         [97, 21, 1200, 1, 2])
+        self.assertEqual(replace_numbers(text),
+                         'Il a paye 97 euros et 21 centimes, puis 1200; 1, 2.')
+        self.assertEqual(replace_numbers('vingt et un ans', render=hex),
+                         '0x15 ans')
+
+    def test_main(self):
+        env = dict(os.environ, FST_CACHE_DIR=fsmutils.FST_CACHE_DIR)
+        process = subprocess.Popen([sys.executable, 'french_parse.py'],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, env=env)
+        (output, _) = process.communicate(u'z\xe9ro, d\xe9j\xe0 deux\n'
+                                          .encode('utf8'))
+        self.assertEqual(output.decode('utf8'), u'0, d\xe9j\xe0 2\n')
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_numbers(self):
+        self.assertEqual(normalize_text(u'Il a 21 ans et 12 500 euros.'),
+                         u'Il a vingt et un ans et douze mille cinq cent '
+                         u'euros.')
+        self.assertEqual(normalize_text(u'1.250.000 et 3\u00a0000'),
+                         u'un million deux cent cinquante mille et '
+                         u'trois mille')
+        self.assertEqual(normalize_text(u'1 2345'), u'un deux mille trois '
+                                                    u'cent quarante cinq')
+        self.assertEqual(normalize_text(u'sans chiffres'), u'sans chiffres')
+        self.assertEqual(normalize_text(u'x' + u'9' * 22),
+                         u'x' + u'9' * 22)
+
+    def test_lines(self):
+        self.assertEqual(normalize_lines([u'1\n', u'\n', u'2 et 3\n']),
+                         [u'un\n', u'\n', u'deux et trois\n'])
+
+
+class TestVerbalizer(unittest.TestCase):
+
+    def test_french_matches_french_count(self):
+        f = french_count()
+        expected = [' '.join(f.transduce(prepare_input(integer)))
+                    for integer in range(1000)]
+        self.assertEqual([verbalize(integer) for integer in range(1000)],
+                         expected)
+        self.assertEqual(verbalize_many(range(1000)), expected)
+
+    def test_languages(self):
+        self.assertEqual(verbalize(71, 'english'), 'seventy-one')
+        self.assertEqual(verbalize(115, 'english'), 'one hundred fifteen')
+        self.assertEqual(verbalize(999, 'english'),
+                         'nine hundred ninety-nine')
+        self.assertEqual(verbalize(21, 'spanish'), 'veintiuno')
+        self.assertEqual(verbalize(100, 'spanish'), 'cien')
+        self.assertEqual(verbalize(171, 'spanish'), 'ciento setenta y uno')
+        self.assertEqual(verbalize(500, 'spanish'), 'quinientos')
+
+    def test_minimal(self):
+        # A trie over three digits has 1 + 10 + 100 + 1 states.
+        for language in ['french', 'english', 'spanish']:
+            self.assertTrue(len(list(verbalizer_fst(language).states())) < 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Number verbalizers compiled from declarative language specs.
+
+A spec describes how a language says the numbers from 0 to 999: its
+unit, teen and tens words, irregular numbers, the conjunction between
+tens and units ("vingt et un", "treinta y uno"), how the tens and units
+words are joined ("twenty-one"), vigesimal tens (French 70 = 60 + 10)
+and its hundreds.  compile_verbalizer spells every number from the
+spec, builds a trie over the three input digits, and minimizes it;
+the minimal machine is run with CompiledFST.  Adding a language is a
+matter of writing its spec.
+
+Spec keys:
+  - zero: the word for 0
+  - units: the words for 1-9
+  - special: words for numbers below 100 that are not built from
+    their tens and units (teens, Spanish 21-29, ...)
+  - tens: the words for 20, 30, ... indexed by tens digit
+  - vigesimal: maps a tens digit to the tens digit it is built on, the
+    rest being said as a number from 10 to 19
+  - and_word, and_tens, and_units: the conjunction, the tens digits
+    that take it, and the numbers said after it
+  - joiner: put between a tens word and the units word (default ' ')
+  - hundreds: the words for 100, 200, ... indexed by hundreds digit
+  - exact_hundreds: irregular words for exact hundreds (Spanish cien)
+"""
+import sys
+from fst import FST
+from fsmutils import cached_fst, minimize, CompiledFST
+
+kFRENCH_SPEC = {
+    'zero': 'zero',
+    'units': ['un', 'deux', 'trois', 'quatre', 'cinq', 'six', 'sept',
+              'huit', 'neuf'],
+    'special': {10: 'dix', 11: 'onze', 12: 'douze', 13: 'treize',
+                14: 'quatorze', 15: 'quinze', 16: 'seize'},
+    'tens': {1: 'dix', 2: 'vingt', 3: 'trente', 4: 'quarante',
+             5: 'cinquante', 6: 'soixante', 8: 'quatre vingt'},
+    'vigesimal': {7: 6, 9: 8},
+    'and_word': 'et',
+    'and_tens': [2, 3, 4, 5, 6, 7],
+    'and_units': [1, 11],
+    'hundreds': {1: 'cent', 2: 'deux cent', 3: 'trois cent',
+                 4: 'quatre cent', 5: 'cinq cent', 6: 'six cent',
+                 7: 'sept cent', 8: 'huit cent', 9: 'neuf cent'},
+}
+
+kENGLISH_SPEC = {
+    'zero': 'zero',
+    'units': ['one', 'two', 'three', 'four', 'five', 'six', 'seven',
+              'eight', 'nine'],
+    'special': {10: 'ten', 11: 'eleven', 12: 'twelve', 13: 'thirteen',
+                14: 'fourteen', 15: 'fifteen', 16: 'sixteen',
+                17: 'seventeen', 18: 'eighteen', 19: 'nineteen'},
+    'tens': {2: 'twenty', 3: 'thirty', 4: 'forty', 5: 'fifty', 6: 'sixty',
+             7: 'seventy', 8: 'eighty', 9: 'ninety'},
+    'joiner': '-',
+    'hundreds': {1: 'one hundred', 2: 'two hundred', 3: 'three hundred',
+                 4: 'four hundred', 5: 'five hundred', 6: 'six hundred',
+                 7: 'seven hundred', 8: 'eight hundred',
+                 9: 'nine hundred'},
+}
+
+# Accents are left out, as in the French spec.
+kSPANISH_SPEC = {
+    'zero': 'cero',
+    'units': ['uno', 'dos', 'tres', 'cuatro', 'cinco', 'seis', 'siete',
+              'ocho', 'nueve'],
+    'special': {10: 'diez', 11: 'once', 12: 'doce', 13: 'trece',
+                14: 'catorce', 15: 'quince', 16: 'dieciseis',
+                17: 'diecisiete', 18: 'dieciocho', 19: 'diecinueve',
+                20: 'veinte', 21: 'veintiuno', 22: 'veintidos',
+                23: 'veintitres', 24: 'veinticuatro', 25: 'veinticinco',
+                26: 'veintiseis', 27: 'veintisiete', 28: 'veintiocho',
+                29: 'veintinueve'},
+    'tens': {3: 'treinta', 4: 'cuarenta', 5: 'cincuenta', 6: 'sesenta',
+             7: 'setenta', 8: 'ochenta', 9: 'noventa'},
+    'and_word': 'y',
+    'and_tens': [3, 4, 5, 6, 7, 8, 9],
+    'and_units': range(1, 10),
+    'hundreds': {1: 'ciento', 2: 'doscientos', 3: 'trescientos',
+                 4: 'cuatrocientos', 5: 'quinientos', 6: 'seiscientos',
+                 7: 'setecientos', 8: 'ochocientos', 9: 'novecientos'},
+    'exact_hundreds': {1: 'cien'},
+}
+
+kSPECS = {'french': kFRENCH_SPEC, 'english': kENGLISH_SPEC,
+          'spanish': kSPANISH_SPEC}
+
+def spell_below_100(spec, integer):
+    """Returns the words for 1 <= integer < 100 as a string."""
+    if integer in spec.get('special', {}):
+        return spec['special'][integer]
+    if integer < 10:
+        return spec['units'][integer - 1]
+    tens, units = divmod(integer, 10)
+    if tens in spec.get('vigesimal', {}):
+        tens = spec['vigesimal'][tens]
+        units = integer - 10 * tens
+    if units == 0:
+        return spec['tens'][tens]
+    words = spell_below_100(spec, units)
+    if tens in spec.get('and_tens', ()) and units in spec['and_units']:
+        return ' '.join([spec['tens'][tens], spec['and_word'], words])
+    return spec['tens'][tens] + spec.get('joiner', ' ') + words
+
+def spell(spec, integer):
+    """Returns the words for 0 <= integer < 1000 as a list."""
+    if integer == 0:
+        return [spec['zero']]
+    hundreds, rest = divmod(integer, 100)
+    words = []
+    if hundreds:
+        if rest == 0 and hundreds in spec.get('exact_hundreds', {}):
+            words.append(spec['exact_hundreds'][hundreds])
+        else:
+            words.append(spec['hundreds'][hundreds])
+    if rest:
+        words.append(spell_below_100(spec, rest))
+    return ' '.join(words).split()
+
+def compile_verbalizer(spec, label='verbalizer'):
+    """
+    Returns a minimal deterministic FST that reads three digits and
+    writes the words for the number they make, one word per output
+    symbol.
+    """
+    f = FST(label)
+    f.add_state('', is_final=False)
+    f.initial_state = ''
+    f.add_state('end', is_final=True)
+    for integer in xrange(1000):
+        digits = '%03d' % integer
+        for i in range(2):
+            if not f.has_state(digits[:i+1]):
+                f.add_state(digits[:i+1])
+                f.add_arc(digits[:i], digits[:i+1], (digits[i],), ())
+        f.add_arc(digits[:2], 'end', (digits[2],),
+                  tuple(spell(spec, integer)))
+    return minimize(f)
+
+@cached_fst
+def verbalizer_fst(language):
+    """Returns the compiled verbalizer for one of the kSPECS languages."""
+    return compile_verbalizer(kSPECS[language], 'verbalizer-' + language)
+
+_tables = {}
+
+def _table(language):
+    if language not in _tables:
+        _tables[language] = CompiledFST(verbalizer_fst(language))
+    return _tables[language]
+
+def verbalize(integer, language='french'):
+    """Returns the words for 0 <= integer < 1000 in language."""
+    assert isinstance(integer, int) and 0 <= integer < 1000, \
+      "Integer out of bounds"
+    return ' '.join(_table(language).transduce('%03d' % integer))
+
+def verbalize_many(integers, language='french'):
+    """Returns the words for each of integers, all run through the
+    compiled machine at once."""
+    for integer in integers:
+        assert 0 <= integer < 1000, "Integer out of bounds"
+    return _table(language).transduce_many(['%03d' % integer
+                                            for integer in integers],
+                                           sep=' ')
+
+if __name__ == '__main__':
+    language = sys.argv[1] if len(sys.argv) > 1 else 'french'
+    string_input = raw_input()
+    if string_input:
+        print string_input, '-->', verbalize(int(string_input), language)
@@ -0,0 +1,135 @@
+"""
+Morphological analysis: mapping surface words back to analyses.
+
+The analyzer is the generation machine run backwards.  lexicon_fst
+builds a minimal acceptor (see lexicon.py) for the analyses of a
+lexicon -- every stem, alone or followed by '+' and an affix -- and
+composing it with morphology_fst() (see rewrite.py) gives a machine
+that generates exactly the words of the lexicon.  Both machines are
+deterministic, so cascade() composes them directly, and the product is
+minimized.  Inverting it gives analyzer_fst, which reads a word and
+writes its analyses, e.g. "icing" -> "ice+ing".
+
+A word can have more than one analysis: with the stems "bake" and
+"baker", "baker" is both bake+r and baker.  The inverse is then not a
+function, and cannot be determinized.  analyzer_fst tries to
+determinize it anyway, and Analyzer runs the result with CompiledFST
+when it can; otherwise it follows every path of the inverse at once,
+through tables in which the epsilon arcs have been folded into the
+arcs before them.  Either way a word is analyzed in a single pass over
+its letters, whatever the size of the lexicon.
+
+Stems must be spelled with the letters of kALPHABET (rewrite.py);
+analyses the rules cannot generate are left out of the machine.
+"""
+import sys
+from fsmutils import (cached_fst, cascade, compose, invert, minimize,
+                      remove_epsilons, CompiledFST)
+from lexicon import Lexicon, kAFFIXES
+from rewrite import morphology_fst
+
+def lexicon_fst(stems, affixes=kAFFIXES, label='lexicon'):
+    """
+    Returns a minimal deterministic acceptor (an FST that writes what it
+    reads) for each of stems, alone or followed by '+' and one of
+    affixes.
+    """
+    return Lexicon(stems).to_fst(affixes, label)
+
+@cached_fst
+def analyzer_fst(stems, affixes=tuple(kAFFIXES)):
+    """
+    Returns an FST that reads a word generated from the lexicon of
+    stems and affixes and writes its analyses, one character per
+    symbol.  The machine is deterministic and minimal if every word
+    has a single analysis; otherwise every arc reads at most one
+    symbol, and some read none.
+    """
+    generator = cascade(lexicon_fst(stems, affixes), morphology_fst())
+    analyzer = compose(invert(generator))
+    try:
+        return minimize(remove_epsilons(analyzer).determinized())
+    except ValueError:
+        return analyzer
+
+class Analyzer(object):
+    """
+    Finds every analysis of a word in a lexicon of stems and affixes.
+    If analyzer_fst() is deterministic it is run with a CompiledFST
+    (available as C{table}, which is None otherwise).
+    """
+    def __init__(self, stems, affixes=kAFFIXES):
+        self.fst = analyzer_fst(tuple(sorted(set(stems))), tuple(affixes))
+        try:
+            self.table = CompiledFST(self.fst)
+        except ValueError:
+            self.table = None
+            self._compile(self.fst)
+
+    def _compile(self, fst):
+        # Number the states (the initial state is 0), and compute the
+        # states each one reaches through epsilon arcs, with what they
+        # write on the way.  The lexicon is finite, so there are no
+        # epsilon cycles.
+        ids = dict((state, i) for (i, state) in
+                   enumerate([fst.initial_state] +
+                             [s for s in fst.states()
+                              if s != fst.initial_state]))
+        arcs = [[] for _ in ids]
+        epsilons = [[] for _ in ids]
+        for arc in fst.arcs():
+            src, dst, in_string, out_string = fst.arc_info(arc)
+            out = ''.join(out_string)
+            if in_string:
+                arcs[ids[src]].append((in_string[0], out, ids[dst]))
+            else:
+                epsilons[ids[src]].append((out, ids[dst]))
+        closures = {}
+        def closure(state):
+            if state not in closures:
+                reached = set([(state, '')])
+                for (out, dst) in epsilons[state]:
+                    reached.update((s, out + w) for (s, w) in closure(dst))
+                closures[state] = reached
+            return closures[state]
+
+        self.final = [fst.is_final(state) for state in
+                      sorted(ids, key=ids.get)]
+        self.initial = closure(0)
+        # next[state][char] lists the (output, state) pairs reached by
+        # reading char in state, and then following epsilon arcs.
+        self.next = []
+        for state in range(len(ids)):
+            table = {}
+            for (char, out, dst) in arcs[state]:
+                table.setdefault(char, set()).update(
+                    (s, out + w) for (s, w) in closure(dst))
+            self.next.append(dict((char, [(w, s) for (s, w) in pairs])
+                                  for (char, pairs) in table.items()))
+
+    def analyze(self, word):
+        """Returns a sorted list of the analyses of word, which is empty
+        if word is not in the lexicon."""
+        if self.table is not None:
+            output = self.table.transduce(word)
+            return [''.join(output)] if output is not None else []
+        paths = self.initial
+        for char in word:
+            paths = set((dst, out + w) for (state, out) in paths
+                        for (w, dst) in self.next[state].get(char, ()))
+            if not paths:
+                return []
+        return sorted(set(out for (state, out) in paths
+                          if self.final[state]))
+
+    def analyze_many(self, words):
+        """Analyze each of words, returning a list of lists."""
+        return [self.analyze(word) for word in words]
+
+if __name__ == '__main__':
+    # python analyzer.py stems.txt < words.txt
+    with open(sys.argv[1]) as fh:
+        analyzer = Analyzer(line.strip() for line in fh if line.strip())
+    for line in sys.stdin:
+        word = line.strip()
+        print word, '-->', ' '.join(analyzer.analyze(word))
@@ -1,4 +1,17 @@
-import os, sys, re, random, tempfile
+import os, sys, re, random, stat, tempfile
+import codecs, gzip, hashlib, inspect, multiprocessing
+from collections import deque, OrderedDict
+from functools import wraps
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 """
 Finite state transducers.
@@ -168,6 +181,10 @@ class FST(object):
         arc descriptions."""
         #}
 
+        self._label_counters = {}
+        """A dictionary mapping 'state' and 'arc' to the number where
+        L{_pick_label} should start looking for an unused label."""
+
     #////////////////////////////////////////////////////////////
     #{ State Information
     #////////////////////////////////////////////////////////////
@@ -979,12 +996,15 @@ class FST(object):
         if label is not None and label in used_labels:
             raise ValueError("%s with label %r already exists" %
                              (typ, label))
-        # If no label was specified, pick one.
+        # If no label was specified, pick one.  The search resumes
+        # where the previous one stopped, so that adding n states or
+        # arcs takes linear rather than quadratic time.
         if label is not None:
             return label
         else:
-            label = 1
+            label = self._label_counters.get(typ, 1)
             while '%s%d' % (typ[0], label) in used_labels: label += 1
+            self._label_counters[typ] = label + 1
             return '%s%d' % (typ[0], label)
 
 # This function returns fn o ... o f3 o f2 o f1 (input)
@@ -1028,3 +1048,1023 @@ def trace(f, input):
             print info[0], '->', info[1], '(', input, ':', output, ')'
     except:
         return
+
+######################################################################
+#{ Compiled Deterministic Transducers
+######################################################################
+
+class CompiledFST(object):
+    """
+    A dense, table-driven copy of an input-deterministic FST.  Each
+    state is numbered (the initial state is always 0) and each input
+    symbol is given an integer id, so that running the machine is a
+    matter of looking up C{transition[state][symbol]} and
+    C{output[state][symbol]} once per input symbol.
+
+    L{transduce_many} uses NumPy to advance a whole batch of inputs in
+    lockstep: the inputs are packed into an integer matrix (see
+    L{encode}), and each column is pushed through the tables with a
+    single fancy-indexing operation (L{transduce_ids}).  Outputs that
+    are strings are then assembled with array operations too
+    (L{transduce_strings}).
+
+    Two extra symbol ids are reserved: C{pad}, which leaves the state
+    unchanged (used to pad short inputs), and C{unknown}, which sends
+    the machine to the non-final C{dead} state.
+    """
+    def __init__(self, fst):
+        if fst.initial_state is None:
+            raise ValueError("FST has no initial state!")
+
+        # Number the states breadth-first from the initial state.
+        states = [fst.initial_state]
+        state_ids = {fst.initial_state: 0}
+        arcs = []
+        for state in states:
+            seen = set()
+            for arc in fst.outgoing(state):
+                src, dst, in_string, out_string = fst.arc_info(arc)
+                if len(in_string) != 1:
+                    raise ValueError("All arcs must have exactly one "
+                                     "input symbol.")
+                if in_string[0] in seen:
+                    raise ValueError('FST is not input-deterministic!')
+                seen.add(in_string[0])
+                if dst not in state_ids:
+                    state_ids[dst] = len(states)
+                    states.append(dst)
+                arcs.append((state_ids[src], state_ids[dst],
+                             in_string[0], out_string))
+
+        self.label = fst.label
+        """The label of the FST this table was compiled from."""
+
+        self.symbols = sorted(set(sym for (_, _, sym, _) in arcs))
+        """The input symbols, in order of their integer ids."""
+
+        self.symbol_ids = dict((sym, i) for (i, sym)
+                               in enumerate(self.symbols))
+        """A dictionary mapping input symbols to integer ids."""
+
+        self.pad = len(self.symbols)
+        self.unknown = len(self.symbols) + 1
+        self.dead = len(states)
+
+        self.outputs = [()]
+        """The distinct output strings, indexed by output id.  Output
+        id 0 is always the empty string."""
+        output_ids = {(): 0}
+        def output_id(out_string):
+            if out_string not in output_ids:
+                output_ids[out_string] = len(self.outputs)
+                self.outputs.append(out_string)
+            return output_ids[out_string]
+
+        # The pad column loops back to the same state; every other
+        # column defaults to the dead state.
+        n_cols = len(self.symbols) + 2
+        self.transition = [[self.dead] * n_cols
+                           for _ in range(len(states) + 1)]
+        self.output = [[0] * n_cols for _ in range(len(states) + 1)]
+        for (i, row) in enumerate(self.transition):
+            row[self.pad] = i
+        for (src, dst, sym, out_string) in arcs:
+            self.transition[src][self.symbol_ids[sym]] = dst
+            self.output[src][self.symbol_ids[sym]] = output_id(out_string)
+
+        self.final = [fst.is_final(s) for s in states] + [False]
+        self.finalizing = ([output_id(fst.finalizing_string(s))
+                            for s in states] + [0])
+
+        # Inputs whose symbols are all single characters can be encoded
+        # straight from a NumPy string array, through a lookup table
+        # indexed by character code.  Code 0 is NumPy's padding.
+        self._char_table = None
+        if (numpy is not None and self.symbols and
+            all(isinstance(s, basestring) and len(s) == 1 and s != '\0'
+                for s in self.symbols)):
+            table = numpy.empty(max(ord(s) for s in self.symbols) + 1,
+                                dtype=numpy.int32)
+            table.fill(self.unknown)
+            table[0] = self.pad
+            for (i, sym) in enumerate(self.symbols):
+                table[ord(sym)] = i
+            self._char_table = table
+
+        # NumPy copies of the tables, and the output strings spelled
+        # out for each separator, made when first needed.
+        self._arrays = None
+        self._pieces = {}
+
+    def transduce(self, input):
+        """
+        Transduce a single input string, and return the output as a
+        list of output symbols; or C{None} if the input is rejected.
+        """
+        state = 0
+        output = []
+        for in_sym in input:
+            sym = self.symbol_ids.get(in_sym, self.unknown)
+            output.extend(self.outputs[self.output[state][sym]])
+            state = self.transition[state][sym]
+            if state == self.dead:
+                return None
+        if not self.final[state]:
+            return None
+        output.extend(self.outputs[self.finalizing[state]])
+        return output
+
+    def encode(self, inputs):
+        """
+        Pack a sequence of input strings into a NumPy integer matrix
+        with one row per input, padding short rows with C{pad}.
+        C{inputs} may also be a NumPy string array, in which case
+        single-character symbols are encoded without a python loop.
+        """
+        if numpy is None:
+            raise ImportError('CompiledFST.encode requires numpy')
+        if not isinstance(inputs, numpy.ndarray):
+            inputs = list(inputs)
+            if all(isinstance(input, basestring) for input in inputs):
+                inputs = numpy.asarray(inputs)
+        if (self._char_table is not None and
+            isinstance(inputs, numpy.ndarray) and inputs.ndim == 1 and
+            inputs.dtype.kind in 'SU'):
+            array = numpy.ascontiguousarray(inputs)
+            if array.dtype.kind == 'S':
+                codes = array.view(numpy.uint8)
+            else:
+                codes = array.view(numpy.uint32)
+            codes = codes.reshape(len(array), -1)
+            table = self._char_table
+            return numpy.where(codes < len(table),
+                               table[numpy.minimum(codes, len(table)-1)],
+                               self.unknown).astype(numpy.int32)
+
+        rows = [[self.symbol_ids.get(sym, self.unknown) for sym in input]
+                for input in inputs]
+        width = max([len(row) for row in rows] + [0])
+        matrix = numpy.empty((len(rows), width), dtype=numpy.int32)
+        matrix.fill(self.pad)
+        for (i, row) in enumerate(rows):
+            matrix[i, :len(row)] = row
+        return matrix
+
+    def transduce_ids(self, inputs):
+        """
+        Run a batch of inputs through the tables in lockstep, without
+        building any output strings.  Return C{(out_ids, accepted)}:
+        C{out_ids[i, j]} is the output id (an index into C{outputs})
+        written while reading symbol j of input i, and the last column
+        holds the finalizing output; C{accepted[i]} is true if input i
+        was accepted.
+        """
+        ids = self.encode(inputs)
+        if self._arrays is None:
+            # Flat copies of the tables, indexed by
+            # state * n_cols + symbol.
+            self._arrays = (
+                numpy.array(self.transition, dtype=numpy.int32).ravel(),
+                numpy.array(self.output, dtype=numpy.int32).ravel(),
+                numpy.array(self.finalizing, dtype=numpy.int32),
+                numpy.array(self.final, dtype=bool))
+        (transition, output, finalizing, final) = self._arrays
+        n_cols = len(self.symbols) + 2
+
+        # Work on whole columns, stored contiguously.
+        columns = numpy.asfortranarray(ids)
+        state = numpy.zeros(len(ids), dtype=numpy.int32)
+        out_ids = numpy.empty((len(ids), ids.shape[1] + 1),
+                              dtype=numpy.int32, order='F')
+        for j in range(ids.shape[1]):
+            index = state * n_cols + columns[:, j]
+            out_ids[:, j] = output.take(index)
+            state = transition.take(index)
+        out_ids[:, -1] = finalizing.take(state)
+        return (numpy.ascontiguousarray(out_ids), final.take(state))
+
+    def transduce_strings(self, inputs, sep=''):
+        """
+        Transduce a batch of inputs in lockstep, and return
+        C{(outputs, accepted)}: a NumPy string array holding each
+        input's output symbols joined by C{sep} (rejected inputs get
+        an empty string), and a boolean array that is true where the
+        input was accepted.  The output symbols must be strings.
+
+        The strings are assembled with array operations: each output
+        id is spelled out as a row of character codes, the codes of
+        every input are gathered into one stream, and the stream is
+        cut into fixed-width rows, so no python code runs per input.
+        """
+        (out_ids, accepted) = self.transduce_ids(inputs)
+        (codes, lengths, kind) = self._piece_table(sep)
+        n = len(out_ids)
+        out_ids[~accepted] = 0
+
+        # Pieces are padded with code 0, so the characters of an input
+        # are the non-zero codes of its pieces, in order.
+        chars = codes.take(out_ids, axis=0).reshape(n, -1 if n else 0)
+        stream = chars[chars != 0]
+        total = lengths.take(out_ids).sum(axis=1)
+        width = max(int(total.max()) if n else 0, 1)
+        starts = numpy.cumsum(total) - total
+        index = (numpy.arange(len(stream), dtype=numpy.int64) +
+                 numpy.repeat(numpy.arange(n, dtype=numpy.int64) * width -
+                              starts, total))
+        packed = numpy.zeros((n, width), dtype=codes.dtype)
+        packed.ravel()[index] = stream
+        if sep:
+            # Every piece ends with a separator; drop the last one.
+            rows = numpy.nonzero(total)[0]
+            for k in range(1, len(sep) + 1):
+                packed[rows, total[rows] - k] = 0
+        return (packed.view('%s%d' % (kind, width)).reshape(n), accepted)
+
+    def _piece_table(self, sep):
+        # The output strings spelled out with sep after every symbol,
+        # as a matrix of character codes padded with 0.
+        if sep not in self._pieces:
+            pieces = [''.join(sym + sep for sym in out_string)
+                      for out_string in self.outputs]
+            if any(isinstance(piece, unicode) for piece in pieces):
+                (kind, dtype) = ('U', numpy.uint32)
+                pieces = [unicode(piece) for piece in pieces]
+            else:
+                (kind, dtype) = ('S', numpy.uint8)
+            if any('\0' in piece for piece in pieces):
+                raise ValueError('Output symbols must not contain NUL')
+            lengths = numpy.array([len(piece) for piece in pieces],
+                                  dtype=numpy.int32)
+            codes = numpy.zeros((len(pieces), max(lengths.max(), 1)),
+                                dtype=dtype)
+            for (i, piece) in enumerate(pieces):
+                codes[i, :len(piece)] = [ord(c) for c in piece]
+            self._pieces[sep] = (codes, lengths, kind)
+        return self._pieces[sep]
+
+    def transduce_many(self, inputs, sep=None):
+        """
+        Transduce a batch of inputs in lockstep.  Return a list with
+        one entry per input: C{None} if the input was rejected;
+        otherwise its output as a list of symbols or, if C{sep} is
+        given, as a single string with the output symbols joined by
+        C{sep}.  Joined outputs are built by L{transduce_strings};
+        use it (or L{transduce_ids}) directly to keep the results in
+        NumPy arrays.
+        """
+        if sep is not None:
+            (outputs, accepted) = self.transduce_strings(inputs, sep)
+            results = outputs.tolist()
+            for i in numpy.nonzero(~accepted)[0]:
+                results[i] = None
+            return results
+        (out_ids, accepted) = self.transduce_ids(inputs)
+        outputs = self.outputs
+        results = []
+        for (ok, row) in zip(accepted.tolist(), out_ids.tolist()):
+            if ok:
+                results.append([sym for i in row for sym in outputs[i]])
+            else:
+                results.append(None)
+        return results
+
+######################################################################
+#{ Builder Cache
+######################################################################
+
+FST_CACHE_DIR = os.environ.get(
+    'FST_CACHE_DIR',
+    os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                 os.path.join(os.path.expanduser('~'), '.cache'), 'fst'))
+"""The directory where L{cached_fst} stores built machines; by default
+C{~/.cache/fst}.  Set the C{FST_CACHE_DIR} environment variable to an
+empty string to turn the cache off.  The directory is created private
+to its owner, and it is not used at all unless it belongs to the
+current user and no one else can write to it, since loading a pickle
+can run arbitrary code."""
+
+FST_CACHE_VERSION = 1
+"""Bump this to invalidate every cached machine at once."""
+
+_builders = {}
+"""A registry mapping C{module.name} to each builder wrapped by
+L{cached_fst}."""
+
+def cached_fst(builder=None, optimize=None):
+    """
+    Decorator for functions that build an FST.  The first call with a
+    given set of arguments builds the machine, passes it through
+    C{optimize} (if given), and pickles the result into
+    L{FST_CACHE_DIR}.  Later calls -- including calls from other
+    processes -- load the pickle instead of rebuilding.
+
+    The cache key is a hash of the source file of the builder and of
+    every module it imports from its own directory, transitively (see
+    L{_source_files}), together with the builder's name and arguments,
+    so editing a builder -- or any local module whose functions or
+    constants it uses -- invalidates its entries.  The sources are
+    hashed once per process.  The uncached builder is available as
+    the C{uncached} attribute of the wrapper.
+
+    Can be used bare (C{@cached_fst}) or with arguments
+    (C{@cached_fst(optimize=...)}).
+    """
+    def decorate(builder):
+        @wraps(builder)
+        def cached_builder(*args, **kwargs):
+            if not FST_CACHE_DIR or not _cache_dir_is_private():
+                return _build(builder, optimize, args, kwargs)
+            path = os.path.join(FST_CACHE_DIR, '%s-%s.pickle' %
+                                (builder.__name__,
+                                 _cache_key(builder, optimize, args, kwargs)))
+            if _is_own_file(path):
+                try:
+                    with open(path, 'rb') as fh:
+                        return pickle.load(fh)
+                except Exception:
+                    pass
+            fst = _build(builder, optimize, args, kwargs)
+            _cache_store(path, fst)
+            return fst
+        cached_builder.uncached = builder
+        _builders['%s.%s' % (builder.__module__, builder.__name__)] = \
+            cached_builder
+        return cached_builder
+    if builder is None:
+        return decorate
+    return decorate(builder)
+
+def clear_fst_cache():
+    """Delete every machine stored in L{FST_CACHE_DIR}."""
+    if not FST_CACHE_DIR or not os.path.isdir(FST_CACHE_DIR):
+        return
+    for name in os.listdir(FST_CACHE_DIR):
+        if name.endswith('.pickle'):
+            os.unlink(os.path.join(FST_CACHE_DIR, name))
+
+def _build(builder, optimize, args, kwargs):
+    fst = builder(*args, **kwargs)
+    if optimize is not None:
+        fst = optimize(fst)
+    return fst
+
+def _cache_key(builder, optimize, args, kwargs):
+    """
+    Helper for L{cached_fst}: hash everything that can change the
+    machine a builder returns.
+    """
+    roots = [inspect.getsourcefile(builder), __file__,
+             getattr(sys.modules.get('fst'), '__file__', None)]
+    if optimize is not None:
+        roots.append(inspect.getsourcefile(optimize))
+    key = hashlib.sha1()
+    key.update(repr((FST_CACHE_VERSION, sys.version_info[:2],
+                     builder.__name__, args, sorted(kwargs.items()))))
+    if optimize is not None:
+        key.update(optimize.__name__)
+    key.update(_source_digest(roots))
+    return key.hexdigest()
+
+_source_digests = {}
+"""Memo for L{_source_digest}, mapping a tuple of root files to the
+digest of their sources.  Loaded code does not change while a process
+runs, so the sources are only read once per process."""
+
+_local_imports = {}
+"""Memo for L{_source_files}, mapping each source file to the local
+files it imports."""
+
+def _source_digest(roots):
+    """
+    Helper for L{_cache_key}: return a digest of the source files
+    L{_source_files} finds from C{roots} (file names, or None).
+    """
+    roots = tuple(_source_path(path) for path in roots if path)
+    if roots not in _source_digests:
+        digest = hashlib.sha1()
+        for path in _source_files(roots):
+            try:
+                digest.update(open(path).read())
+            except IOError:
+                pass
+        _source_digests[roots] = digest.hexdigest()
+    return _source_digests[roots]
+
+def _source_path(path):
+    # The .py file of a compiled module.
+    path = os.path.abspath(path)
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return path
+
+def _source_files(roots):
+    """
+    Helper for L{_cache_key}: return the files C{roots}, and the
+    source files of every module they import (at the top level or
+    inside functions) that lives in the same directory as the
+    importer, and so on transitively.  Imports are read from the
+    source rather than from the loaded modules, so constants imported
+    with C{from ... import} are followed too.  The imports of each
+    file are only looked up once per process.
+    """
+    paths = list(roots)
+    seen = set()
+    while paths:
+        path = paths.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        if path not in _local_imports:
+            _local_imports[path] = _find_local_imports(path)
+        paths.extend(_local_imports[path])
+    return sorted(seen)
+
+_IMPORT_RE = re.compile(r'^[ \t]*(?:from[ \t]+(\w+)[\w.]*[ \t]+import\b|'
+                        r'import[ \t]+([\w., \t]+))', re.M)
+
+def _find_local_imports(path):
+    # The files in the directory of path that path imports.  The
+    # import statements are found with a regular expression, which is
+    # much faster than parsing; a match inside a string only costs an
+    # extra file in the key.
+    try:
+        source = open(path).read()
+    except IOError:
+        return []
+    directory = os.path.dirname(path)
+    imported = []
+    for (module, modules) in _IMPORT_RE.findall(source):
+        names = [module] if module else [name.split()[0] for name
+                                         in modules.split(',') if name.strip()]
+        for name in names:
+            name = os.path.join(directory, name.split('.')[0] + '.py')
+            if os.path.isfile(name):
+                imported.append(name)
+    return imported
+
+def _cache_dir_is_private():
+    """
+    Helper for L{cached_fst}: create L{FST_CACHE_DIR} (readable by its
+    owner only) if it does not exist, and return true if it belongs to
+    the current user and is not writable by anyone else.
+    """
+    try:
+        if not os.path.isdir(FST_CACHE_DIR):
+            os.makedirs(FST_CACHE_DIR, 0o700)
+        st = os.lstat(FST_CACHE_DIR)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(st.st_mode) or st.st_mode & 0o022:
+        return False
+    return not hasattr(os, 'getuid') or st.st_uid == os.getuid()
+
+def _is_own_file(path):
+    """
+    Helper for L{cached_fst}: return true if C{path} is a regular file
+    (not a link) that belongs to the current user.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (stat.S_ISREG(st.st_mode) and
+            (not hasattr(os, 'getuid') or st.st_uid == os.getuid()))
+
+def _cache_store(path, fst):
+    """
+    Helper for L{cached_fst}: pickle C{fst} to C{path}.  The pickle is
+    written to a temporary file first and then renamed, so concurrent
+    processes never load a half-written file.  The cache is only an
+    optimization, so failing to write it is not an error.
+    """
+    try:
+        fd, tmp = tempfile.mkstemp(dir=FST_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            pickle.dump(fst, fh, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        pass
+
+######################################################################
+#{ Composition and Minimization
+######################################################################
+
+def compose(*fsts):
+    """
+    Return a single FST equivalent to running C{fsts} one after the
+    other, with the output of each feeding the input of the next
+    (the same order as L{composechars}).  The result may contain
+    epsilon-input arcs; see L{cascade} for a deterministic version.
+    """
+    graph = _split_arcs(fsts[0])
+    for fst in fsts[1:]:
+        graph = _compose_graphs(graph, _split_arcs(fst))
+    return _graph_to_fst(graph, 'compose(%s)' %
+                         ', '.join(str(fst.label) for fst in fsts))
+
+def invert(fst):
+    """
+    Return the inverse of C{fst}, which reads what C{fst} writes and
+    writes what it reads.  Unlike L{FST.inverted}, finalizing strings
+    are kept: each one becomes the input of an arc from its state to
+    a new final state.  The result is usually nondeterministic; see
+    L{cascade} to determinize it.
+    """
+    initial, finals, arcs = _fst_to_graph(fst)
+    end = ('end',)
+    new_finals = {end: ()}
+    new_arcs = {end: []}
+    for (state, state_arcs) in arcs.items():
+        new_arcs[state] = [(out_string, in_string, dst)
+                           for (in_string, out_string, dst) in state_arcs]
+        if state in finals:
+            if finals[state]:
+                new_arcs[state].append((finals[state], (), end))
+            else:
+                new_finals[state] = ()
+    return _graph_to_fst((initial, new_finals, new_arcs),
+                         '%s (inverted)' % fst.label, relabel=True)
+
+def remove_epsilons(fst):
+    """
+    Return an equivalent FST with no epsilon-input arcs.  Each
+    epsilon path is folded into the arcs that follow it, or into the
+    finalizing string if it ends in a final state.
+
+    @raise ValueError: If two epsilon paths from the same state
+        produce different outputs that cannot be told apart, i.e. the
+        transduction is not functional.
+    """
+    arcs = {}
+    finals = {}
+    queue = [fst.initial_state]
+    seen = set(queue)
+    while queue:
+        state = queue.pop()
+        arcs[state] = []
+        for (src, w) in _epsilon_closure(fst, state):
+            if fst.is_final(src):
+                fin = w + fst.finalizing_string(src)
+                if finals.setdefault(state, fin) != fin:
+                    raise ValueError('Epsilon removal failed: conflicting '
+                                     'finalizing strings')
+            for arc in fst.outgoing(src):
+                _, dst, in_string, out_string = fst.arc_info(arc)
+                if in_string:
+                    arcs[state].append((in_string, w + out_string, dst))
+                    if dst not in seen:
+                        seen.add(dst)
+                        queue.append(dst)
+    return _graph_to_fst((fst.initial_state, finals, arcs),
+                         '%s (epsilon-free)' % fst.label)
+
+def minimize(fst):
+    """
+    Return the minimal FST equivalent to the given input-deterministic
+    FST (e.g. the result of L{FST.determinized}).  Outputs are first
+    pushed as close to the initial state as possible, and states with
+    the same finalizing string and the same outgoing arcs are then
+    merged by partition refinement.  States are labelled with integers
+    in breadth-first order from the initial state, which is 0.
+    """
+    graph = _trim(_fst_to_graph(fst))
+    initial, finals, arcs = graph
+    for state in arcs:
+        if len(set(in_string for (in_string, _, _) in arcs[state])) < \
+               len(arcs[state]):
+            raise ValueError('FST is not input-deterministic!')
+
+    # Push outputs: prefix[q] is the longest common prefix of every
+    # output that can be produced from q to the end of the input.
+    # Iterate to a fixed point, since the machine may have cycles.
+    prefix = dict((state, None) for state in arcs)
+    changed = True
+    while changed:
+        changed = False
+        for state in arcs:
+            candidates = [out_string + prefix[dst]
+                          for (_, out_string, dst) in arcs[state]
+                          if prefix[dst] is not None]
+            if state in finals:
+                candidates.append(finals[state])
+            if candidates:
+                new = _common_prefix(candidates)
+                if new != prefix[state]:
+                    prefix[state] = new
+                    changed = True
+    # (there is no way to emit output before the first input symbol)
+    prefix[initial] = ()
+    for state in arcs:
+        n = len(prefix[state])
+        arcs[state] = [(in_string, (out_string + prefix[dst])[n:], dst)
+                       for (in_string, out_string, dst) in arcs[state]]
+        if state in finals:
+            finals[state] = finals[state][n:]
+
+    # Partition refinement: start from (is_final, finalizing string),
+    # and split blocks until every state in a block has the same
+    # arcs into the same blocks.
+    block = _number([(state in finals, finals.get(state))
+                     for state in arcs], arcs)
+    while True:
+        new_block = _number([(block[state], tuple(sorted(
+                                 (in_string, out_string, block[dst])
+                                 for (in_string, out_string, dst)
+                                 in arcs[state])))
+                             for state in arcs], arcs)
+        if len(set(new_block.values())) == len(set(block.values())):
+            break
+        block = new_block
+
+    merged_finals = dict((block[state], fin)
+                         for (state, fin) in finals.items())
+    merged_arcs = dict((block[state], [(in_string, out_string, block[dst])
+                                       for (in_string, out_string, dst)
+                                       in arcs[state]])
+                       for state in arcs)
+    return _graph_to_fst((block[initial], merged_finals, merged_arcs),
+                         '%s (minimized)' % fst.label, relabel=True)
+
+def cascade(*fsts):
+    """
+    Compile a cascade of transducers (run in the order given, as in
+    L{composechars}) into one deterministic, minimized FST.  The
+    cascade must define a subsequential function, or determinization
+    will fail with a C{ValueError}.  The machines are added one at a
+    time, minimizing after each step, so that the intermediate
+    products stay small; two machines that are both deterministic are
+    composed directly, without epsilon removal or determinization.
+    """
+    machine = None
+    for fst in fsts:
+        if machine is None:
+            if _is_sequential(fst):
+                composed = fst
+            else:
+                composed = remove_epsilons(compose(fst)).determinized()
+        elif _is_sequential(machine) and _is_sequential(fst):
+            composed = _graph_to_fst(_compose_sequential(
+                _fst_to_graph(machine), _fst_to_graph(fst)),
+                'compose(%s, %s)' % (machine.label, fst.label))
+        else:
+            composed = remove_epsilons(compose(machine, fst)).determinized()
+        machine = minimize(composed)
+    return machine
+
+#////////////////////////////////////////////////////////////
+# Helpers.  Machines are handled here as "graphs", i.e. tuples
+# (initial, finals, arcs), where finals maps each final state to its
+# finalizing string and arcs maps every state to a list of
+# (in_string, out_string, dst) tuples.
+#////////////////////////////////////////////////////////////
+
+def _fst_to_graph(fst):
+    finals = dict((state, fst.finalizing_string(state))
+                  for state in fst.states() if fst.is_final(state))
+    arcs = dict((state, [(fst.in_string(arc), fst.out_string(arc),
+                          fst.dst(arc)) for arc in fst.outgoing(state)])
+                for state in fst.states())
+    return (fst.initial_state, finals, arcs)
+
+def _graph_to_fst(graph, label, relabel=False):
+    """
+    Build an FST from the states of C{graph} that lie on a path from
+    the initial state to a final state.  If C{relabel} is true, states
+    are renumbered breadth-first from the initial state.
+    """
+    initial, finals, arcs = _trim(graph)
+    order = [initial]
+    ids = {initial: 0}
+    for state in order:
+        for (_, _, dst) in arcs[state]:
+            if dst not in ids:
+                ids[dst] = len(order)
+                order.append(dst)
+    if not relabel:
+        ids = dict((state, state) for state in order)
+
+    fst = FST(label)
+    for state in order:
+        fst.add_state(ids[state], is_final=state in finals,
+                      finalizing_string=finals.get(state, ()))
+    fst.initial_state = ids[initial]
+    n_arcs = 0
+    for state in order:
+        for (in_string, out_string, dst) in arcs[state]:
+            fst.add_arc(ids[state], ids[dst], in_string, out_string,
+                        label=n_arcs)
+            n_arcs += 1
+    return fst
+
+def _trim(graph):
+    """
+    Return a copy of C{graph} restricted to the states that are
+    reachable from the initial state and can reach a final state.
+    If no such path exists, a single non-final initial state is kept.
+    """
+    initial, finals, arcs = graph
+    reachable = set([initial])
+    queue = [initial]
+    while queue:
+        for (_, _, dst) in arcs.get(queue.pop(), ()):
+            if dst not in reachable:
+                reachable.add(dst)
+                queue.append(dst)
+    incoming = dict((state, []) for state in reachable)
+    for state in reachable:
+        for (_, _, dst) in arcs[state]:
+            incoming[dst].append(state)
+    useful = set(state for state in reachable if state in finals)
+    queue = list(useful)
+    while queue:
+        for src in incoming[queue.pop()]:
+            if src not in useful:
+                useful.add(src)
+                queue.append(src)
+    useful.add(initial)
+    return (initial,
+            dict((s, fin) for (s, fin) in finals.items() if s in useful),
+            dict((s, [a for a in arcs.get(s, ()) if a[2] in useful])
+                 for s in useful))
+
+def _split_arcs(fst):
+    """
+    Return C{fst} as a graph in which every arc has at most one input
+    and at most one output symbol, and every finalizing string has
+    been turned into a chain of epsilon-input arcs leading to a new
+    final state.  States are numbered from 0 (the initial state).
+    """
+    ids = {}
+    def state_id(state):
+        if state not in ids:
+            ids[state] = len(ids)
+        return ids[state]
+    arcs = {}
+    finals = {}
+    def add_chain(src, dst, in_string, out_string):
+        steps = max(len(in_string), len(out_string), 1)
+        for i in range(steps):
+            if i == steps - 1:
+                next = dst
+            else:
+                next = ('split', len(arcs))
+                arcs[next] = []
+            arcs[src].append((in_string[i:i+1], out_string[i:i+1], next))
+            src = next
+
+    final_state = ('final',)
+    arcs[final_state] = []
+    finals[final_state] = ()
+    for state in fst.states():
+        arcs.setdefault(state, [])
+    for state in fst.states():
+        for arc in fst.outgoing(state):
+            _, dst, in_string, out_string = fst.arc_info(arc)
+            add_chain(state, dst, in_string, out_string)
+        if fst.is_final(state):
+            if fst.finalizing_string(state):
+                add_chain(state, final_state, (),
+                          fst.finalizing_string(state))
+            else:
+                finals[state] = ()
+
+    state_id(fst.initial_state)
+    return (0, dict((state_id(s), fin) for (s, fin) in finals.items()),
+            dict((state_id(s), [(i, o, state_id(d)) for (i, o, d) in a])
+                 for (s, a) in arcs.items()))
+
+def _compose_graphs(a, b):
+    """
+    Compose two graphs whose arcs carry at most one input and one
+    output symbol.  States of the result are pairs of states.
+    """
+    a_initial, a_finals, a_arcs = a
+    b_initial, b_finals, b_arcs = b
+    # Index the arcs of b by input symbol.
+    b_index = {}
+    for (state, state_arcs) in b_arcs.items():
+        table = b_index[state] = {}
+        for (in_string, out_string, dst) in state_arcs:
+            table.setdefault(in_string, []).append((out_string, dst))
+
+    initial = (a_initial, b_initial)
+    finals = {}
+    arcs = {}
+    queue = [initial]
+    while queue:
+        state = queue.pop()
+        p, q = state
+        new_arcs = arcs[state] = []
+        if p in a_finals and q in b_finals:
+            finals[state] = ()
+        for (in_string, mid, p2) in a_arcs[p]:
+            if not mid:
+                new_arcs.append((in_string, (), (p2, q)))
+            else:
+                for (out_string, q2) in b_index[q].get(mid, ()):
+                    new_arcs.append((in_string, out_string, (p2, q2)))
+        for (out_string, q2) in b_index[q].get((), ()):
+            new_arcs.append(((), out_string, (p, q2)))
+        for (_, _, dst) in new_arcs:
+            if dst not in arcs:
+                arcs[dst] = None
+                queue.append(dst)
+    return (initial, finals, arcs)
+
+def _is_sequential(fst):
+    """Return true if every arc of C{fst} reads exactly one symbol, and
+    no two arcs leaving the same state read the same symbol."""
+    for state in fst.states():
+        symbols = [fst.in_string(arc) for arc in fst.outgoing(state)]
+        if len(set(symbols)) < len(symbols) or \
+               any(len(sym) != 1 for sym in symbols):
+            return False
+    return True
+
+def _compose_sequential(a, b):
+    """
+    Compose two graphs of sequential machines (see L{_is_sequential}).
+    Each output string of C{a} is run through C{b} right away, so the
+    result is sequential too.  States of the result are pairs of
+    states.
+    """
+    a_initial, a_finals, a_arcs = a
+    b_initial, b_finals, b_arcs = b
+    b_next = dict((state, dict((in_string[0], (out_string, dst))
+                               for (in_string, out_string, dst)
+                               in state_arcs))
+                  for (state, state_arcs) in b_arcs.items())
+    def run(q, symbols):
+        output = ()
+        for sym in symbols:
+            step = b_next[q].get(sym)
+            if step is None:
+                return None
+            output += step[0]
+            q = step[1]
+        return (output, q)
+
+    initial = (a_initial, b_initial)
+    finals = {}
+    arcs = {}
+    queue = [initial]
+    while queue:
+        state = queue.pop()
+        p, q = state
+        new_arcs = arcs[state] = []
+        if p in a_finals:
+            end = run(q, a_finals[p])
+            if end is not None and end[1] in b_finals:
+                finals[state] = end[0] + b_finals[end[1]]
+        for (in_string, mid, p2) in a_arcs[p]:
+            step = run(q, mid)
+            if step is not None:
+                new_arcs.append((in_string, step[0], (p2, step[1])))
+        for (_, _, dst) in new_arcs:
+            if dst not in arcs:
+                arcs[dst] = None
+                queue.append(dst)
+    return (initial, finals, arcs)
+
+def _epsilon_closure(fst, state):
+    """
+    Return a list of C{(state, output)} pairs for every state that can
+    be reached from C{state} through epsilon-input arcs (including
+    C{state} itself, with an empty output).
+    """
+    outputs = {state: ()}
+    stack = [state]
+    while stack:
+        src = stack.pop()
+        for arc in fst.outgoing(src):
+            _, dst, in_string, out_string = fst.arc_info(arc)
+            if in_string:
+                continue
+            w = outputs[src] + out_string
+            if dst not in outputs:
+                outputs[dst] = w
+                stack.append(dst)
+            elif outputs[dst] != w:
+                raise ValueError('Epsilon removal failed: state %r is '
+                                 'reached with different outputs' % (dst,))
+    return outputs.items()
+
+def _common_prefix(sequences):
+    """Return the longest tuple that is a prefix of all of the given
+    tuples."""
+    prefix = sequences[0]
+    for seq in sequences[1:]:
+        n = 0
+        while n < len(prefix) and n < len(seq) and prefix[n] == seq[n]:
+            n += 1
+        prefix = prefix[:n]
+    return prefix
+
+def _number(keys, states):
+    """Helper for L{minimize}: map each state to a small integer that
+    identifies its key."""
+    ids = {}
+    return dict((state, ids.setdefault(key, len(ids)))
+                for (state, key) in zip(states, keys))
+
+######################################################################
+#{ File and Process Helpers
+######################################################################
+
+reader = codecs.getreader('utf8')
+writer = codecs.getwriter('utf8')
+
+def prepfile(fh, code):
+    """
+    Open C{fh} (a file name or an open file) for reading or writing
+    utf8 text, depending on C{code} ('r' or 'w').  Files whose names
+    end in .gz are (de)compressed on the fly.
+    """
+    if type(fh) is str:
+        name = fh
+    else:
+        name = fh.name
+    if name.endswith(".gz"):
+        # gzip opens the file by name; the handle is not needed.
+        if fh is not name:
+            fh.close()
+        ret = gzip.open(name, code if code.endswith("t") else code+"t")
+    elif fh is name:
+        ret = open(name, code)
+    else:
+        ret = fh
+    if sys.version_info[0] == 2:
+        if code.startswith('r'):
+            ret = reader(ret)
+        elif code.startswith('w'):
+            ret = writer(ret)
+        else:
+            sys.stderr.write("I didn't understand code "+code+"\n")
+            sys.exit(1)
+    return ret
+
+def ordered_map(func, items, workers=1, max_pending=None):
+    """
+    Generate C{func(item)} for each item, in order.  With more than
+    one worker, the calls run in a pool of C{workers} processes; at
+    most C{max_pending} items (default: twice the number of workers)
+    are in flight at once, so that C{items} may be an unbounded
+    stream.  C{func} must be picklable, i.e. a module-level function
+    or a C{functools.partial} of one.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    if max_pending is None:
+        max_pending = 2 * workers
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = deque()
+        for item in items:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+class LRUCache(object):
+    """
+    A dictionary holding at most C{maxsize} items; when it is full,
+    adding an item evicts the least recently used one.  C{hits} and
+    C{misses} count the lookups made with L{get}.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -197,6 +197,10 @@ class FST(object):
         arc descriptions."""
         #}
 
+        self._label_counters = {}
+        """A dictionary mapping 'state' and 'arc' to the number where
+        L{_pick_label} should start looking for an unused label."""
+
     #////////////////////////////////////////////////////////////
     #{ State Information
     #////////////////////////////////////////////////////////////
@@ -1008,12 +1012,15 @@ class FST(object):
         if label is not None and label in used_labels:
             raise ValueError("%s with label %r already exists" %
                              (typ, label))
-        # If no label was specified, pick one.
+        # If no label was specified, pick one.  The search resumes
+        # where the previous one stopped, so that adding n states or
+        # arcs takes linear rather than quadratic time.
         if label is not None:
             return label
         else:
-            label = 1
+            label = self._label_counters.get(typ, 1)
             while '%s%d' % (typ[0], label) in used_labels: label += 1
+            self._label_counters[typ] = label + 1
             return '%s%d' % (typ[0], label)
 
 ######################################################################
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+A stem lexicon stored as a minimal acyclic automaton (a DAWG).
+
+Stems are added in sorted order with Daciuk's incremental algorithm:
+each new stem only adds states after the prefix it shares with the
+previous one, and the states of the previous stem beyond that prefix
+are then final, so they are merged into an equivalent registered
+state if there is one.  The automaton stays minimal as it grows, and
+stems share both their beginnings and their endings.
+
+Lexicon.paradigms generates the inflections of every stem in one
+depth-first walk of the automaton.  morphology_fst() (see rewrite.py)
+is run along the walk, so each prefix shared by several stems is
+transduced once, and the end of each word -- the boundary, the affix
+and the finalizing string -- depends only on the state the machine is
+in after the stem, so it is worked out once per state and affix.
+
+    python lexicon.py --infile stems.txt --outfile paradigms.tsv.gz
+"""
+import argparse
+import sys
+
+from fst import FST
+from fsmutils import prepfile, CompiledFST
+from morphology import generate
+from rewrite import morphology_fst
+
+kAFFIXES = ['ed', 'ing', 's', 'r']
+
+class Lexicon(object):
+    """
+    A set of stems, stored in a minimal acyclic automaton.  State 0 is
+    the initial state; C{arcs[state]} maps each character to the next
+    state, and C{final[state]} is true where a stem ends.
+
+    If stems are given they are sorted and added at once; otherwise
+    they can be added one at a time with L{add}, followed by a call to
+    L{finish}.
+    """
+    def __init__(self, stems=None):
+        self.arcs = [{}]
+        self.final = [False]
+        self._register = {}
+        self._unchecked = []
+        self._previous = None
+        self._finished = False
+        self._size = 0
+        if stems is not None:
+            for stem in sorted(set(stems)):
+                self.add(stem)
+            self.finish()
+
+    def _new_state(self):
+        self.arcs.append({})
+        self.final.append(False)
+        return len(self.arcs) - 1
+
+    def _replace_or_register(self, depth):
+        # Merge the unchecked states deeper than depth, deepest first.
+        while len(self._unchecked) > depth:
+            (parent, char, child) = self._unchecked.pop()
+            key = (self.final[child],
+                   tuple(sorted(self.arcs[child].items())))
+            if key in self._register:
+                self.arcs[parent][char] = self._register[key]
+            else:
+                self._register[key] = child
+
+    def add(self, stem):
+        """
+        Adds stem to the lexicon.  Stems must be added in sorted order.
+
+        @raise ValueError: if stem sorts before the last stem added,
+            or the lexicon is finished.
+        """
+        if self._finished:
+            raise ValueError('The lexicon is finished')
+        if not stem:
+            raise ValueError('Stems must not be empty')
+        previous = self._previous
+        if previous is not None and stem <= previous:
+            if stem == previous:
+                return
+            raise ValueError('Stems must be added in sorted order: '
+                             '%r after %r' % (stem, previous))
+        common = 0
+        if previous is not None:
+            while (common < len(stem) and common < len(previous) and
+                   stem[common] == previous[common]):
+                common += 1
+        self._replace_or_register(common)
+        state = self._unchecked[-1][2] if self._unchecked else 0
+        for char in stem[common:]:
+            child = self._new_state()
+            self.arcs[state][char] = child
+            self._unchecked.append((state, char, child))
+            state = child
+        self.final[state] = True
+        self._previous = stem
+        self._size += 1
+
+    def finish(self):
+        """
+        Minimizes the states of the last stem added, and renumbers the
+        states so that those merged away are dropped.  No stems can be
+        added afterwards.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        self._replace_or_register(0)
+        ids = {0: 0}
+        order = [0]
+        for state in order:
+            for child in self.arcs[state].values():
+                if child not in ids:
+                    ids[child] = len(order)
+                    order.append(child)
+        self.arcs = [dict((char, ids[child])
+                          for (char, child) in self.arcs[state].items())
+                     for state in order]
+        self.final = [self.final[state] for state in order]
+        self._register = {}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, stem):
+        state = 0
+        for char in stem:
+            state = self.arcs[state].get(char)
+            if state is None:
+                return False
+        return self.final[state]
+
+    def __iter__(self):
+        """Generates the stems in sorted order."""
+        stack = [(0, '')]
+        while stack:
+            (state, prefix) = stack.pop()
+            if self.final[state]:
+                yield prefix
+            for (char, child) in sorted(self.arcs[state].items(),
+                                        reverse=True):
+                stack.append((child, prefix + char))
+
+    def to_fst(self, affixes=None, label='lexicon'):
+        """
+        Returns the lexicon as a deterministic acceptor (an FST that
+        writes what it reads).  If affixes are given, each stem may also
+        be followed by '+' and one of them (the empty affix leaves the
+        stem followed by '+' alone).
+        """
+        f = FST(label)
+        for state in range(len(self.arcs)):
+            f.add_state(state, is_final=self.final[state])
+        f.initial_state = 0
+        for state in range(len(self.arcs)):
+            for (char, child) in self.arcs[state].items():
+                f.add_arc(state, child, (char,), (char,))
+        if affixes:
+            suffixes = Lexicon(affix for affix in affixes if affix)
+            suffixes.final[0] = '' in affixes
+            offset = len(self.arcs)
+            for state in range(len(suffixes.arcs)):
+                f.add_state(offset + state, is_final=suffixes.final[state])
+            for state in range(len(suffixes.arcs)):
+                for (char, child) in suffixes.arcs[state].items():
+                    f.add_arc(offset + state, offset + child,
+                              (char,), (char,))
+            for state in range(len(self.arcs)):
+                if self.final[state]:
+                    f.add_arc(state, offset, ('+',), ('+',))
+        return f
+
+    def paradigms(self, affixes=kAFFIXES):
+        """
+        Generates (stem, words) for every stem, in sorted order, where
+        words lists the word generated from stem+affix for each of
+        affixes.  Stems with characters the rules do not cover are
+        passed to morphology.generate instead.
+        """
+        table = _table()
+        def run(q, chars):
+            # Returns the state after reading chars from state q, and
+            # what the machine writes on the way.
+            out = []
+            for char in chars:
+                sym = table.symbol_ids.get(char, table.unknown)
+                out.extend(table.outputs[table.output[q][sym]])
+                q = table.transition[q][sym]
+            return (q, ''.join(out))
+        steps = {}
+        ends = {}
+        def end(q):
+            # The rest of each word after the stem, or None where the
+            # machine rejects it.
+            if q not in ends:
+                ends[q] = []
+                for affix in affixes:
+                    (p, out) = run(q, '+' + affix)
+                    ends[q].append(out + ''.join(
+                        table.outputs[table.finalizing[p]])
+                                   if table.final[p] else None)
+            return ends[q]
+        edges = [sorted(arcs.items(), reverse=True) for arcs in self.arcs]
+
+        # Each entry is (lexicon state, machine state, stem, output).
+        stack = [(0, 0, '', '')]
+        while stack:
+            (state, q, stem, out) = stack.pop()
+            if self.final[state]:
+                words = []
+                for (affix, rest) in zip(affixes, end(q)):
+                    if rest is None:
+                        words.append(generate(stem + '+' + affix))
+                    else:
+                        words.append(out + rest)
+                yield (stem, words)
+            for (char, child) in edges[state]:
+                step = steps.get((q, char))
+                if step is None:
+                    step = steps[(q, char)] = run(q, char)
+                stack.append((child, step[0], stem + char, out + step[1]))
+
+    def write_paradigms(self, fh, affixes=kAFFIXES):
+        """
+        Writes the paradigm of every stem to fh, one line per stem: the
+        stem and its words, separated by tabs.  Returns the number of
+        stems written.
+        """
+        n = 0
+        for (stem, words) in self.paradigms(affixes):
+            fh.write('\t'.join([stem] + words) + '\n')
+            n += 1
+        return n
+
+_morphology_table = None
+
+def _table():
+    global _morphology_table
+    if _morphology_table is None:
+        _morphology_table = CompiledFST(morphology_fst())
+    return _morphology_table
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate the inflections of every stem in a lexicon.")
+    parser.add_argument("--infile", "-i",
+                        type=argparse.FileType('r'), default=sys.stdin,
+                        help="stems, one per line (may be .gz)")
+    parser.add_argument("--outfile", "-o",
+                        type=argparse.FileType('w'), default=sys.stdout,
+                        help="paradigms, one stem per line (may be .gz)")
+    parser.add_argument("--affixes", "-a", nargs='+', default=kAFFIXES,
+                        help="affixes to generate (default: %(default)s)")
+    args = parser.parse_args()
+
+    infile = prepfile(args.infile, 'r')
+    lexicon = Lexicon(line.strip() for line in infile if line.strip())
+    outfile = prepfile(args.outfile, 'w')
+    n = lexicon.write_paradigms(outfile, args.affixes)
+    outfile.close()
+    sys.stderr.write("%d stems, %d states\n" % (n, len(lexicon.arcs)))
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
+import argparse
 import re
+import sys
+import time
+
+from fsmutils import prepfile, LRUCache
 
 def iterateRules():
     # the first rule looks for STUFF followed by "e+e" or "e+i"
@@ -23,19 +28,184 @@ def iterateRules():
     #   http://docs.python.org/library/re.html
     yield ("(.*)([aeiouAEIOU]+)c\+([ed|ing].*)", "\\1\\2ck\\3")
 
+# For the rules of iterateRules(), keyed by their left-hand side, a
+# pattern that is found around the boundary whenever the rule can
+# match: it is searched for in the two characters before a '+', the
+# '+' and the character after it.  A rule that is not listed here is
+# tried on every word.
+kRULE_TRIGGERS = {"(.*)e\+([ei].*)": "e\+[ei]",
+                  "(.+)e\+([^ei].*)": ".e\+[^ei]",
+                  "(.*)([aeiouAEIOU]+)c\+([ed|ing].*)":
+                      "[aeiouAEIOU]c\+[ed|ing]"}
+
+class MorphologyGenerator(object):
+    """
+    Applies the rules of iterateRules() to analyses such as "ice+ing".
+    The rules are compiled once, when the generator is created, instead
+    of on every call.
+
+    Each rule can have a trigger (by default, from kRULE_TRIGGERS), and
+    is only tried on words where its trigger is found around one of the
+    boundaries.  The rules are still applied in order, to the whole
+    word, so the result is the same as trying every rule.  Which rules
+    the context of a boundary triggers is worked out once per context.
+    """
+    def __init__(self, rules=None, triggers=None):
+        if rules is None:
+            rules = iterateRules()
+        rules = list(rules)
+        self.rules = [(re.compile("^" + ruleLHS + "$"), ruleRHS)
+                      for (ruleLHS, ruleRHS) in rules]
+        if triggers is None:
+            triggers = [kRULE_TRIGGERS.get(ruleLHS) for (ruleLHS, _) in rules]
+        self.triggers = [re.compile(t) if t is not None else None
+                         for t in triggers]
+        self._always = frozenset(i for (i, t) in enumerate(self.triggers)
+                                 if t is None)
+        self._index = {}
+
+    def _candidates(self, word):
+        # The rules triggered by the context of any boundary in word.
+        candidates = self._always
+        i = word.find("+")
+        while i != -1:
+            context = word[max(0, i - 2):i + 2]
+            rules = self._index.get(context)
+            if rules is None:
+                rules = self._index[context] = frozenset(
+                    j for (j, t) in enumerate(self.triggers)
+                    if t is None or t.search(context))
+            candidates = candidates | rules
+            i = word.find("+", i + 1)
+        return candidates
+
+    def trace(self, analysis):
+        """Returns (word, fired): the word for analysis, and a tuple of
+        the indices of the rules that changed it."""
+        word = analysis
+        fired = ()
+        candidates = self._candidates(word)
+        # apply the triggered rules in sequence
+        for (i, (pattern, ruleRHS)) in enumerate(self.rules):
+            if i in candidates:
+                new_word = pattern.sub(ruleRHS, word)
+                if new_word != word:
+                    word = new_word
+                    fired += (i,)
+                    candidates = self._candidates(word)
+
+        # remove any remaining boundaries
+        return (word.replace("+", ""), fired)
+
+    def generate(self, analysis):
+        return self.trace(analysis)[0]
+
+    def generate_many(self, analyses):
+        """Generate the word for each of analyses, returning a list."""
+        return [self.generate(analysis) for analysis in analyses]
+
+class CachedGenerator(object):
+    """
+    A memoizing front end for a MorphologyGenerator.  Words are kept in
+    an LRU cache of at most maxsize analyses, together with the rules
+    that fired for them, and every call is counted and timed:
+    rule_hits[i] is the number of calls for which rule i fired, and
+    unchanged the number for which none did.
+    """
+    def __init__(self, generator=None, maxsize=100000):
+        if generator is None:
+            generator = MorphologyGenerator()
+        self.generator = generator
+        self.cache = LRUCache(maxsize)
+        self.calls = 0
+        self.seconds = 0.0
+        self.rule_hits = [0] * len(generator.rules)
+        self.unchanged = 0
+
+    def trace(self, analysis):
+        """Returns (word, fired), as MorphologyGenerator.trace does."""
+        start = time.time()
+        result = self.cache.get(analysis)
+        if result is None:
+            result = self.generator.trace(analysis)
+            self.cache.put(analysis, result)
+        for i in result[1]:
+            self.rule_hits[i] += 1
+        if not result[1]:
+            self.unchanged += 1
+        self.calls += 1
+        self.seconds += time.time() - start
+        return result
+
+    def generate(self, analysis):
+        return self.trace(analysis)[0]
+
+    def generate_many(self, analyses):
+        """Generate the word for each of analyses, returning a list."""
+        return [self.trace(analysis)[0] for analysis in analyses]
+
+    def hit_rate(self):
+        return self.cache.hit_rate()
+
+    def time_per_call(self):
+        """The mean time of a call, in seconds."""
+        return self.seconds / self.calls if self.calls else 0.0
+
+    def stats(self):
+        """Returns the counters as a dictionary."""
+        return {'calls': self.calls,
+                'hit_rate': self.hit_rate(),
+                'seconds_per_call': self.time_per_call(),
+                'rules': [(pattern.pattern, hits) for ((pattern, _), hits)
+                          in zip(self.generator.rules, self.rule_hits)],
+                'unchanged': self.unchanged}
+
+_generator = None
+
+def _shared_generator():
+    global _generator
+    if _generator is None:
+        _generator = CachedGenerator()
+    return _generator
+
 def generate(analysis):
-    word = analysis
-    # apply all rules in sequence
-    for (ruleLHS, ruleRHS) in iterateRules():
-        word = re.sub("^" + ruleLHS + "$", ruleRHS, word)
+    return _shared_generator().generate(analysis)
+
+def generate_many(analyses):
+    return _shared_generator().generate_many(analyses)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate the word for each analysis read, one per "
+                    "line.")
+    parser.add_argument("--infile", "-i",
+                        type=argparse.FileType('r'), default=sys.stdin,
+                        help="analyses, one per line (may be .gz)")
+    parser.add_argument("--outfile", "-o",
+                        type=argparse.FileType('w'), default=sys.stdout,
+                        help="output file (may be .gz); each analysis is "
+                             "written with its word, separated by a tab")
+    parser.add_argument("--cache-size", dest="cache_size", type=int,
+                        default=100000, help="analyses remembered")
+    args = parser.parse_args()
+
+    generator = CachedGenerator(maxsize=args.cache_size)
+    infile = prepfile(args.infile, 'r')
+    outfile = prepfile(args.outfile, 'w')
+    for line in infile:
+        analysis = line.strip()
+        outfile.write(analysis + u'\t' + generator.generate(analysis) +
+                      u'\n')
+    outfile.close()
 
-    # remove any remaining boundaires.  you may wish to comment this
-    # out for debugging purposes
-    word = re.sub("\+","", word)
-    return word
+    stats = generator.stats()
+    sys.stderr.write("%d analyses, %.2f us per call, cache hit rate "
+                     "%.1f%%\n" % (stats['calls'],
+                                    1e6 * stats['seconds_per_call'],
+                                    100.0 * stats['hit_rate']))
+    for (pattern, hits) in stats['rules']:
+        sys.stderr.write("%8d  %s\n" % (hits, pattern))
+    sys.stderr.write("%8d  (no rule)\n" % stats['unchanged'])
 
 if __name__ == '__main__':
-    user_input = raw_input()
-    if user_input:
-        print user_input, '-->',
-        print generate(user_input)
+    main()
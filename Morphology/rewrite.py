@@ -0,0 +1,164 @@
+"""
+Compiling context-dependent rewrite rules into FSTs.
+
+A rule a -> b / L _ R rewrites the string a as b wherever it is
+preceded by L and followed by R (in the style of Kaplan and Kay's
+rewrite rules).  L and R are sequences of character classes; each
+class is a string of the characters it allows, None for any
+character, or '#' for the edge of the word.  A rule is written here
+as a tuple (a, b, L, R).
+
+compile_rule turns one rule into a deterministic transducer: it reads
+the word from left to right, buffers input for as long as it may be
+the start of a match, and rewrites each match as soon as its right
+context has been seen.  Contexts are checked against the input, and
+matches do not overlap.  A list of rules is applied in order by
+composing their machines with cascade(), so generation is a single
+pass through a single machine.
+
+kMORPHOLOGY_RULES are the rules of morphology.iterateRules() in this
+form.  The regular expressions there match the whole word and rewrite
+only the last boundary that fits, while these rules rewrite every
+boundary; the two agree on analyses with a single '+'.  Note that
+[ed|ing] in the third regular expression is a character class, so
+"c+" becomes "ck" before any of e, d, |, i, n or g.
+"""
+import string
+from fst import FST
+from fsmutils import cached_fst, cascade, CompiledFST
+from morphology import MorphologyGenerator
+
+kALPHABET = string.ascii_letters + "+"
+kVOWELS = "aeiouAEIOU"
+
+kMORPHOLOGY_RULES = [
+    # ice+ing -> icing, pace+ed -> paced
+    ("e+", "", [], ["ei"]),
+    # pace+r -> pacer (needs a letter before the e and one after the +)
+    ("e+", "e", [None], [kALPHABET.replace("e", "").replace("i", "")]),
+    # traffic+ing -> trafficking
+    ("c+", "ck", [kVOWELS], ["ed|ing"]),
+    # remove any remaining boundaries
+    ("+", "", [], []),
+]
+
+def _matches(cls, sym):
+    if cls is None:
+        return sym != '#'
+    if cls == '#':
+        return sym == '#'
+    return sym != '#' and sym in cls
+
+def compile_rule(rule, alphabet=kALPHABET, label=None):
+    """
+    Returns a deterministic FST over alphabet that applies rule, a
+    tuple (a, b, L, R), everywhere in its input.
+    """
+    a, b, left, right = rule
+    if not a:
+        raise ValueError("Rules must rewrite a non-empty string")
+    if label is None:
+        label = '%s -> %s' % (a, b)
+    a = tuple(a)
+    right = list(right)
+
+    # The history is what the left context needs to know about the
+    # last len(left) symbols: which of its classes each one is in.
+    def signature(sym):
+        return tuple(_matches(cls, sym) for cls in left)
+    nothing = tuple(False for _ in left)
+    def push(history, sym):
+        return (history + (signature(sym),))[1:] if left else ()
+    def left_ok(history):
+        return all(history[i][i] for i in range(len(left)))
+
+    def fits(buf):
+        # Do the symbols of buf agree with a + right so far?
+        for (i, sym) in enumerate(buf[:len(a) + len(right)]):
+            if i < len(a):
+                if sym != a[i]:
+                    return False
+            elif not _matches(right[i - len(a)], sym):
+                return False
+        return True
+
+    def resolve(history, buf, final):
+        output = []
+        while buf:
+            if left_ok(history):
+                full = buf + ('#',) if final else buf
+                if fits(full) and len(full) >= len(a) + len(right):
+                    output.extend(b)
+                    for sym in a:
+                        history = push(history, sym)
+                    buf = buf[len(a):]
+                    continue
+                if not final and fits(buf):
+                    break
+            output.append(buf[0])
+            history = push(history, buf[0])
+            buf = buf[1:]
+        return (tuple(output), history, buf)
+
+    initial = ((nothing,) * (len(left) - 1) + (signature('#'),)
+               if left else (), ())
+    f = FST(label)
+    ids = {initial: 0}
+    f.add_state(0)
+    f.initial_state = 0
+    queue = [initial]
+    while queue:
+        state = queue.pop()
+        history, buf = state
+        output, _, _ = resolve(history, buf, final=True)
+        f.set_final(ids[state])
+        f.set_finalizing_string(ids[state], output)
+        for sym in alphabet:
+            output, new_history, rest = resolve(history, buf + (sym,),
+                                                final=False)
+            dst = (new_history, rest)
+            if dst not in ids:
+                ids[dst] = len(ids)
+                f.add_state(ids[dst])
+                queue.append(dst)
+            f.add_arc(ids[state], ids[dst], (sym,), output)
+    return f
+
+def compile_rules(rules, alphabet=kALPHABET):
+    """Returns one minimal deterministic FST that applies rules in
+    order."""
+    return cascade(*[compile_rule(rule, alphabet) for rule in rules])
+
+@cached_fst
+def morphology_fst():
+    """Returns the FST for kMORPHOLOGY_RULES."""
+    return compile_rules(kMORPHOLOGY_RULES)
+
+class FSTGenerator(object):
+    """
+    Generates words from analyses with morphology_fst(), run through
+    CompiledFST.  Analyses the machine does not cover -- those with
+    more than one boundary, or with characters outside kALPHABET --
+    are passed to a MorphologyGenerator instead.
+    """
+    def __init__(self):
+        self.table = CompiledFST(morphology_fst())
+        self.fallback = MorphologyGenerator()
+
+    def generate(self, analysis):
+        if analysis.count("+") <= 1:
+            output = self.table.transduce(analysis)
+            if output is not None:
+                return ''.join(output)
+        return self.fallback.generate(analysis)
+
+    def generate_many(self, analyses):
+        """Generate the word for each of analyses, returning a list."""
+        return [self.generate(analysis) for analysis in analyses]
+
+if __name__ == '__main__':
+    generator = FSTGenerator()
+    user_input = raw_input()
+    if user_input:
+        print user_input, '-->',
+        print generator.generate(user_input)
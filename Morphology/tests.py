@@ -0,0 +1,232 @@
+import random
+import re
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from morphology import iterateRules, generate, generate_many, \
+    MorphologyGenerator, CachedGenerator, kRULE_TRIGGERS
+import fsmutils
+from fsmutils import CompiledFST
+from rewrite import compile_rule, morphology_fst, FSTGenerator
+from analyzer import Analyzer
+from lexicon import Lexicon, kAFFIXES
+
+STEMS = ['ice', 'pace', 'race', 'traffic', 'lilac', 'spruce', 'picnic',
+         'walk', 'bake', 'panic', 'see', 'free', 'arc', 'zinc', 'disc',
+         'tree', 'e', 'c', 'ac', 'Ac', 'toe']
+AFFIXES = ['ed', 'ing', 's', 'r', 'd', 'er', 'ic', 'e', 'i', 'en', '', 'ee']
+
+ANALYSES = (['%s+%s' % (stem, affix) for stem in STEMS for affix in AFFIXES] +
+            ['walk', 'un+ice+ing', 'picnic+ed+ing', '+ing', 'e+', '+',
+             'bake+ed+s', 'lilac+d'])
+
+
+def reference_generate(analysis):
+    """The original, uncompiled implementation of generate."""
+    word = analysis
+    for (ruleLHS, ruleRHS) in iterateRules():
+        word = re.sub("^" + ruleLHS + "$", ruleRHS, word)
+    word = re.sub("\+", "", word)
+    return word
+
+
+def setUpModule():
+    # Keep the builder cache out of the user's ~/.cache/fst.
+    global saved_cache_dir
+    saved_cache_dir = fsmutils.FST_CACHE_DIR
+    fsmutils.FST_CACHE_DIR = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(fsmutils.FST_CACHE_DIR)
+    fsmutils.FST_CACHE_DIR = saved_cache_dir
+
+
+class TestGenerate(unittest.TestCase):
+
+    def test_examples(self):
+        self.assertEqual(generate('ice+ing'), 'icing')
+        self.assertEqual(generate('pace+ed'), 'paced')
+        self.assertEqual(generate('race+s'), 'races')
+        self.assertEqual(generate('traffic+ing'), 'trafficking')
+        self.assertEqual(generate('lilac+ing'), 'lilacking')
+        self.assertEqual(generate('spruce+d'), 'spruced')
+        self.assertEqual(generate('picnic+ed'), 'picnicked')
+
+    def test_matches_reference(self):
+        expected = [reference_generate(analysis) for analysis in ANALYSES]
+        self.assertEqual([generate(analysis) for analysis in ANALYSES],
+                         expected)
+        self.assertEqual(generate_many(ANALYSES), expected)
+        self.assertEqual(MorphologyGenerator().generate_many(ANALYSES),
+                         expected)
+
+    def test_triggers(self):
+        # Random analyses with any number of boundaries: the triggered
+        # rules must give the same result as trying every rule.
+        rng = random.Random(0)
+        analyses = [''.join(rng.choice('aeicdgn+|A')
+                            for _ in range(rng.randint(0, 8)))
+                    for _ in range(5000)]
+        untriggered = MorphologyGenerator(triggers=[None, None, None])
+        expected = [reference_generate(a) for a in analyses]
+        self.assertEqual(untriggered.generate_many(analyses), expected)
+        self.assertEqual(MorphologyGenerator().generate_many(analyses),
+                         expected)
+
+    def test_rule_triggers(self):
+        # kRULE_TRIGGERS must have a trigger for every rule, and none
+        # for rules that are gone.
+        self.assertEqual(sorted(kRULE_TRIGGERS),
+                         sorted(ruleLHS for (ruleLHS, _) in iterateRules()))
+        self.assertTrue(None not in MorphologyGenerator().triggers)
+
+
+class TestRewrite(unittest.TestCase):
+
+    def run_rule(self, rule, word):
+        return ''.join(CompiledFST(compile_rule(rule)).transduce(word))
+
+    def test_contexts(self):
+        self.assertEqual(self.run_rule(('c', 'k', ['aeiou'], ['#']),
+                                       'cacbac'), 'cacbak')
+        self.assertEqual(self.run_rule(('ab', 'x', ['#'], []), 'abab'),
+                         'xab')
+        self.assertEqual(self.run_rule(('a', 'b', [], ['a']), 'aaa'), 'bba')
+
+    def test_single_boundary(self):
+        # The FST rewrites every boundary, the regular expressions only
+        # the last one, so compare analyses with at most one '+'.
+        table = CompiledFST(morphology_fst())
+        rng = random.Random(0)
+        analyses = [a for a in ANALYSES if a.count('+') <= 1]
+        for _ in range(5000):
+            stem = ''.join(rng.choice('aeicdgnkxAE')
+                           for _ in range(rng.randint(0, 6)))
+            k = rng.randint(0, len(stem))
+            analyses.append(stem[:k] + '+' + stem[k:])
+        for analysis in analyses:
+            self.assertEqual(''.join(table.transduce(analysis)),
+                             reference_generate(analysis), analysis)
+
+    def test_generator(self):
+        self.assertEqual(FSTGenerator().generate_many(ANALYSES),
+                         [reference_generate(a) for a in ANALYSES])
+
+
+class TestAnalyzer(unittest.TestCase):
+
+    def test_examples(self):
+        analyzer = Analyzer(['ice', 'bake', 'baker', 'traffic', 'walk'])
+        self.assertEqual(analyzer.analyze('icing'), ['ice+ing'])
+        self.assertEqual(analyzer.analyze('trafficking'), ['traffic+ing'])
+        self.assertEqual(analyzer.analyze('baker'), ['bake+r', 'baker'])
+        self.assertEqual(analyzer.analyze('walk'), ['walk'])
+        self.assertEqual(analyzer.analyze('walkin'), [])
+        self.assertEqual(analyzer.analyze(''), [])
+        # baker is ambiguous, so the analyzer is not deterministic
+        self.assertEqual(analyzer.table, None)
+
+    def test_deterministic(self):
+        analyzer = Analyzer(['ice', 'pace', 'lilac'])
+        self.assertNotEqual(analyzer.table, None)
+        self.assertEqual(analyzer.analyze_many(['icing', 'paced', 'lilacs',
+                                                'lilacking', 'paces', 'ic']),
+                         [['ice+ing'], ['pace+ed'], ['lilac+s'],
+                          ['lilac+ing'], ['pace+s'], []])
+
+    def test_matches_generation(self):
+        # Every analysis of a random lexicon must be found from the word
+        # it generates, and nothing else.
+        rng = random.Random(0)
+        stems = set(''.join(rng.choice('aceikrsd')
+                            for _ in range(rng.randint(1, 5)))
+                    for _ in range(300))
+        expected = {}
+        for stem in stems:
+            for analysis in [stem] + [stem + '+' + affix
+                                      for affix in kAFFIXES]:
+                word = reference_generate(analysis)
+                expected.setdefault(word, set()).add(analysis)
+        analyzer = Analyzer(stems)
+        for word in expected:
+            self.assertEqual(analyzer.analyze(word), sorted(expected[word]))
+        for word in ['', 'x', 'aceikrsdaceikrsd', 'sssss']:
+            if word not in expected:
+                self.assertEqual(analyzer.analyze(word), [])
+
+
+class TestLexicon(unittest.TestCase):
+
+    def test_minimal(self):
+        lexicon = Lexicon(['cats', 'bat', 'cat', 'bats', 'cat'])
+        self.assertEqual(len(lexicon), 4)
+        self.assertEqual(list(lexicon), ['bat', 'bats', 'cat', 'cats'])
+        self.assertTrue('bats' in lexicon)
+        self.assertFalse('ba' in lexicon)
+        self.assertFalse('dog' in lexicon)
+        # b and c lead to the same state, and so on: 5 states in all
+        self.assertEqual(len(lexicon.arcs), 5)
+
+    def test_sorted(self):
+        lexicon = Lexicon()
+        lexicon.add('bat')
+        self.assertRaises(ValueError, lexicon.add, 'ant')
+        lexicon.add('cat')
+        lexicon.finish()
+        self.assertEqual(list(lexicon), ['bat', 'cat'])
+        self.assertRaises(ValueError, lexicon.add, 'dog')
+
+    def test_to_fst(self):
+        table = CompiledFST(Lexicon(['ice', 'walk']).to_fst(['ed', 's']))
+        for analysis in ['ice', 'walk+s', 'ice+ed']:
+            self.assertEqual(''.join(table.transduce(analysis)), analysis)
+        for analysis in ['ic', 'walk+', 'walk+ing', 'ice+ed+s']:
+            self.assertEqual(table.transduce(analysis), None)
+
+    def test_paradigms(self):
+        stems = STEMS + ['x-ray', 'cafe', 'walks']
+        paradigms = list(Lexicon(stems).paradigms(AFFIXES))
+        self.assertEqual([stem for (stem, _) in paradigms], sorted(stems))
+        for (stem, words) in paradigms:
+            self.assertEqual(words, [reference_generate(stem + '+' + affix)
+                                     for affix in AFFIXES])
+        fh = StringIO()
+        self.assertEqual(Lexicon(['ice', 'traffic']).write_paradigms(fh), 2)
+        self.assertEqual(fh.getvalue(),
+                         'ice\ticed\ticing\tices\ticer\n'
+                         'traffic\ttrafficked\ttrafficking\ttraffics\t'
+                         'trafficr\n')
+
+
+class TestCachedGenerator(unittest.TestCase):
+
+    def test_matches_reference(self):
+        generator = CachedGenerator(maxsize=10)
+        expected = [reference_generate(analysis) for analysis in ANALYSES]
+        self.assertEqual(generator.generate_many(ANALYSES + ANALYSES),
+                         expected + expected)
+        self.assertTrue(len(generator.cache) <= 10)
+
+    def test_counters(self):
+        generator = CachedGenerator()
+        for analysis in ['ice+ing', 'race+s', 'ice+ing', 'traffic+ing',
+                         'walk']:
+            generator.generate(analysis)
+        self.assertEqual(generator.calls, 5)
+        self.assertEqual(generator.cache.hits, 1)
+        self.assertEqual(generator.hit_rate(), 0.2)
+        self.assertEqual(generator.rule_hits, [2, 1, 1])
+        self.assertEqual(generator.unchanged, 1)
+        self.assertEqual(generator.trace('pace+r'), ('pacer', (1,)))
+        stats = generator.stats()
+        self.assertEqual(stats['calls'], 6)
+        self.assertEqual([hits for (_, hits) in stats['rules']], [2, 2, 1])
+        self.assertEqual(stats['unchanged'], 1)
+        self.assertEqual(generator.cache.hits + generator.cache.misses, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+"""
+Phonetic keys other than soundex, built on the same FST engine: NYSIIS
+and a Metaphone-style key.  Both are cascades of small transducers
+(case folding, rewrite rules, duplicate collapsing, truncation) that
+are compiled into a single deterministic machine with cascade().
+
+Most of the work is done by rewrite_fst, which compiles a table of
+rewrite rules into a transducer.  The rules are applied from left to
+right, and at each position the longest matching rule is used, so the
+table reads like the textbook description of each algorithm.
+"""
+from fst import FST
+import string
+from fsmutils import cached_fst, cascade, CompiledFST
+
+kUPPER = string.ascii_uppercase
+kVOWELS = 'AEIOU'
+
+def rewrite_fst(rules, label='rewrite', alphabet=kUPPER):
+    """
+    Returns a subsequential FST that rewrites its input with rules, a
+    list of (pattern, replacement) pairs.  A pattern starting with '^'
+    only matches at the start of the input, and one ending with '$'
+    only at the end.  The input is scanned from left to right; at each
+    position, patterns with more anchors are preferred, then longer
+    patterns over shorter ones.  Characters that no pattern
+    matches are copied unchanged.
+
+    The states of the machine are the pattern prefixes read but not yet
+    rewritten, so the machine is deterministic: it buffers input while
+    a longer match is still possible and writes the buffer out as soon
+    as it is not (or when the input ends).
+    """
+    table = []
+    for (pattern, replacement) in rules:
+        at_start = pattern.startswith('^')
+        at_end = pattern.endswith('$')
+        body = pattern[int(at_start):len(pattern) - int(at_end)]
+        table.append((body, replacement, at_start, at_end))
+
+    def waiting(start, buf):
+        # Could more input turn buf into (the start of) a better match?
+        for (body, _, at_start, at_end) in table:
+            if at_start and not start:
+                continue
+            if body.startswith(buf) and (len(body) > len(buf) or at_end):
+                return True
+        return False
+
+    def resolve(start, buf, final):
+        # Rewrite buf until the rest is a prefix that has to wait for
+        # more input.  Returns (output, start, rest).
+        output = ''
+        while buf and (final or not waiting(start, buf)):
+            best = None
+            for (body, replacement, at_start, at_end) in table:
+                if (at_start and not start) or not buf.startswith(body):
+                    continue
+                if at_end and not (final and body == buf):
+                    continue
+                rank = (at_start + at_end, len(body))
+                if best is None or rank > best[0]:
+                    best = (rank, body, replacement)
+            if best is None:
+                output += buf[0]
+                buf = buf[1:]
+            else:
+                output += best[2]
+                buf = buf[len(best[1]):]
+            start = False
+        return (output, start, buf)
+
+    def state_label(start, buf):
+        return ('^' if start else '') + buf
+
+    f = FST(label)
+    queue = [(True, '')]
+    f.add_state(state_label(True, ''))
+    f.initial_state = state_label(True, '')
+    while queue:
+        (start, buf) = queue.pop()
+        src = state_label(start, buf)
+        output, _, rest = resolve(start, buf, final=True)
+        f.set_final(src)
+        f.set_finalizing_string(src, tuple(output))
+        for char in alphabet:
+            output, new_start, rest = resolve(start, buf + char, final=False)
+            dst = state_label(new_start, rest)
+            if not f.has_state(dst):
+                f.add_state(dst)
+                queue.append((new_start, rest))
+            f.add_arc(src, dst, (char,), tuple(output))
+    return f
+
+def case_fold_fst(label='case-fold'):
+    """Returns an FST that upper-cases ascii letters and rejects
+    anything else."""
+    f = FST(label)
+    f.add_state('start', is_final=True)
+    f.initial_state = 'start'
+    for letter in string.ascii_letters:
+        f.add_arc('start', 'start', (letter,), (letter.upper(),))
+    return f
+
+def collapse_fst(label='collapse', keep='', alphabet=kUPPER):
+    """
+    Returns an FST that writes a run of the same letter only once,
+    except for the letters in keep.
+    """
+    f = FST(label)
+    f.add_state('', is_final=True)
+    f.initial_state = ''
+    for letter in alphabet:
+        f.add_state(letter, is_final=True)
+    for src in [''] + list(alphabet):
+        for letter in alphabet:
+            if letter == src and letter not in keep:
+                f.add_arc(src, letter, (letter,), ())
+            else:
+                f.add_arc(src, letter, (letter,), (letter,))
+    return f
+
+def truncate_fst(length, label='truncate', alphabet=kUPPER):
+    """Returns an FST that keeps the first length letters."""
+    f = FST(label)
+    for i in range(length + 1):
+        f.add_state(i, is_final=True)
+    f.initial_state = 0
+    for letter in alphabet:
+        for i in range(length):
+            f.add_arc(i, i + 1, (letter,), (letter,))
+        f.add_arc(length, length, (letter,), ())
+    return f
+
+#////////////////////////////////////////////////////////////
+# NYSIIS
+#////////////////////////////////////////////////////////////
+
+kNYSIIS_EDGES = [('^MAC', 'MCC'), ('^KN', 'NN'), ('^K', 'C'), ('^PH', 'FF'),
+                 ('^PF', 'FF'), ('^SCH', 'SSS'), ('EE$', 'Y'), ('IE$', 'Y'),
+                 ('DT$', 'D'), ('RT$', 'D'), ('RD$', 'D'), ('NT$', 'D'),
+                 ('ND$', 'D')]
+
+def nysiis_body_rules():
+    """
+    The NYSIIS translations for every letter after the first.  NYSIIS
+    replaces H and W by the letter before them in some contexts, which
+    the final duplicate collapsing then removes; here that is written
+    directly as deleting them.  An H between two vowels is kept, and
+    the vowel after it is read along with it (so "EV" is not
+    translated to "AF" right after such an H).
+    """
+    rules = [('^' + letter, letter) for letter in kUPPER]
+    rules += [('EV', 'AF'), ('Q', 'G'), ('Z', 'S'), ('M', 'N'), ('KN', 'N'),
+              ('K', 'C'), ('SCH', 'SSS'), ('PH', 'FF'), ('H', '')]
+    for vowel in kVOWELS:
+        rules += [(vowel, 'A'), (vowel + 'H', 'A'), (vowel + 'W', 'A'),
+                  ('^' + vowel + 'H', vowel), ('^' + vowel + 'W', vowel)]
+        for other in kVOWELS:
+            rules += [(vowel + 'H' + other, 'AHA'),
+                      ('^' + vowel + 'H' + other, vowel + 'HA')]
+    return rules
+
+def nysiis_tail_rules():
+    """Drop a final S and A, and turn a final AY into Y, but never the
+    first letter."""
+    rules = [('S$', ''), ('A$', ''), ('AS$', ''), ('AY$', 'Y')]
+    for letter in kUPPER:
+        rules += [('^' + letter + '$', letter),
+                  ('^' + letter + 'S$', letter),
+                  ('^' + letter + 'A$', letter),
+                  ('^' + letter + 'AS$', letter)]
+    return rules
+
+@cached_fst
+def nysiis_fst(length=6):
+    """
+    Returns a deterministic FST for the NYSIIS key of a name, truncated
+    to length letters (None for no truncation)
+    """
+    stages = [case_fold_fst(),
+              rewrite_fst(kNYSIIS_EDGES, 'nysiis-edges'),
+              rewrite_fst(nysiis_body_rules(), 'nysiis-body'),
+              collapse_fst(),
+              rewrite_fst(nysiis_tail_rules(), 'nysiis-tail')]
+    if length is not None:
+        stages.append(truncate_fst(length))
+    return cascade(*stages)
+
+#////////////////////////////////////////////////////////////
+# Metaphone
+#////////////////////////////////////////////////////////////
+
+def metaphone_rules():
+    """
+    The (original) Metaphone transformations, simplified where they
+    need more context than the letters next to each other: GH is
+    silent except at the start of a word, and vowels are only kept as
+    the first letter.
+    """
+    rules = [('^AE', 'E'), ('^GN', 'N'), ('^KN', 'N'), ('^PN', 'N'),
+             ('^WR', 'R'), ('^X', 'S'), ('^WH', 'W'), ('^GH', 'K'),
+             ('MB$', 'M'),
+             ('CIA', 'X'), ('CH', 'X'), ('SCH', 'SK'), ('CI', 'S'),
+             ('CE', 'S'), ('CY', 'S'), ('SCI', 'S'), ('SCE', 'S'),
+             ('SCY', 'S'), ('CK', 'K'), ('C', 'K'),
+             ('DGE', 'J'), ('DGI', 'J'), ('DGY', 'J'), ('D', 'T'),
+             ('GH', ''), ('GN$', 'N'), ('GNED$', 'NT'), ('GE', 'J'),
+             ('GI', 'J'), ('GY', 'J'), ('G', 'K'), ('H', ''),
+             ('PH', 'F'), ('Q', 'K'), ('SH', 'X'), ('SIO', 'X'),
+             ('SIA', 'X'), ('TIA', 'X'), ('TIO', 'X'), ('TH', '0'),
+             ('TCH', 'X'), ('V', 'F'), ('W', ''), ('X', 'KS'), ('Y', ''),
+             ('Z', 'S')]
+    for vowel in kVOWELS:
+        rules += [('^' + vowel, vowel), (vowel, ''), (vowel + 'H', ''),
+                  ('H' + vowel, 'H'), ('W' + vowel, 'W'), ('Y' + vowel, 'Y')]
+        for other in kVOWELS:
+            rules.append((vowel + 'H' + other, 'H'))
+    return rules
+
+@cached_fst
+def metaphone_fst(length=None):
+    """
+    Returns a deterministic FST for the Metaphone key of a name,
+    optionally truncated to length letters
+    """
+    stages = [case_fold_fst(),
+              collapse_fst(keep='C'),
+              rewrite_fst(metaphone_rules(), 'metaphone')]
+    if length is not None:
+        stages.append(truncate_fst(length, alphabet=kUPPER + '0'))
+    return cascade(*stages)
+
+#////////////////////////////////////////////////////////////
+# Coding names
+#////////////////////////////////////////////////////////////
+
+_tables = {}
+
+def _code(builder, name):
+    if builder not in _tables:
+        _tables[builder] = CompiledFST(builder())
+    code = _tables[builder].transduce(name)
+    if code is None:
+        return ''
+    return ''.join(code)
+
+def nysiis(name):
+    """
+    Returns the NYSIIS key of name, or '' if the name cannot be coded
+    (e.g. it contains something other than ascii letters)
+    """
+    return _code(nysiis_fst, name)
+
+def metaphone(name):
+    """
+    Returns the Metaphone key of name, or '' if the name cannot be
+    coded
+    """
+    return _code(metaphone_fst, name)
+
+if __name__ == '__main__':
+    user_input = raw_input().strip()
+
+    if user_input:
+        print("%s -> %s %s" % (user_input, nysiis(user_input),
+                               metaphone(user_input)))
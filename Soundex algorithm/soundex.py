@@ -1,17 +1,26 @@
 from fst import FST
-import string, sys
-from fsmutils import composechars, trace
+import string, sys, csv, time, argparse
+from functools import partial
+from collections import deque
+from itertools import islice
+from fsmutils import composechars, trace, cached_fst, cascade, CompiledFST
+from fsmutils import prepfile, ordered_map, LRUCache
 
+kLETTER_GROUPS = [['b','f','p','v','B','F','P','V'],['c','C', 'g','G','J', 'j', 'K','k','Q', 'q','S', 's','X', 'x', 'Z','z'],['d','D','T','t'],['L','l'],['M','N','m','n'],['R','r']]
+kVOWELS = ['a','e','i','o','u','w','y','h','A','E','I','O','U','W','Y','H']
+
+@cached_fst
 def letters_to_numbers():
     """
     Returns an FST that converts letters to numbers as specified by
-    the soundex algorithm
+    the soundex algorithm.  The first letter is kept, in upper case,
+    so that 'smith' and 'Smith' get the same code.
     """
 
     # Let's define our first FST
     f1 = FST('soundex-generate')
-    letter_groups = [['b','f','p','v','B','F','P','V'],['c','C', 'g','G','J', 'j', 'K','k','Q', 'q','S', 's','X', 'x', 'Z','z'],['d','D','T','t'],['L','l'],['M','N','m','n'],['R','r']]
-    vowels = ['a','e','i','o','u','w','y','h','A','E','I','O','U','W','Y','H']
+    letter_groups = kLETTER_GROUPS
+    vowels = kVOWELS
     states_num = len(letter_groups)
     
     f1.add_state('start')
@@ -28,7 +37,7 @@ def letters_to_numbers():
 
     for letter in string.ascii_letters:
         if letter in vowels :
-            f1.add_arc('start','vowels',(letter),(letter)) #first char is vowel
+            f1.add_arc('start','vowels',(letter),(letter.upper())) #first char is vowel
             f1.add_arc('vowels','vowels',(letter),()) #ignoring consecutive vowels iin start
             for i in range(states_num) :
                 f1.add_arc(i,'vowels',(letter),())
@@ -36,7 +45,7 @@ def letters_to_numbers():
         else :
             for conso_state in range(states_num):
                 if letter in letter_groups[conso_state] :
-                    f1.add_arc('start',conso_state,(letter),(letter))
+                    f1.add_arc('start',conso_state,(letter),(letter.upper()))
                     f1.add_arc('vowels',conso_state,(letter),(str(conso_state+1)[0]))
                     f1.add_arc(conso_state,conso_state,(letter),())
                     for other_conso_state in range(states_num):
@@ -49,6 +58,7 @@ def letters_to_numbers():
     # The stub code above converts all letters except the first into '0'.
     # How can you change it to do the right conversion?
 
+@cached_fst
 def truncate_to_three_digits():
     """
     Create an FST that will truncate a soundex string to three digits
@@ -71,7 +81,7 @@ def truncate_to_three_digits():
     
 
     # # Add the arcs
-    for letter in string.letters:
+    for letter in string.ascii_letters:
         f2.add_arc('start', 0, (letter), (letter))
 
     for n in range(10):
@@ -94,53 +104,255 @@ def truncate_to_three_digits():
     # The above stub code doesn't do any truncating at all -- it passes letter and number input through
     # what changes would make it truncate digits to 3?
 
+@cached_fst
 def add_zero_padding():
-    # Now, the third fst - the zero-padding fst
+    """
+    Create an FST that pads a soundex string with zeroes to three
+    digits.  The padding is written by the finalizing string of the
+    state reached after the last digit, so the machine is deterministic
+    and never has to guess how many zeroes to add.
+    """
     f3 = FST('soundex-padzero')
 
     f3.add_state('start')
-    # f3.add_state('1a')
-    # f3.add_state('1b')
-    # f3.add_state('2')
-
-    for i in range(7) :
+    padding = ['000', '00', '0', '']
+    for i in range(4) :
         f3.add_state(i)
-    
+        f3.set_final(i)
+        f3.set_finalizing_string(i, tuple(padding[i]))
+
     f3.initial_state = 'start'
-    f3.set_final(3)
-    f3.set_final(6)
 
-    for letter in string.letters:
+    for letter in string.ascii_letters:
         f3.add_arc('start', 0, (letter), (letter))
 
     for number in xrange(10):
         f3.add_arc('start', 1, (str(number)), (str(number)))
         for i in range(3) :
             f3.add_arc(i, i+1, (str(number)), (str(number)))
-    
-    # f3.add_arc('1', '1a', (), ('0'))
-    # f3.add_arc('1a', '1b', (), ('0'))
-    # f3.add_arc('1b', '2', (), ('0'))
 
-    # adding empty number arcs :
-
-    for i in range(3) :
-        f3.add_arc(i, i+4, (), ('0'))
-
-    for i in range(4,6) :
-        f3.add_arc(i, i+1, (), ('0'))
+    return f3
 
-    # trace(f3,'A5')
+@cached_fst
+def soundex_fst():
+    """
+    Returns a single deterministic, minimized FST equivalent to
+    running letters_to_numbers, truncate_to_three_digits and
+    add_zero_padding in sequence
+    """
+    return cascade(letters_to_numbers(), truncate_to_three_digits(),
+                   add_zero_padding())
 
-    return f3
+_soundex_table = None
 
-    # The above code adds zeroes but doesn't have any padding logic. Add some!
+def soundex(name):
+    """
+    Returns the soundex code of name, or '' if the name cannot be
+    coded (e.g. it contains something other than ascii letters)
+    """
+    global _soundex_table
+    if _soundex_table is None:
+        _soundex_table = CompiledFST(soundex_fst())
+    code = _soundex_table.transduce(name)
+    if code is None:
+        return ''
+    return ''.join(code)
+
+# Letter classes used by soundex_many: 0 for vowels, 1-6 for the
+# letter groups, then padding (numpy pads strings with NUL) and
+# anything that cannot be coded.
+kPAD_CLASS = 7
+kBAD_CLASS = 8
+
+_letter_classes = None
+
+def _letter_class_table():
+    import numpy
+    table = numpy.empty(256, dtype=numpy.uint8)
+    table.fill(kBAD_CLASS)
+    table[0] = kPAD_CLASS
+    for letter in kVOWELS:
+        table[ord(letter)] = 0
+    for (i, group) in enumerate(kLETTER_GROUPS):
+        for letter in group:
+            table[ord(letter)] = i + 1
+    return table
+
+def soundex_many(names):
+    """
+    Returns the soundex codes of a whole column of names (a list or a
+    NumPy string array) as a list, using the same letter groups as
+    letters_to_numbers.  Names that cannot be coded get ''.  All names
+    are coded at once with array operations, so this is much faster
+    than calling soundex() on each name.  Requires NumPy.
+    """
+    # NumPy is only needed here, so soundex() works without it.
+    import numpy
+    global _letter_classes
+    if _letter_classes is None:
+        _letter_classes = _letter_class_table()
+    names = numpy.asarray(names)
+    if len(names) == 0:
+        return []
+    if names.dtype.kind not in 'SU':
+        names = numpy.asarray(names.tolist())
+        if names.dtype.kind not in 'SU':
+            raise TypeError('soundex_many expects a column of strings')
+    names = numpy.ascontiguousarray(names.reshape(-1))
+    if names.dtype.kind == 'S':
+        chars = names.view(numpy.uint8)
+    else:
+        chars = names.view(numpy.uint32)
+    chars = chars.reshape(len(names), -1)
+    classes = numpy.where(chars < 256,
+                          _letter_classes[numpy.minimum(chars, 255)],
+                          kBAD_CLASS)
+    ok = (classes != kBAD_CLASS).all(axis=1) & (classes[:, 0] != kPAD_CLASS)
+
+    # After the first letter, a digit is written for every consonant
+    # whose group differs from the letter just before it; only the
+    # first three digits are kept, and missing ones are left as '0'.
+    prev, cur = classes[:, :-1], classes[:, 1:]
+    emit = (cur >= 1) & (cur <= 6) & (cur != prev)
+    rank = numpy.cumsum(emit, axis=1)
+    rows, cols = numpy.nonzero(emit & (rank <= 3))
+    codes = numpy.empty((len(names), 4), dtype=numpy.uint8)
+    codes.fill(ord('0'))
+    first = chars[:, 0]
+    first = numpy.where((first >= ord('a')) & (first <= ord('z')),
+                        first - (ord('a') - ord('A')), first)
+    codes[:, 0] = numpy.where(ok, first, ord('0'))
+    codes[rows, rank[rows, cols]] = ord('0') + cur[rows, cols]
+
+    codes = codes.view('S4').reshape(-1)
+    blank = ''
+    if names.dtype.kind == 'U':
+        codes = codes.astype('U4')
+        blank = u''
+    codes = codes.tolist()
+    for i in numpy.nonzero(~ok)[0]:
+        codes[i] = blank
+    return codes
+
+_memo = None
+
+def code_chunk(cache_size, names):
+    """
+    Returns (codes, hits, misses) for a chunk of names.  Codes are
+    remembered in a per-process LRU memo of cache_size names, and only
+    the names missing from it are coded, with soundex_many.  A name
+    seen earlier in the same chunk counts as a hit.
+    """
+    global _memo
+    if _memo is None or _memo.maxsize != cache_size:
+        _memo = LRUCache(cache_size)
+    found = {}
+    todo = []
+    hits = 0
+    for name in names:
+        if name in found:
+            hits += 1
+            continue
+        found[name] = code = _memo.get(name)
+        if code is None:
+            todo.append(name)
+        else:
+            hits += 1
+    if todo:
+        for (name, code) in zip(todo, soundex_many(todo)):
+            found[name] = code
+            _memo.put(name, code)
+    return ([found[name] for name in names], hits, len(todo))
+
+def read_names(infile, column, delimiter):
+    """
+    Generates (name, line) pairs: whole lines, or the given column of
+    each CSV row.  Lines are returned without their newline.
+    """
+    lines = (line.rstrip(u'\r\n') for line in infile)
+    if column is None:
+        for line in lines:
+            yield (line.strip(), line)
+        return
+    for line in lines:
+        (row,) = csv.reader([line.encode('utf8')], delimiter=delimiter)
+        name = row[column] if column < len(row) else ''
+        yield (name.decode('utf8').strip(), line)
+
+def chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Soundex-code names read from a file, or one name "
+                    "from stdin.")
+    parser.add_argument("--infile", "-i", type=argparse.FileType('r'),
+                        help="file of names, one per line (may be .gz)")
+    parser.add_argument("--outfile", "-o", type=argparse.FileType('w'),
+                        default=sys.stdout,
+                        help="output file (may be .gz); each input line "
+                             "is written with its code appended")
+    parser.add_argument("--column", "-c", type=int, default=None,
+                        help="read the names from this column of a "
+                             "CSV/TSV file")
+    parser.add_argument("--delimiter", "-d", default="\t",
+                        help="field delimiter (default tab)")
+    parser.add_argument("--header", action='store_true', default=False,
+                        help="copy the first line through, adding a "
+                             "soundex column")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                        help="processes used to code the names")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=10000, help="names sent to a worker at once")
+    parser.add_argument("--cache-size", dest="cache_size", type=int,
+                        default=100000,
+                        help="names remembered by each worker")
+    args = parser.parse_args()
+
+    if args.infile is None:
+        user_input = raw_input().strip()
+        if user_input:
+            print("%s -> %s" % (user_input, soundex(user_input)))
+        return
+
+    started = time.time()
+    infile = prepfile(args.infile, 'r')
+    outfile = prepfile(args.outfile, 'w')
+    delimiter = args.delimiter.decode('utf8')
+    if args.header:
+        line = next(infile, u'').rstrip(u'\r\n')
+        outfile.write(line + delimiter + u'soundex\n')
+    count = hits = misses = 0
+
+    # Only the names go to the workers; the lines wait here until
+    # ordered_map returns the codes of their chunk, in input order.
+    pending = deque()
+    def name_chunks():
+        for chunk in chunks(read_names(infile, args.column, args.delimiter),
+                            args.chunk_size):
+            pending.append(chunk)
+            yield [name for (name, line) in chunk]
+
+    for (codes, chunk_hits, chunk_misses) in ordered_map(
+            partial(code_chunk, args.cache_size), name_chunks(),
+            workers=args.workers):
+        chunk = pending.popleft()
+        for ((name, line), code) in zip(chunk, codes):
+            outfile.write(line + delimiter + code + u'\n')
+        count += len(chunk)
+        hits += chunk_hits
+        misses += chunk_misses
+    outfile.close()
+
+    elapsed = time.time() - started
+    sys.stderr.write("%d names in %.2f s (%.0f names/s), cache hit rate "
+                     "%.1f%%\n" % (count, elapsed, count / max(elapsed, 1e-9),
+                                    100.0 * hits / max(hits + misses, 1)))
 
 if __name__ == '__main__':
-    user_input = raw_input().strip()
-    f1 = letters_to_numbers()
-    f2 = truncate_to_three_digits()
-    f3 = add_zero_padding()
-
-    if user_input:
-        print("%s -> %s" % (user_input, composechars(tuple(user_input), f1, f2, f3)))
+    main()
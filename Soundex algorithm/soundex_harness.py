@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""
+Differential and performance harness for the soundex FSTs.
+
+Generates synthetic names (random letters) and realistic ones (common
+surnames with spelling variations), codes them with every soundex
+implementation in this directory, and checks each of them against
+reference_soundex, a straightforward coder written without FSTs.  It
+also times every stage of the cascade and every way of running the
+whole pipeline, in seconds per name:
+
+    python soundex_harness.py --count 1000000 --output timings.json
+
+Exits with status 1 if any implementation disagrees with the reference.
+The stage-by-stage cascade (composechars) and the uncompiled
+soundex_fst use the backtracking transducer and are much slower than
+the others, so they only get the first --sample names.
+"""
+import argparse
+import json
+import random
+import string
+import sys
+import time
+
+from fsmutils import composechars
+from soundex import (kLETTER_GROUPS, letters_to_numbers,
+                     truncate_to_three_digits, add_zero_padding,
+                     soundex_fst, soundex, soundex_many)
+
+kSURNAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller',
+             'Davis', 'Garcia', 'Rodriguez', 'Wilson', 'Martinez',
+             'Anderson', 'Taylor', 'Thomas', 'Hernandez', 'Moore', 'Martin',
+             'Jackson', 'Thompson', 'White', 'Lopez', 'Lee', 'Gonzalez',
+             'Harris', 'Clark', 'Lewis', 'Robinson', 'Walker', 'Perez',
+             'Hall', 'Young', 'Allen', 'Sanchez', 'Wright', 'King', 'Scott',
+             'Green', 'Baker', 'Adams', 'Nelson', 'Hill', 'Ramirez',
+             'Campbell', 'Mitchell', 'Roberts', 'Carter', 'Phillips',
+             'Evans', 'Turner', 'Torres', 'Parker', 'Collins', 'Edwards',
+             'Stewart', 'Flores', 'Morris', 'Nguyen', 'Murphy', 'Rivera',
+             'Cook', 'Rogers', 'Morgan', 'Peterson', 'Cooper', 'Reed',
+             'Bailey', 'Bell', 'Gomez', 'Kelly', 'Howard', 'Ward', 'Cox',
+             'Diaz', 'Richardson', 'Wood', 'Watson', 'Brooks', 'Bennett',
+             'Gray', 'James', 'Reyes', 'Cruz', 'Hughes', 'Price', 'Myers',
+             'Long', 'Foster', 'Sanders', 'Ross', 'Morales', 'Powell',
+             'Sullivan', 'Russell', 'Ortiz', 'Jenkins', 'Gutierrez',
+             'Perry', 'Butler', 'Barnes', 'Fisher', 'Henderson', 'Coleman',
+             'Tymczak', 'Pfister', 'Ashcraft', 'Lukasiewicz', 'VanDeusen',
+             'OHara', 'McDonald', 'Schmidt', 'Schwarzenegger', 'Wojcik']
+
+# Spelling variations applied to realistic names.
+kVARIATIONS = [('ph', 'f'), ('f', 'ph'), ('ck', 'k'), ('c', 'k'),
+               ('ie', 'y'), ('y', 'ie'), ('s', 'z'), ('ll', 'l'),
+               ('t', 'tt'), ('ei', 'ie'), ('w', 'v'), ('son', 'sen')]
+
+
+def reference_soundex(name):
+    """
+    The soundex code of name, computed directly from the letter groups
+    used by letters_to_numbers: the first letter is kept (in upper
+    case), and every later consonant writes its group's digit unless
+    the letter just before it is in the same group (vowels, h, w and y
+    separate letters of the same group).  The code is truncated or padded with
+    zeroes to three digits.  Returns '' if name is empty or contains
+    anything other than ascii letters.
+    """
+    if not name or any(char not in string.ascii_letters for char in name):
+        return ''
+    groups = {}
+    for (i, group) in enumerate(kLETTER_GROUPS):
+        for letter in group:
+            groups[letter] = i + 1
+    code = name[0].upper()
+    previous = groups.get(name[0], 0)
+    for char in name[1:]:
+        group = groups.get(char, 0)
+        if group and group != previous:
+            code += str(group)
+        previous = group
+    return (code + '000')[:4]
+
+
+def synthetic_names(n, rng):
+    """Random strings of letters, mostly capitalized, with a few names
+    that cannot be coded."""
+    names = []
+    for _ in xrange(n):
+        name = ''.join(rng.choice(string.ascii_letters)
+                       for _ in xrange(rng.randint(1, 14)))
+        roll = rng.random()
+        if roll < 0.01:
+            name = ''
+        elif roll < 0.02:
+            name = name[:2] + rng.choice(" '-3") + name[2:]
+        names.append(name)
+    return names
+
+
+def realistic_names(n, rng):
+    """Common surnames, picked with a zipf-like distribution and
+    respelled with a few common variations."""
+    weights = [1.0 / (i + 1) for i in range(len(kSURNAMES))]
+    total = sum(weights)
+    cumulative = []
+    acc = 0.0
+    for w in weights:
+        acc += w / total
+        cumulative.append(acc)
+    names = []
+    for _ in xrange(n):
+        r = rng.random()
+        lo, hi = 0, len(cumulative) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cumulative[mid] < r:
+                lo = mid + 1
+            else:
+                hi = mid
+        name = kSURNAMES[lo]
+        if rng.random() < 0.3:
+            (old, new) = rng.choice(kVARIATIONS)
+            name = name[0] + name[1:].replace(old, new, 1)
+        if rng.random() < 0.1:
+            name = name.upper() if rng.random() < 0.5 else name.lower()
+        names.append(name)
+    return names
+
+
+def timed(fn, *args):
+    """Return (fn(*args), elapsed seconds)."""
+    start = time.time()
+    result = fn(*args)
+    return (result, time.time() - start)
+
+
+def run_stages(names, stages):
+    """Run the cascade one stage at a time on each name, timing every
+    stage separately.  Returns the codes and a list of elapsed times."""
+    elapsed = [0.0] * len(stages)
+    codes = []
+    for name in names:
+        output = tuple(name)
+        for (i, stage) in enumerate(stages):
+            start = time.time()
+            result = stage.transduce(output)
+            elapsed[i] += time.time() - start
+            if result is None:
+                output = None
+                break
+            output = tuple(result)
+        codes.append(''.join(output) if output is not None else '')
+    return (codes, elapsed)
+
+
+def check(label, names, codes, expected, failures, limit=10):
+    """Compare codes against expected, recording up to limit
+    disagreements in failures."""
+    bad = 0
+    for (name, code, ref) in zip(names, codes, expected):
+        if code != ref:
+            bad += 1
+            if len(failures) < limit:
+                failures.append({'implementation': label, 'name': name,
+                                 'code': code, 'expected': ref})
+    return bad
+
+
+def run(names, sample):
+    """
+    Code names with every implementation and return a report with the
+    number of mismatches and the seconds per name of each one.
+    """
+    report = {'names': len(names), 'sample': min(sample, len(names)),
+              'mismatches': {}, 'seconds_per_name': {}, 'failures': []}
+    mismatches = report['mismatches']
+    per_name = report['seconds_per_name']
+    failures = report['failures']
+
+    expected, elapsed = timed(lambda: [reference_soundex(name)
+                                       for name in names])
+    per_name['reference'] = elapsed / len(names)
+
+    codes, elapsed = timed(soundex_many, names)
+    per_name['soundex_many'] = elapsed / len(names)
+    mismatches['soundex_many'] = check('soundex_many', names, codes,
+                                       expected, failures)
+
+    soundex('')  # compile the table outside the timing
+    codes, elapsed = timed(lambda: [soundex(name) for name in names])
+    per_name['soundex'] = elapsed / len(names)
+    mismatches['soundex'] = check('soundex', names, codes, expected,
+                                  failures)
+
+    head = names[:sample]
+    stages = [letters_to_numbers(), truncate_to_three_digits(),
+              add_zero_padding()]
+    codes, elapsed = run_stages(head, stages)
+    for (stage, seconds) in zip(stages, elapsed):
+        per_name['stage/%s' % stage.label] = seconds / len(head)
+    mismatches['stages'] = check('stages', head, codes, expected, failures)
+
+    # composechars prints an error for every name it cannot code, so
+    # it only gets the names the reference could code.
+    codable = [(name, ref) for (name, ref) in zip(head, expected) if ref]
+    codes, elapsed = timed(lambda: [composechars(tuple(name), *stages)
+                                    for (name, _) in codable])
+    per_name['composechars'] = elapsed / max(len(codable), 1)
+    mismatches['composechars'] = check(
+        'composechars', [name for (name, _) in codable], codes,
+        [ref for (_, ref) in codable], failures)
+
+    machine = soundex_fst()
+    def transduce(name):
+        output = machine.transduce(tuple(name))
+        return ''.join(output) if output is not None else ''
+    codes, elapsed = timed(lambda: [transduce(name) for name in head])
+    per_name['soundex_fst'] = elapsed / len(head)
+    mismatches['soundex_fst'] = check('soundex_fst', head, codes, expected,
+                                      failures)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the soundex FSTs against a reference coder, "
+                    "and time them.")
+    parser.add_argument("--count", "-n", type=int, default=1000000,
+                        help="names of each kind to generate")
+    parser.add_argument("--sample", type=int, default=10000,
+                        help="names run through the slow stage-by-stage "
+                             "cascade")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", "-o",
+                        help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {}
+    for (kind, generate) in [('synthetic', synthetic_names),
+                             ('realistic', realistic_names)]:
+        names = generate(args.count, rng)
+        report[kind] = run(names, args.sample)
+
+    text = json.dumps(report, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    if any(any(r['mismatches'].values()) for r in report.values()):
+        sys.stderr.write("Mismatches against reference_soundex!\n")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+from collections import Counter
+from itertools import combinations
+from soundex import soundex, soundex_many
+from phonetic import nysiis, metaphone
+
+class SoundexIndex(object):
+    """
+    A blocking index for record deduplication.  Records are coded in
+    bulk with soundex_many and grouped into blocks by their soundex
+    code, optionally combined with other keys (first initial, year of
+    birth, ...).  Candidate pairs are only generated within a block, so
+    the number of comparisons is the sum of the squared block sizes
+    rather than the square of the number of records.
+
+    Records can be anything: name(record) must return the name to code,
+    and each function in keys must return a hashable value.
+    """
+    def __init__(self, name=None, keys=()):
+        self.name = name or (lambda record: record)
+        self.keys = list(keys)
+
+        self.records = []
+        """All the records added so far; records are identified by their
+        position in this list."""
+
+        self.blocks = {}
+        """A dictionary mapping block keys (tuples starting with the
+        soundex code) to lists of record ids."""
+
+        self.unblocked = []
+        """The ids of records whose names could not be coded.  They are
+        never part of a candidate pair."""
+
+        self._splits = {}
+        """A dictionary mapping the keys of blocks removed by split() to
+        the key function used to split them."""
+
+    def add(self, record):
+        """Add a single record, and return its id."""
+        return self.add_many([record])[0]
+
+    def add_many(self, records):
+        """Add a batch of records, and return their ids."""
+        records = list(records)
+        codes = soundex_many([self.name(record) for record in records])
+        start = len(self.records)
+        self.records.extend(records)
+        for (i, (record, code)) in enumerate(zip(records, codes)):
+            if not code:
+                self.unblocked.append(start + i)
+                continue
+            key = (code,) + tuple(fn(record) for fn in self.keys)
+            while key in self._splits:
+                key += (self._splits[key](record),)
+            self.blocks.setdefault(key, []).append(start + i)
+        return range(start, start + len(records))
+
+    def candidate_pairs(self):
+        """Generate every (id, id) pair of records that share a block."""
+        for ids in self.blocks.itervalues():
+            for pair in combinations(ids, 2):
+                yield pair
+
+    def pair_count(self):
+        """Return the number of pairs candidate_pairs() will generate."""
+        return sum(len(ids) * (len(ids) - 1) // 2
+                   for ids in self.blocks.itervalues())
+
+    def block_size_histogram(self):
+        """Return a sorted list of (block size, number of blocks)."""
+        return sorted(Counter(len(ids)
+                              for ids in self.blocks.itervalues()).items())
+
+    def oversized(self, max_size):
+        """Return the keys of the blocks with more than max_size records."""
+        return [key for (key, ids) in self.blocks.iteritems()
+                if len(ids) > max_size]
+
+    def split(self, max_size, key):
+        """
+        Split every block with more than max_size records into smaller
+        blocks, by appending key(record) to the block key.  Records added
+        later that fall into a split block are split the same way.
+        """
+        for block_key in self.oversized(max_size):
+            self._splits[block_key] = key
+            for i in self.blocks.pop(block_key):
+                sub_key = block_key + (key(self.records[i]),)
+                self.blocks.setdefault(sub_key, []).append(i)
+
+
+class KeyIndex(object):
+    """
+    An index of records under several phonetic keys at once (soundex,
+    NYSIIS and Metaphone by default).  Every record is coded with all
+    the keys in one pass, and stored in one postings list per key and
+    code.  The candidates for a name are the union of the postings
+    lists of its codes, so a record is found if any of the keys agree.
+
+    keys maps the name of each key to a function from a name to its
+    code ('' if the name cannot be coded).
+    """
+    def __init__(self, name=None, keys=None):
+        self.name = name or (lambda record: record)
+        if keys is None:
+            keys = {'soundex': soundex, 'nysiis': nysiis,
+                    'metaphone': metaphone}
+        self.keys = dict(keys)
+
+        self.records = []
+        """All the records added so far; records are identified by their
+        position in this list."""
+
+        self.postings = dict((key, {}) for key in self.keys)
+        """A dictionary mapping each key name to a dictionary from codes
+        to lists of record ids."""
+
+    def codes(self, name):
+        """Return a dictionary mapping each key name to the code of
+        name ('' if it cannot be coded)."""
+        return dict((key, fn(name)) for (key, fn) in self.keys.iteritems())
+
+    def add(self, record):
+        """Add a single record, and return its id."""
+        return self.add_many([record])[0]
+
+    def add_many(self, records):
+        """Add a batch of records, and return their ids.  Each distinct
+        name in the batch is only coded once."""
+        records = list(records)
+        start = len(self.records)
+        self.records.extend(records)
+        coded = {}
+        for (i, record) in enumerate(records):
+            name = self.name(record)
+            if name not in coded:
+                coded[name] = self.codes(name)
+            for (key, code) in coded[name].iteritems():
+                if code:
+                    self.postings[key].setdefault(code, []).append(start + i)
+        return range(start, start + len(records))
+
+    def candidates(self, name, keys=None):
+        """Return the sorted ids of the records that share a code with
+        name under any of keys (default: all of them)."""
+        ids = set()
+        for (key, code) in self.codes(name).iteritems():
+            if code and (keys is None or key in keys):
+                ids.update(self.postings[key].get(code, ()))
+        return sorted(ids)
+
+    def candidate_pairs(self, keys=None):
+        """Return the set of (id, id) pairs of records that share a code
+        under any of keys (default: all of them)."""
+        pairs = set()
+        for (key, blocks) in self.postings.iteritems():
+            if keys is None or key in keys:
+                for ids in blocks.itervalues():
+                    pairs.update(combinations(ids, 2))
+        return pairs
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""
+Join two large CSV/TSV files on the soundex code of a name column.
+
+Both inputs are streamed in chunks; each chunk is coded with
+soundex_many, sorted by code and spilled to a temporary file, so
+chunks can be coded in parallel by several worker processes.  The
+spill files of each side are then merged, and a merge-join emits one
+output row (code, left row, right row) for every pair of rows with the
+same code.  Only the rows of one left-hand code are held in memory at
+a time.  At most --max-open-files spill files are read at once: when a
+side has more, groups of them are first merged into larger spill files,
+in as many passes as needed.
+
+    python soundex_join.py people.csv voters.csv.gz --left-column 0 \\
+        --right-column surname --header --workers 4 --outfile pairs.csv
+"""
+import argparse
+import csv
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import time
+from cStringIO import StringIO
+from functools import partial
+from itertools import groupby, islice
+
+from fsmutils import prepfile, ordered_map
+from soundex import soundex_many
+
+# Rows whose code is '' (names that cannot be coded) are never joined.
+
+
+def utf8_lines(fh):
+    """py2's csv module only reads byte strings."""
+    for line in fh:
+        yield line.encode('utf8')
+
+
+def read_chunks(reader, chunk_size):
+    """Generate (number of rows before the chunk, rows) pairs."""
+    start = 0
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return
+        yield (start, rows)
+        start += len(rows)
+
+
+def spill_chunk(tmpdir, column, chunk):
+    """
+    Code one chunk, sort it by code and write it to a spill file in
+    tmpdir.  Returns (spill file name, rows written, rows skipped).
+    The input row number is written after the code, so that merging
+    the spill files keeps rows with the same code in input order.
+    Codes start with an upper-case letter whatever the case of the
+    name, so the sort and the merge compare them as plain strings.
+    """
+    (start, rows) = chunk
+    names = [row[column] if column < len(row) else '' for row in rows]
+    coded = [(code, start + i, row)
+             for (i, (code, row)) in enumerate(zip(soundex_many(names), rows))
+             if code]
+    coded.sort(key=lambda item: item[0])
+    path = write_spill(tmpdir, coded)
+    return (path, len(coded), len(rows) - len(coded))
+
+
+def write_spill(tmpdir, items):
+    """Write (code, row number, row) triples to a new spill file in
+    tmpdir, and return its name."""
+    fd, path = tempfile.mkstemp(suffix='.spill', dir=tmpdir)
+    with os.fdopen(fd, 'wb') as fh:
+        writer = csv.writer(fh)
+        for (code, i, row) in items:
+            writer.writerow([code, i] + row)
+    return path
+
+
+def read_spill(path):
+    with open(path, 'rb') as fh:
+        for row in csv.reader(fh):
+            yield (row[0], int(row[1]), row[2:])
+
+
+def merge_spills(paths, tmpdir, fan_in, stats=None):
+    """
+    Return an iterator over the (code, row number, row) triples of
+    the sorted spill files paths, in order, that never has more than
+    fan_in of them open.  While there are more than fan_in files,
+    groups of fan_in are merged into new spill files (and deleted).
+    """
+    if fan_in < 2:
+        raise ValueError('Cannot merge fewer than 2 files at a time')
+    paths = list(paths)
+    while len(paths) > fan_in:
+        merged = []
+        for start in range(0, len(paths), fan_in):
+            group = paths[start:start + fan_in]
+            if len(group) == 1:
+                merged.extend(group)
+                continue
+            merged.append(write_spill(tmpdir, heapq.merge(
+                *[read_spill(path) for path in group])))
+            for path in group:
+                os.unlink(path)
+            if stats is not None:
+                stats['merge_files'] += 1
+        paths = merged
+    return heapq.merge(*[read_spill(path) for path in paths])
+
+
+def sort_side(infile, column, args, tmpdir, stats, side):
+    """
+    Spill one input file as sorted chunks, and return an iterator over
+    all its (code, row number, row) triples in code order, plus its
+    header row (or None).
+    """
+    reader = csv.reader(utf8_lines(prepfile(infile, 'r')),
+                        delimiter=args.delimiter)
+    header = next(reader, []) if args.header else None
+    try:
+        column = int(column)
+    except ValueError:
+        if header is None or column not in header:
+            sys.stderr.write("No column %s in %s\n" % (column, infile))
+            sys.exit(1)
+        column = header.index(column)
+    paths = []
+    for (path, written, skipped) in ordered_map(
+            partial(spill_chunk, tmpdir, column),
+            read_chunks(reader, args.chunk_size), workers=args.workers):
+        paths.append(path)
+        stats[side + '_rows'] += written + skipped
+        stats[side + '_uncoded'] += skipped
+    stats['spill_files'] += len(paths)
+    # Both sides are merged at the same time, so each gets half of the
+    # open files.
+    fan_in = max(2, args.max_open_files // 2)
+    return (merge_spills(paths, tmpdir, fan_in, stats), header)
+
+
+def merge_join(left, right):
+    """
+    Generate (code, left row, right row) for every pair of rows with
+    the same code, given two iterators of (code, row number, row)
+    sorted by code.
+    """
+    left = groupby(left, key=lambda item: item[0])
+    right = groupby(right, key=lambda item: item[0])
+    (lcode, lgroup) = next(left, (None, None))
+    (rcode, rgroup) = next(right, (None, None))
+    while lcode is not None and rcode is not None:
+        if lcode < rcode:
+            (lcode, lgroup) = next(left, (None, None))
+        elif rcode < lcode:
+            (rcode, rgroup) = next(right, (None, None))
+        else:
+            lrows = [row for (_, _, row) in lgroup]
+            for (_, _, rrow) in rgroup:
+                for lrow in lrows:
+                    yield (lcode, lrow, rrow)
+            (lcode, lgroup) = next(left, (None, None))
+            (rcode, rgroup) = next(right, (None, None))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Join two CSV/TSV files on the soundex code of a name "
+                    "column, using an external sort-merge.")
+    parser.add_argument("left", help="left input file (may be .gz)")
+    parser.add_argument("right", help="right input file (may be .gz)")
+    parser.add_argument("--left-column", "-l", dest="left_column",
+                        default="0",
+                        help="name column of the left file: an index, or a "
+                             "header name with --header")
+    parser.add_argument("--right-column", "-r", dest="right_column",
+                        default="0", help="name column of the right file")
+    parser.add_argument("--delimiter", "-d", default=",",
+                        help="field delimiter of the inputs and the output "
+                             "(use $'\\t' for TSV)")
+    parser.add_argument("--header", action='store_true', default=False,
+                        help="the inputs start with a header row")
+    parser.add_argument("--outfile", "-o",
+                        type=argparse.FileType('w'), default=sys.stdout,
+                        help="output file (may be .gz)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=100000, help="rows per sorted spill file")
+    parser.add_argument("--workers", "-w", type=int, default=1,
+                        help="processes used to code and sort chunks")
+    parser.add_argument("--tmpdir", default=None,
+                        help="directory for the spill files")
+    parser.add_argument("--max-open-files", dest="max_open_files", type=int,
+                        default=64,
+                        help="spill files read at once, for both sides "
+                             "together; more are merged in several passes")
+    args = parser.parse_args()
+
+    started = time.time()
+    stats = dict.fromkeys(['left_rows', 'left_uncoded', 'right_rows',
+                           'right_uncoded', 'spill_files', 'merge_files',
+                           'pairs'], 0)
+    tmpdir = tempfile.mkdtemp(prefix='soundex-join-', dir=args.tmpdir)
+    try:
+        (left, lheader) = sort_side(args.left, args.left_column, args,
+                                    tmpdir, stats, 'left')
+        (right, rheader) = sort_side(args.right, args.right_column, args,
+                                     tmpdir, stats, 'right')
+
+        outfile = prepfile(args.outfile, 'w')
+        buf = StringIO()
+        writer = csv.writer(buf, delimiter=args.delimiter,
+                            lineterminator='\n')
+
+        def write(row):
+            buf.seek(0)
+            buf.truncate()
+            writer.writerow(row)
+            outfile.write(buf.getvalue().decode('utf8'))
+
+        if args.header:
+            write(['soundex'] + lheader + rheader)
+        for (code, lrow, rrow) in merge_join(left, right):
+            write([code] + lrow + rrow)
+            stats['pairs'] += 1
+        outfile.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    stats['seconds'] = time.time() - started
+    sys.stderr.write(' '.join('%s=%s' % (key, stats[key])
+                              for key in sorted(stats)) + '\n')
+
+
+if __name__ == '__main__':
+    main()
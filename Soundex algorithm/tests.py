@@ -0,0 +1,459 @@
+import csv
+import os
+import random
+import resource
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+import fsmutils
+from fsmutils import composechars, LRUCache, CompiledFST
+from soundex import (letters_to_numbers, truncate_to_three_digits,
+                     add_zero_padding, soundex_fst, soundex, soundex_many,
+                     code_chunk)
+from soundex_index import SoundexIndex, KeyIndex
+from phonetic import (nysiis_fst, metaphone_fst, nysiis, metaphone,
+                      rewrite_fst)
+from soundex_join import merge_join, merge_spills, write_spill
+from soundex_harness import (reference_soundex, synthetic_names,
+                             realistic_names)
+
+NAMES = ['Robert', 'Rupert', 'Rubin', 'Ashcraft', 'Ashcroft', 'Tymczak',
+         'Pfister', 'Honeyman', 'Jackson', 'Washington', 'Lee', 'Gutierrez',
+         'VanDeusen', 'Deusen', 'Ellery', 'Euler', 'Gauss', 'Ghosh',
+         'Heilbronn', 'Kant', 'Knuth', 'Ladd', 'Lloyd', 'Lukasiewicz',
+         'Lissajous', 'Wheaton', 'Burroughs', 'Burrows', 'OHara', 'Aebersold',
+         'a', 'A', 'b', 'Ab', 'Aa', 'bb', 'Bbb', 'Yy', 'Hh',
+         "O'Neil", 'Smith-Jones', 'Mc Donald', 'Ren3', '']
+
+
+def random_names(n, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(string.ascii_letters)
+                    for _ in range(rng.randint(1, 12)))
+            for _ in range(n)]
+
+
+def setUpModule():
+    # Keep the builder cache out of the user's ~/.cache/fst, here and
+    # in the scripts the tests run.
+    global saved_cache_dir, saved_environ
+    saved_cache_dir = fsmutils.FST_CACHE_DIR
+    saved_environ = os.environ.get('FST_CACHE_DIR')
+    fsmutils.FST_CACHE_DIR = tempfile.mkdtemp()
+    os.environ['FST_CACHE_DIR'] = fsmutils.FST_CACHE_DIR
+
+
+def tearDownModule():
+    shutil.rmtree(fsmutils.FST_CACHE_DIR)
+    fsmutils.FST_CACHE_DIR = saved_cache_dir
+    if saved_environ is None:
+        del os.environ['FST_CACHE_DIR']
+    else:
+        os.environ['FST_CACHE_DIR'] = saved_environ
+
+
+class TestSoundexFST(unittest.TestCase):
+
+    def setUp(self):
+        self.stages = (letters_to_numbers(), truncate_to_three_digits(),
+                       add_zero_padding())
+        self.fst = soundex_fst()
+
+    def cascade(self, name):
+        return composechars(tuple(name), *self.stages)
+
+    def test_examples(self):
+        self.assertEqual(soundex('Robert'), 'R163')
+        self.assertEqual(soundex('Tymczak'), 'T522')
+        self.assertEqual(soundex('Pfister'), 'P236')
+        self.assertEqual(soundex('Lee'), 'L000')
+        self.assertEqual(soundex('smith'), 'S530')
+        self.assertEqual(soundex('aSHCRAFT'), 'A226')
+        self.assertEqual(soundex("O'Neil"), '')
+        self.assertEqual(soundex(''), '')
+
+    def test_matches_cascade(self):
+        for name in NAMES + random_names(2000):
+            output = self.fst.transduce(tuple(name))
+            self.assertEqual(''.join(output or ()), self.cascade(name), name)
+            self.assertEqual(soundex(name), self.cascade(name), name)
+
+    def test_deterministic(self):
+        for state in self.fst.states():
+            symbols = [self.fst.in_string(arc)
+                       for arc in self.fst.outgoing(state)]
+            self.assertTrue(all(len(sym) == 1 for sym in symbols))
+            self.assertEqual(len(symbols), len(set(symbols)))
+
+    def test_padding_deterministic(self):
+        f3 = add_zero_padding()
+        for state in f3.states():
+            symbols = [f3.in_string(arc) for arc in f3.outgoing(state)]
+            self.assertTrue(all(len(sym) == 1 for sym in symbols))
+            self.assertEqual(len(symbols), len(set(symbols)))
+        self.assertEqual(''.join(f3.transduce(tuple('R1'))), 'R100')
+
+    def test_reference(self):
+        rng = random.Random(2)
+        names = (NAMES + synthetic_names(3000, rng) +
+                 realistic_names(3000, rng))
+        expected = [reference_soundex(name) for name in names]
+        self.assertEqual([soundex(name) for name in names], expected)
+        self.assertEqual(soundex_many(names), expected)
+        for (name, code) in zip(names, expected)[:500]:
+            if code:
+                self.assertEqual(self.cascade(name), code, name)
+
+
+class TestSoundexMany(unittest.TestCase):
+
+    def test_matches_fst(self):
+        names = NAMES + random_names(5000, seed=1)
+        expected = [soundex(name) for name in names]
+        self.assertEqual(soundex_many(names), expected)
+        self.assertEqual(soundex_many([unicode(name) for name in names]),
+                         expected)
+        self.assertEqual(soundex_many(numpy.array(names)), expected)
+
+    def test_case(self):
+        names = ['Smith', 'smith', 'SMITH', 'ashcraft', u'lee']
+        expected = ['S530', 'S530', 'S530', 'A226', 'L000']
+        self.assertEqual(soundex_many(names), expected)
+        self.assertEqual([soundex(name) for name in names], expected)
+
+    def test_empty(self):
+        self.assertEqual(soundex_many([]), [])
+        self.assertEqual(soundex_many(['']), [''])
+
+
+class TestCompiledFST(unittest.TestCase):
+
+    def setUp(self):
+        self.table = CompiledFST(soundex_fst())
+        self.names = NAMES + random_names(3000, seed=3)
+        self.expected = [self.table.transduce(name) for name in self.names]
+
+    def test_transduce_many(self):
+        self.assertEqual(self.table.transduce_many(self.names),
+                         self.expected)
+        for sep in ['', '-', ' / ']:
+            self.assertEqual(self.table.transduce_many(self.names, sep=sep),
+                             [None if output is None else sep.join(output)
+                              for output in self.expected])
+        self.assertEqual(self.table.transduce_many(
+                             [unicode(name) for name in self.names], sep=''),
+                         self.table.transduce_many(self.names, sep=''))
+        self.assertEqual(self.table.transduce_many([], sep=''), [])
+        self.assertEqual(self.table.transduce_many([]), [])
+
+    def test_transduce_strings(self):
+        (outputs, accepted) = self.table.transduce_strings(
+            numpy.array(self.names))
+        self.assertEqual(outputs.dtype.kind, 'S')
+        self.assertEqual(accepted.tolist(),
+                         [output is not None for output in self.expected])
+        self.assertEqual(outputs.tolist(), [''.join(output or ())
+                                            for output in self.expected])
+
+    def test_transduce_ids(self):
+        (out_ids, accepted) = self.table.transduce_ids(self.names)
+        outputs = self.table.outputs
+        for (row, ok, output) in zip(out_ids, accepted, self.expected)[:500]:
+            if ok:
+                self.assertEqual([sym for i in row for sym in outputs[i]],
+                                 output)
+
+
+class TestCachedFST(unittest.TestCase):
+
+    # A builder whose machine depends on a constant from another module
+    # in its directory; builds counts how often it actually ran.
+    BUILDER = '''
+from fst import FST
+from fsmutils import cached_fst
+from fstcase_words import WORD
+
+builds = []
+
+@cached_fst
+def word_fst(n):
+    builds.append(n)
+    f = FST('word')
+    f.add_state(0)
+    f.initial_state = 0
+    f.set_final(0)
+    f.set_finalizing_string(0, tuple(WORD * n))
+    return f
+'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, 'cache')
+        self.saved = fsmutils.FST_CACHE_DIR
+        fsmutils.FST_CACHE_DIR = self.cache
+        self.write('fstcase_words.py', "WORD = 'a'\n")
+        self.write('fstcase_builder.py', self.BUILDER)
+        sys.path.insert(0, self.directory)
+        import fstcase_builder
+        self.module = fstcase_builder
+
+    def tearDown(self):
+        fsmutils.FST_CACHE_DIR = self.saved
+        sys.path.remove(self.directory)
+        for name in ['fstcase_builder', 'fstcase_words']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        with open(os.path.join(self.directory, name), 'w') as fh:
+            fh.write(text)
+
+    def output(self, f):
+        return ''.join(f.transduce(()))
+
+    def test_store_and_load(self):
+        word_fst = self.module.word_fst
+        self.assertEqual(self.output(word_fst(2)), 'aa')
+        self.assertEqual(self.output(word_fst(2)), 'aa')
+        self.assertEqual(self.output(word_fst(3)), 'aaa')
+        self.assertEqual(self.module.builds, [2, 3])
+        self.assertEqual(os.stat(self.cache).st_mode & 0o777, 0o700)
+        self.assertEqual(len(os.listdir(self.cache)), 2)
+        fsmutils.clear_fst_cache()
+        word_fst(2)
+        self.assertEqual(self.module.builds, [2, 3, 2])
+
+    def test_dependency_changed(self):
+        word_fst = self.module.word_fst
+        word_fst(2)
+        self.write('fstcase_words.py', "WORD = 'b'\n")
+        # The sources are hashed once per process; start afresh.
+        fsmutils._source_digests.clear()
+        fsmutils._local_imports.clear()
+        word_fst(2)
+        self.assertEqual(self.module.builds, [2, 2])
+
+    def test_unsafe_directory(self):
+        os.mkdir(self.cache)
+        os.chmod(self.cache, 0o777)
+        word_fst = self.module.word_fst
+        word_fst(2)
+        word_fst(2)
+        self.assertEqual(self.module.builds, [2, 2])
+        self.assertEqual(os.listdir(self.cache), [])
+
+
+class TestMemo(unittest.TestCase):
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_code_chunk(self):
+        names = ['Robert', 'Lee', 'Robert', "O'Neil", 'Lee', 'Robert']
+        for size in [1, 100]:
+            (codes, hits, misses) = code_chunk(size, names)
+            self.assertEqual(codes, soundex_many(names))
+            self.assertEqual(hits + misses, len(names))
+        # Repeats within a chunk are hits.
+        self.assertEqual(code_chunk(50, ['Robert', 'Robert']),
+                         (['R163', 'R163'], 1, 1))
+        self.assertEqual(code_chunk(50, names), (soundex_many(names), 4, 2))
+
+    def test_without_numpy(self):
+        script = ("import sys; sys.modules['numpy'] = None; "
+                  "import soundex; print soundex.soundex('Robert')")
+        self.assertEqual(subprocess.check_output([sys.executable, '-c',
+                                                  script]).strip(), 'R163')
+
+
+class TestSoundexIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [('Robert', 1970), ('Rupert', 1970), ('Rubin', 1981),
+                        ('Robert', 1981), ('Lee', 1970), ('Ley', 1970),
+                        ("O'Neil", 1970)]
+        self.index = SoundexIndex(name=lambda record: record[0])
+        self.index.add_many(self.records)
+
+    def test_blocks(self):
+        pairs = set(self.index.candidate_pairs())
+        self.assertEqual(pairs, set([(0, 1), (0, 3), (1, 3), (4, 5)]))
+        self.assertEqual(self.index.pair_count(), len(pairs))
+        self.assertEqual(self.index.block_size_histogram(),
+                         [(1, 1), (2, 1), (3, 1)])
+        self.assertEqual(self.index.unblocked, [6])
+
+    def test_case(self):
+        index = SoundexIndex()
+        index.add_many(['Smith', 'smith', 'SMITH'])
+        self.assertEqual(index.blocks, {('S530',): [0, 1, 2]})
+
+    def test_extra_keys(self):
+        index = SoundexIndex(name=lambda record: record[0],
+                             keys=[lambda record: record[1]])
+        index.add_many(self.records)
+        self.assertEqual(set(index.candidate_pairs()), set([(0, 1), (4, 5)]))
+
+    def test_split(self):
+        self.assertEqual(self.index.oversized(2), [('R163',)])
+        self.index.split(2, lambda record: record[1])
+        self.assertEqual(self.index.oversized(2), [])
+        self.assertEqual(set(self.index.candidate_pairs()),
+                         set([(0, 1), (4, 5)]))
+        (i,) = self.index.add_many([('Robart', 1970)])
+        self.assertEqual(self.index.blocks[('R163', 1970)], [0, 1, i])
+
+
+class TestPhonetic(unittest.TestCase):
+
+    def test_rewrite(self):
+        f = CompiledFST(rewrite_fst([('^KN', 'N'), ('PH', 'F'), ('P', 'B'),
+                                     ('S$', '')]))
+        def run(name):
+            return ''.join(f.transduce(name))
+        self.assertEqual(run('KNAPPS'), 'NABB')
+        self.assertEqual(run('PHSK'), 'FSK')
+        self.assertEqual(run('SKNS'), 'SKN')
+        self.assertEqual(run(''), '')
+
+    def test_nysiis(self):
+        examples = [('Brown', 'BRAN'), ('Johnson', 'JANSAN'),
+                    ('Williams', 'WALAN'), ('Knight', 'NAGT'),
+                    ('Mitchell', 'MATCAL'), ('Schmidt', 'SNAD'),
+                    ('MacDonald', 'MCDANA'), ('Hughes', 'HAG'),
+                    ('As', 'A'), ("O'Neil", '')]
+        for (name, code) in examples:
+            self.assertEqual(nysiis(name), code, name)
+
+    def test_metaphone(self):
+        examples = [('Knight', 'NT'), ('Thompson', '0MPSN'),
+                    ('Mitchell', 'MXL'), ('Catherine', 'K0RN'),
+                    ('Kathryn', 'K0RN'), ('Dodge', 'TJ'), ('Lamb', 'LM'),
+                    ('Xavier', 'SFR'), ("O'Neil", '')]
+        for (name, code) in examples:
+            self.assertEqual(metaphone(name), code, name)
+
+    def test_deterministic(self):
+        for f in [nysiis_fst(), metaphone_fst()]:
+            for state in f.states():
+                symbols = [f.in_string(arc) for arc in f.outgoing(state)]
+                self.assertEqual(len(symbols), len(set(symbols)))
+
+
+class TestKeyIndex(unittest.TestCase):
+
+    def test_candidates(self):
+        index = KeyIndex()
+        index.add_many(['Catherine', 'Kathryn', 'Katrina', 'Robert', 'Lee'])
+        self.assertEqual(index.candidates('Kathrine'), [0, 1, 2])
+        self.assertEqual(index.candidates('Kathrine', keys=['metaphone']),
+                         [0, 1])
+        self.assertEqual(index.candidates('Rupert'), [3])
+        self.assertEqual(index.candidates("O'Neil"), [])
+        self.assertTrue((0, 1) in index.candidate_pairs())
+        self.assertFalse((3, 4) in index.candidate_pairs())
+
+
+class TestSoundexJoin(unittest.TestCase):
+
+    def test_merge_join(self):
+        left = [('L000', 0, ['Lee']), ('R163', 1, ['Robert']),
+                ('R163', 2, ['Rupert']), ('T522', 3, ['Tymczak'])]
+        right = [('A226', 0, ['Ashcroft']), ('L000', 1, ['Ley']),
+                 ('R163', 2, ['Robart'])]
+        self.assertEqual(list(merge_join(iter(left), iter(right))),
+                         [('L000', ['Lee'], ['Ley']),
+                          ('R163', ['Robert'], ['Robart']),
+                          ('R163', ['Rupert'], ['Robart'])])
+        self.assertEqual(list(merge_join(iter(left), iter([]))), [])
+
+    def test_merge_spills(self):
+        directory = tempfile.mkdtemp()
+        try:
+            items = [(code, i, [str(i)]) for (i, code)
+                     in enumerate(soundex_many(random_names(200, seed=4)))]
+            paths = [write_spill(directory, sorted(items[start:start + 7]))
+                     for start in range(0, len(items), 7)]
+            stats = {'merge_files': 0}
+            merged = list(merge_spills(paths, directory, 3, stats))
+            self.assertEqual(merged, sorted(items))
+            self.assertTrue(stats['merge_files'] > 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_join_files(self):
+        # Forces about 150 spill files per side through 40 open files.
+        directory = tempfile.mkdtemp()
+        try:
+            sides = []
+            for (side, seed) in [('left', 5), ('right', 6)]:
+                names = random_names(300, seed=seed) + NAMES
+                path = os.path.join(directory, side + '.csv')
+                with open(path, 'wb') as fh:
+                    writer = csv.writer(fh)
+                    writer.writerow(['name', 'id'])
+                    for (i, name) in enumerate(names):
+                        writer.writerow([name, '%s%d' % (side, i)])
+                sides.append((path, names))
+            outfile = os.path.join(directory, 'pairs.csv')
+            def limit_open_files():
+                resource.setrlimit(resource.RLIMIT_NOFILE, (40, 40))
+            subprocess.check_call(
+                [sys.executable, 'soundex_join.py', sides[0][0], sides[1][0],
+                 '--header', '-l', 'name', '-r', 'name', '--chunk-size', '2',
+                 '--max-open-files', '16', '--tmpdir', directory,
+                 '-o', outfile],
+                preexec_fn=limit_open_files, stderr=open(os.devnull, 'w'))
+            with open(outfile, 'rb') as fh:
+                rows = list(csv.reader(fh))
+            self.assertEqual(rows[0], ['soundex', 'name', 'id', 'name', 'id'])
+            (left, right) = [[(soundex(name), [name, '%s%d' % (side, i)])
+                              for (i, name) in enumerate(names)]
+                             for (side, (path, names))
+                             in zip(['left', 'right'], sides)]
+            expected = [[lcode] + lrow + rrow
+                        for (lcode, lrow) in left for (rcode, rrow) in right
+                        if lcode and lcode == rcode]
+            self.assertTrue(len(expected) > 0)
+            self.assertEqual(sorted(rows[1:]), sorted(expected))
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ['left.csv', 'pairs.csv', 'right.csv'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_join_mixed_case(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = []
+            for (side, names) in [('left', ['Smith', 'lee']),
+                                  ('right', ['SMITH', 'smith', 'Ley'])]:
+                paths.append(os.path.join(directory, side + '.csv'))
+                with open(paths[-1], 'wb') as fh:
+                    csv.writer(fh).writerows([name] for name in names)
+            output = subprocess.check_output(
+                [sys.executable, 'soundex_join.py', paths[0], paths[1]],
+                stderr=open(os.devnull, 'w'))
+            self.assertEqual(sorted(csv.reader(output.splitlines())),
+                             [['L000', 'lee', 'Ley'],
+                              ['S530', 'Smith', 'SMITH'],
+                              ['S530', 'Smith', 'smith']])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
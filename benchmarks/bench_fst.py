@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the FST engine (fst.py / fsmutils.py).
+
+Times machine construction (add_arc), determinized(), transduce() and
+transduce_subsequential() across machine sizes and input lengths, and
+the Soundex, French-count and Morphology projects as real workloads,
+including CompiledFST one name at a time and in batches, and the
+start-up time of a fresh interpreter with a warm builder cache and
+with the cache turned off.
+Results are written as JSON (seconds per operation, best of several
+samples of at least MIN_TIME seconds each) and can be compared
+against a stored baseline:
+
+    python bench_fst.py --output results.json
+    python bench_fst.py --baseline baseline.json       # exit 1 on regression
+    python bench_fst.py --save-baseline baseline.json
+
+Timings are only comparable between runs on the same machine and
+python version.  A --quick run uses smaller sizes than the baseline,
+so it reports no regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+for project in ['Soundex algorithm', 'French count', 'Morphology']:
+    sys.path.insert(0, os.path.join(scriptdir, os.pardir, project))
+
+# The builders are called through .uncached below, so that
+# construction is timed rather than loaded from the builder cache.
+from fst import FST
+from fsmutils import composechars, CompiledFST
+import soundex
+import french_count
+import morphology
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+
+# (project, statement) run in a fresh interpreter by the start-up
+# benchmarks; each builds or loads a cached machine.
+STARTUP = [('Soundex algorithm', "import soundex; soundex.soundex('Robert')"),
+           ('Morphology', "import rewrite; rewrite.morphology_fst()")]
+
+
+# Each timed sample runs the benchmark often enough to take at least
+# this many seconds, so that timer resolution and scheduling noise stay
+# well below the regression tolerance.
+MIN_TIME = 0.2
+
+
+def best_of(fn, repeat, min_time=MIN_TIME):
+    """
+    Return the best time per call of C{fn}, in seconds, over C{repeat}
+    samples.  The number of calls per sample is doubled until a sample
+    takes at least C{min_time} seconds.
+    """
+    number = 1
+    while True:
+        elapsed = run_timed(fn, number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, run_timed(fn, number) / number)
+    return best
+
+
+def run_timed(fn, number):
+    start = time.time()
+    for _ in range(number):
+        fn()
+    return time.time() - start
+
+
+#////////////////////////////////////////////////////////////
+# Synthetic machines
+#////////////////////////////////////////////////////////////
+
+def random_machine(n_states, seed=0, label='random'):
+    """
+    A random, complete, input-deterministic machine with C{n_states}
+    states over L{ALPHABET}.  Every arc has exactly one output symbol,
+    so the machine is also subsequential.
+    """
+    rng = random.Random(seed)
+    f = FST(label)
+    for state in range(n_states):
+        f.add_state(state, is_final=True)
+    f.initial_state = 0
+    for state in range(n_states):
+        for sym in ALPHABET:
+            f.add_arc(state, rng.randrange(n_states), sym,
+                      rng.choice(ALPHABET))
+    return f
+
+
+def redundant_machine(n_states, seed=0):
+    """
+    The union of two copies of L{random_machine}, joined by a fresh
+    initial state.  Every input has two identical paths, so the machine
+    is nondeterministic but determinizes back to C{n_states} states.
+    """
+    base = random_machine(n_states, seed)
+    f = FST('redundant')
+    f.add_state('init', is_final=True)
+    f.initial_state = 'init'
+    for copy in 'ab':
+        for state in base.states():
+            f.add_state((copy, state), is_final=True)
+        for arc in base.arcs():
+            src, dst, in_string, out_string = base.arc_info(arc)
+            f.add_arc((copy, src), (copy, dst), in_string, out_string)
+            if src == base.initial_state:
+                f.add_arc('init', (copy, dst), in_string, out_string)
+    return f
+
+
+def random_names(n, seed=0):
+    rng = random.Random(seed)
+    names = []
+    for _ in range(n):
+        name = ''.join(rng.choice(ALPHABET)
+                       for _ in range(rng.randint(3, 10)))
+        names.append(name.capitalize())
+    return names
+
+
+#////////////////////////////////////////////////////////////
+# Benchmarks
+#////////////////////////////////////////////////////////////
+
+def run_benchmarks(quick=False):
+    sizes = [10, 100] if quick else [10, 100, 1000]
+    lengths = [10, 100] if quick else [10, 100, 1000]
+    repeat = 5
+    results = {}
+
+    for n in sizes:
+        results['add_arc/states=%d' % n] = best_of(
+            lambda: random_machine(n), repeat)
+
+        machine = redundant_machine(n)
+        results['determinized/states=%d' % n] = best_of(
+            machine.determinized, repeat)
+
+        machine = random_machine(n)
+        rng = random.Random(n)
+        for length in lengths:
+            input = [rng.choice(ALPHABET) for _ in range(length)]
+            results['transduce/states=%d/length=%d' % (n, length)] = \
+                best_of(lambda: machine.transduce(input), repeat)
+            results['transduce_subsequential/states=%d/length=%d'
+                    % (n, length)] = best_of(
+                lambda: machine.transduce_subsequential(input), repeat)
+
+    # Real workloads: time per input, machines built once.
+    results['soundex/build'] = best_of(
+        lambda: (soundex.letters_to_numbers.uncached(),
+                 soundex.truncate_to_three_digits.uncached(),
+                 soundex.add_zero_padding.uncached()), repeat)
+    f1 = soundex.letters_to_numbers.uncached()
+    f2 = soundex.truncate_to_three_digits.uncached()
+    f3 = soundex.add_zero_padding.uncached()
+    names = random_names(100 if quick else 1000)
+    results['soundex/composechars/name'] = best_of(
+        lambda: [composechars(tuple(name), f1, f2, f3) for name in names],
+        repeat) / len(names)
+
+    # The compiled table, one name at a time and in batches.
+    table = CompiledFST(soundex.soundex_fst.uncached())
+    names = random_names(10000 if quick else 100000)
+    column = numpy.array(names)
+    results['soundex/transduce/name'] = best_of(
+        lambda: [table.transduce(name) for name in names],
+        repeat) / len(names)
+    results['soundex/transduce_many/name'] = best_of(
+        lambda: table.transduce_many(names, sep=''), repeat) / len(names)
+    results['soundex/transduce_strings/name'] = best_of(
+        lambda: table.transduce_strings(column), repeat) / len(names)
+
+    results['french_count/build'] = best_of(
+        french_count.french_count.uncached, repeat)
+    f = french_count.french_count.uncached()
+    numbers = [french_count.prepare_input(i) for i in range(1000)]
+    results['french_count/transduce/number'] = best_of(
+        lambda: [f.transduce(number) for number in numbers],
+        repeat) / len(numbers)
+
+    analyses = ['%s+%s' % (stem, affix) for stem in
+                ['ice', 'pace', 'race', 'traffic', 'lilac', 'spruce',
+                 'picnic', 'walk', 'bake', 'panic']
+                for affix in ['ed', 'ing', 's', 'r']]
+    # The generator itself: morphology.generate() goes through an LRU
+    # cache, which would time cache hits instead.
+    generator = morphology.MorphologyGenerator()
+    results['morphology/generate/word'] = best_of(
+        lambda: [generator.generate(a) for a in analyses],
+        repeat) / len(analyses)
+
+    # Start-up: a warm builder cache against no cache at all.
+    cache_dir = tempfile.mkdtemp(prefix='bench-fst-')
+    try:
+        for (project, statement) in STARTUP:
+            name = project.split()[0].lower()
+            start_python(project, statement, cache_dir)
+            results['startup/%s/warm' % name] = best_of(
+                lambda: start_python(project, statement, cache_dir), repeat)
+            results['startup/%s/uncached' % name] = best_of(
+                lambda: start_python(project, statement, ''), repeat)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return results
+
+
+def start_python(project, statement, cache_dir):
+    """
+    Run C{statement} in a fresh interpreter in C{project}, with the
+    builder cache in C{cache_dir} (the empty string turns it off).
+    """
+    env = dict(os.environ, FST_CACHE_DIR=cache_dir)
+    subprocess.check_call([sys.executable, '-c', statement], env=env,
+                          cwd=os.path.join(scriptdir, os.pardir, project))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of C{(name, baseline, current, ratio)} for every
+    benchmark that is more than C{tolerance} slower than the baseline.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / baseline[name] if baseline[name] else 1.0
+        if ratio > 1.0 + tolerance:
+            regressions.append((name, baseline[name], results[name], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the FST engine and the FST projects.")
+    parser.add_argument('--output', help="write JSON results to this file")
+    parser.add_argument('--baseline', help="compare against this JSON file")
+    parser.add_argument('--save-baseline', dest='save_baseline',
+                        help="write the results as a new baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown before a benchmark counts "
+                             "as a regression (default 0.25 = 25%%)")
+    parser.add_argument('--quick', action='store_true',
+                        help="smaller sizes, for a fast smoke run; "
+                             "skips the baseline comparison")
+    args = parser.parse_args()
+
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'quick': args.quick,
+              'results': run_benchmarks(args.quick)}
+
+    text = json.dumps(report, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fh:
+            fh.write(text + '\n')
+
+    if args.baseline and args.quick:
+        sys.stderr.write('--quick: not comparing against the baseline\n')
+    elif args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)['results']
+        regressions = compare(report['results'], baseline, args.tolerance)
+        for (name, old, new, ratio) in regressions:
+            sys.stderr.write('REGRESSION %s: %.3g s -> %.3g s (x%.2f)\n' %
+                             (name, old, new, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
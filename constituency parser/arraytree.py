@@ -0,0 +1,222 @@
+# arraytree.py
+"""
+A compact, array-backed form of a treebank.
+
+An ArrayTree holds any number of trees in parallel NumPy arrays with
+one entry per node, instead of one Python object per node.  Nodes are
+numbered in preorder, tree after tree, so the nodes of tree k are
+offsets[k] to offsets[k+1] and every node comes before its
+descendants.  For node i:
+
+  - label[i] is the id of its label in labels (labels are interned)
+  - parent[i] is its parent, or -1 for a root
+  - first_child[i] and next_sibling[i] are its first child and its
+    next sibling, or -1
+  - span_start[i] and span_end[i] are the positions of the first leaf
+    it covers and just past the last one, counted from the first leaf
+    of its tree
+
+Leaves, bottom-up order and rule counts are computed with array
+operations over the whole treebank at once.
+"""
+
+from array import array
+from collections import defaultdict
+
+import numpy
+
+import tree
+
+class ArrayTree(object):
+    def __init__(self, labels=None):
+        """ Create an empty treebank; use from_trees() or from_file() to
+        fill one. """
+        self.labels = list(labels) if labels is not None else []
+        self.label_ids = dict((label, i) for (i, label)
+                              in enumerate(self.labels))
+        self.offsets = numpy.zeros(1, dtype=numpy.int32)
+        for name in ['label', 'parent', 'first_child', 'next_sibling',
+                     'span_start', 'span_end']:
+            setattr(self, name, numpy.zeros(0, dtype=numpy.int32))
+
+    def intern(self, label):
+        """ Return the id of label, adding it to labels if it is new. """
+        i = self.label_ids.get(label)
+        if i is None:
+            i = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return i
+
+    @staticmethod
+    def from_trees(trees, labels=None):
+        """ Build an ArrayTree from tree.Tree objects. The trees are
+        converted one at a time, so trees may be a generator. A tree
+        whose root is None is stored with no nodes. """
+        forest = ArrayTree(labels)
+        columns = dict((name, array('i')) for name in
+                       ['label', 'parent', 'first_child', 'next_sibling',
+                        'span_start', 'span_end'])
+        label, parent = columns['label'], columns['parent']
+        first_child = columns['first_child']
+        next_sibling = columns['next_sibling']
+        span_start, span_end = columns['span_start'], columns['span_end']
+        offsets = array('i', [0])
+        for t in trees:
+            if t.root is not None:
+                base = len(label)
+                last_child = {}
+                leaf = 0
+                stack = [(t.root, -1)]
+                while stack:
+                    (node, p) = stack.pop()
+                    i = len(label)
+                    label.append(forest.intern(node.label))
+                    parent.append(p)
+                    first_child.append(-1)
+                    next_sibling.append(-1)
+                    span_start.append(leaf)
+                    span_end.append(leaf)
+                    if p >= 0:
+                        if p in last_child:
+                            next_sibling[last_child[p]] = i
+                        else:
+                            first_child[p] = i
+                        last_child[p] = i
+                    if node.children:
+                        for child in reversed(node.children):
+                            stack.append((child, i))
+                    else:
+                        leaf += 1
+                        span_end[i] = leaf
+                # A node's span ends where its last child's does; the
+                # last child comes later in preorder, so go backwards.
+                for i in xrange(len(label) - 1, base - 1, -1):
+                    if i in last_child:
+                        span_end[i] = span_end[last_child[i]]
+            offsets.append(len(label))
+        for (name, column) in columns.items():
+            setattr(forest, name, numpy.array(column, dtype=numpy.int32))
+        forest.offsets = numpy.array(offsets, dtype=numpy.int32)
+        return forest
+
+    @staticmethod
+    def from_file(path, labels=None):
+        """ Build an ArrayTree from a file of trees, one per line. """
+        return ArrayTree.from_trees(tree.Tree.iter_file(path), labels)
+
+    def __len__(self):
+        """ The number of trees. """
+        return len(self.offsets) - 1
+
+    def num_nodes(self):
+        return len(self.label)
+
+    def _nodes(self, k):
+        if k is None:
+            return (0, len(self.label))
+        return (self.offsets[k], self.offsets[k+1])
+
+    def children(self, i):
+        """ The children of node i, as a list of node indices. """
+        children = []
+        child = self.first_child[i]
+        while child >= 0:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def to_tree(self, k):
+        """ Return tree k as a tree.Tree. """
+        (start, end) = self._nodes(k)
+        if start == end:
+            return tree.Tree(None)
+        nodes = {}
+        for i in xrange(end - 1, start - 1, -1):
+            nodes[i] = tree.Node(self.labels[self.label[i]],
+                                 [nodes.pop(c) for c in self.children(i)])
+        return tree.Tree(nodes[start])
+
+    def to_trees(self):
+        """ Generate every tree as a tree.Tree. """
+        for k in xrange(len(self)):
+            yield self.to_tree(k)
+
+    def leaves(self, k=None):
+        """ The indices of the leaves of tree k (or of every tree), from
+        left to right. """
+        (start, end) = self._nodes(k)
+        return start + numpy.nonzero(self.first_child[start:end] < 0)[0]
+
+    def words(self, k):
+        """ The labels of the leaves of tree k. """
+        return [self.labels[i] for i in self.label[self.leaves(k)]]
+
+    def _parents(self, k):
+        # The parents of the nodes of tree k (or of every tree),
+        # numbered from the tree's first node.
+        (start, end) = self._nodes(k)
+        parent = self.parent[start:end]
+        return numpy.where(parent >= 0, parent - start, -1)
+
+    def depth(self, k=None):
+        """ The depth of every node of tree k (or of every tree); roots
+        have depth 0. """
+        parent = self._parents(k)
+        depth = numpy.zeros(len(parent), dtype=numpy.int32)
+        ancestor = parent.copy()
+        while True:
+            above = ancestor >= 0
+            if not above.any():
+                return depth
+            depth += above
+            ancestor[above] = parent[ancestor[above]]
+
+    def subtree_size(self, k=None):
+        """ The number of nodes in the subtree of every node of tree k
+        (or of every tree). """
+        parent = self._parents(k)
+        size = numpy.ones(len(parent), dtype=numpy.int32)
+        depth = self.depth(k)
+        # Add each level into the one above, deepest first.
+        for d in xrange(depth.max() if len(depth) else 0, 0, -1):
+            level = numpy.nonzero(depth == d)[0]
+            numpy.add.at(size, parent[level], size[level])
+        return size
+
+    def bottomup(self, k=None):
+        """ The indices of the nodes of tree k (or of every tree) in the
+        order of Tree.bottomup(): each node after its children, and
+        children from left to right. """
+        # In postorder, node i comes after every node before it in
+        # preorder that is not one of its ancestors, and after its
+        # descendants.
+        (start, end) = self._nodes(k)
+        post = (numpy.arange(end - start) - self.depth(k) +
+                self.subtree_size(k) - 1)
+        order = numpy.empty(end - start, dtype=numpy.int32)
+        order[post] = numpy.arange(start, end)
+        return order
+
+    def rule_counts(self):
+        """ Count the rules of every tree, as Tree.get_dict() does:
+        returns a dictionary mapping "LHS --> A B " to its count. """
+        n = len(self.label)
+        nonroot = numpy.nonzero(self.parent >= 0)[0]
+        arity = numpy.bincount(self.parent[nonroot], minlength=n)
+        # The children of every node, grouped by parent and in order;
+        # the children of node i start at kids[offset[i]].
+        kids = nonroot[numpy.argsort(self.parent[nonroot], kind='mergesort')]
+        offset = numpy.cumsum(arity) - arity
+        counts = defaultdict(int)
+        for k in numpy.unique(arity[arity > 0]):
+            parents = numpy.nonzero(arity == k)[0]
+            rules = numpy.empty((len(parents), k + 1), dtype=numpy.int32)
+            rules[:, 0] = self.label[parents]
+            for j in xrange(k):
+                rules[:, j+1] = self.label[kids[offset[parents] + j]]
+            (unique, count) = numpy.unique(rules, axis=0, return_counts=True)
+            for (row, c) in zip(unique, count):
+                rule = "%s --> %s" % (self.labels[row[0]], "".join(
+                    self.labels[x] + " " for x in row[1:]))
+                counts[rule] += int(c)
+        return counts
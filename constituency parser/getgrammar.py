@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import sys, fileinput
+import sys
 from collections import defaultdict
 from collections import OrderedDict
 from operator import itemgetter
@@ -12,8 +12,7 @@ dict = defaultdict(float)
 dict_key_count = defaultdict(int)
 # f = open('train.trees.pre.unk', 'w')
 # sys.stdout = f
-for line in fileinput.input("train.trees.pre.unk"):
-	t = tree.Tree.from_str(line)
+for t in tree.Tree.iter_file("train.trees.pre.unk"):
 	# t.remove_unit()
 	t.restore_unit()
 	# t = tree.Tree.propogateParent(t)    
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Single-pass treebank preprocessing: does the work of preprocess.py,
+unknown.py and getgrammar.py in one streaming command.
+
+    python pipeline.py train.trees --pre train.trees.pre \
+        --unk train.trees.pre.unk --grammar grammar
+
+Each tree is read once, binarized, its unary nodes removed, and
+written to the .pre file (or to a temporary spill file).  While the
+tree is in memory its words are counted, and its rules are counted as
+getgrammar.py would after restore_unit(); rules that have words on the
+right-hand side are kept with the words, since whether a word becomes
+<unk> is only known once all of them are counted.  Only the counts are
+held in memory.
+
+The .unk file is then written by replaying the spilled .pre lines and
+replacing the rare words in the text, without parsing the trees again.
+The grammar is written from the counts, sorted by probability (rules
+with the same probability are sorted by name).
+"""
+import argparse
+import gzip
+import sys
+import tempfile
+from collections import defaultdict
+
+import tree
+
+kUNK = "<unk>"
+
+def open_file(name, mode):
+    """Open a file, (de)compressing it on the fly if its name ends in
+    .gz."""
+    if name.endswith(".gz"):
+        return gzip.open(name, mode)
+    return open(name, mode)
+
+def preprocess(line):
+    """Returns the tree of line, binarized and with its unary nodes
+    removed, as preprocess.py does."""
+    t = tree.Tree.from_str(line)
+    t.binarize()
+    t.remove_unit()
+    assert t.root.label == 'TOP'
+    return t
+
+def count_tree(t, words, rules, lexical):
+    """
+    Adds the words of t to words, and the rules of t with its unary
+    nodes restored to rules.  Rules with words on the right-hand side
+    go to lexical instead, keyed by (lhs, rhs) where each word of rhs
+    is a 1-tuple.
+    """
+    stack = [t.root]
+    while stack:
+        node = stack.pop()
+        if not node.children:
+            words[node.label] += 1
+            continue
+        labels = node.label.split('_')
+        for (parent, child) in zip(labels, labels[1:]):
+            rules["%s --> %s " % (parent, child)] += 1
+        rhs = []
+        has_word = False
+        for child in node.children:
+            if child.children:
+                rhs.append(child.label.split('_', 1)[0])
+                stack.append(child)
+            else:
+                rhs.append((child.label,))
+                has_word = True
+                words[child.label] += 1
+        if has_word:
+            lexical[(labels[-1], tuple(rhs))] += 1
+        else:
+            rules["%s --> %s " % (labels[-1], " ".join(rhs))] += 1
+
+def replace_rare(line, words, min_count=2):
+    """Returns a tree written out by Tree.__str__ with every word seen
+    fewer than min_count times replaced by kUNK."""
+    tokens = line.split(' ')
+    for (i, token) in enumerate(tokens):
+        if not token.startswith('('):
+            word = token.rstrip(')')
+            if words.get(word, 0) < min_count:
+                tokens[i] = kUNK + token[len(word):]
+    return ' '.join(tokens)
+
+def grammar(words, rules, lexical, min_count=2):
+    """
+    Returns the rules of the trees counted by count_tree, once rare
+    words are replaced by kUNK, as a list of (rule, probability).
+    """
+    def unk(word):
+        return word if words[word] >= min_count else kUNK
+    rules = defaultdict(int, rules)
+    # A word with '_' in it is split into a chain of unary nodes too.
+    for (word, count) in words.items():
+        labels = unk(word).split('_')
+        for (parent, child) in zip(labels, labels[1:]):
+            rules["%s --> %s " % (parent, child)] += count
+    for ((lhs, rhs), count) in lexical.items():
+        symbols = [unk(symbol[0]).split('_')[0]
+                   if isinstance(symbol, tuple) else symbol
+                   for symbol in rhs]
+        rules["%s --> %s " % (lhs, " ".join(symbols))] += count
+
+    totals = defaultdict(int)
+    for (rule, count) in rules.items():
+        totals[rule.split(" --> ")[0]] += count
+    probabilities = [(rule, float(count) / totals[rule.split(" --> ")[0]])
+                     for (rule, count) in rules.items()]
+    probabilities.sort(key=lambda (rule, p): (p, rule))
+    return probabilities
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Binarize a treebank, replace its rare words and "
+                    "extract its grammar, in one pass.")
+    parser.add_argument("infile", nargs='?', default="train.trees",
+                        help="trees, one per line (may be .gz)")
+    parser.add_argument("--pre", help="write the binarized trees here")
+    parser.add_argument("--unk", help="write the trees with rare words "
+                                      "replaced here")
+    parser.add_argument("--grammar", "-g", default="grammar",
+                        help="write the grammar here")
+    parser.add_argument("--min-count", dest="min_count", type=int,
+                        default=2, help="words seen fewer times than "
+                                        "this become %s" % kUNK)
+    parser.add_argument("--tmpdir", default=None,
+                        help="directory for the spill file")
+    args = parser.parse_args()
+
+    words = defaultdict(int)
+    rules = defaultdict(int)
+    lexical = defaultdict(int)
+    if args.pre:
+        spill = open_file(args.pre, 'w')
+    elif args.unk:
+        spill = tempfile.TemporaryFile(dir=args.tmpdir)
+    else:
+        spill = None
+    n = 0
+    infile = open_file(args.infile, 'r')
+    for line in infile:
+        t = preprocess(line)
+        count_tree(t, words, rules, lexical)
+        if spill is not None:
+            spill.write("%s\n" % t)
+        n += 1
+    infile.close()
+
+    if args.unk:
+        if args.pre:
+            spill.close()
+            spill = open_file(args.pre, 'r')
+        else:
+            spill.seek(0)
+        outfile = open_file(args.unk, 'w')
+        for line in spill:
+            outfile.write(replace_rare(line.rstrip('\n'), words,
+                                       args.min_count) + '\n')
+        outfile.close()
+    if spill is not None:
+        spill.close()
+
+    outfile = open_file(args.grammar, 'w')
+    for (rule, p) in grammar(words, rules, lexical, args.min_count):
+        outfile.write("%s#%s\n" % (rule, p))
+    outfile.close()
+    sys.stderr.write("%d trees, %d words, %d rules\n" %
+                     (n, len(words), len(rules) + len(lexical)))
+
+if __name__ == '__main__':
+    main()
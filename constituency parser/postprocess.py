@@ -1,13 +1,12 @@
 #!/usr/bin/env python
 
-import sys, fileinput
+import sys
 import tree
 
 orig_stdout = sys.stdout
 f = open('dev.parses.post', 'w')
 sys.stdout = f
-for line in fileinput.input('dev.parses'):
-    t = tree.Tree.from_str(line)
+for t in tree.Tree.iter_file('dev.parses'):
     if t.root is None:
         print
         continue
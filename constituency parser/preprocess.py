@@ -1,14 +1,13 @@
 #!/usr/bin/env python
 
-import sys, fileinput
+import sys
 import tree
 
 orig_stdout = sys.stdout
 f = open('train.trees.pre', 'w')
 sys.stdout = f
 
-for line in fileinput.input("train.trees"):
-    t = tree.Tree.from_str(line)
+for t in tree.Tree.iter_file("train.trees"):
 
     # Binarize, inserting 'X*' nodes.
     t.binarize()
@@ -0,0 +1,192 @@
+import unittest
+from collections import defaultdict
+
+import tree
+from arraytree import ArrayTree
+from pipeline import preprocess, count_tree, replace_rare, grammar
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.words = defaultdict(int)
+        self.rules = defaultdict(int)
+        self.lexical = defaultdict(int)
+        self.pre = []
+        for line in open('train.trees'):
+            t = preprocess(line)
+            count_tree(t, self.words, self.rules, self.lexical)
+            self.pre.append(str(t))
+
+    def test_pre(self):
+        # the output of preprocess.py
+        self.assertEqual(self.pre, [line.rstrip('\n')
+                                    for line in open('train.trees.pre')])
+
+    def test_unk(self):
+        # the output of unknown.py
+        self.assertEqual([replace_rare(line, self.words)
+                          for line in self.pre],
+                         [line.rstrip('\n')
+                          for line in open('train.trees.pre.unk')])
+
+    def test_grammar(self):
+        # the output of getgrammar.py, in which rules with the same
+        # probability come in no particular order
+        lines = ["%s#%s\n" % (rule, p) for (rule, p)
+                 in grammar(self.words, self.rules, self.lexical)]
+        self.assertEqual(sorted(lines), sorted(open('grammar')))
+
+    def test_words_with_underscores(self):
+        # restore_unit() splits words as well as labels
+        words = defaultdict(int)
+        rules = defaultdict(int)
+        lexical = defaultdict(int)
+        for s in ["(TOP (S (NP_NN a_b) (VP (VB c) (NN a_b))))",
+                  "(TOP (S (NP_NN d_e) (VP (VB c) (NN c))))"]:
+            count_tree(tree.Tree.from_str(s), words, rules, lexical)
+        expected = defaultdict(int)
+        for s in ["(TOP (S (NP_NN a_b) (VP (VB c) (NN a_b))))",
+                  "(TOP (S (NP_NN <unk>) (VP (VB c) (NN c))))"]:
+            t = tree.Tree.from_str(s)
+            t.restore_unit()
+            tree.Tree.get_dict(expected, t.root)
+        totals = defaultdict(float)
+        for (rule, count) in expected.items():
+            totals[rule.split(" --> ")[0]] += count
+        self.assertEqual(dict(grammar(words, rules, lexical)),
+                         dict((rule, count / totals[rule.split(" --> ")[0]])
+                              for (rule, count) in expected.items()))
+
+
+class TestTree(unittest.TestCase):
+
+    def test_round_trip(self):
+        for name in ['train.trees.pre', 'train.trees.pre.unk']:
+            lines = [line.strip() for line in open(name)]
+            self.assertEqual([str(t) for t in tree.Tree.iter_file(name)],
+                             lines)
+
+    def test_scan(self):
+        def scan(s):
+            t = tree.Tree.from_str(s)
+            return None if t.root is None else str(t)
+        self.assertEqual(scan(" (A  (B b)\t(C c) ) trailing"),
+                         "(A (B b) (C c))")
+        self.assertEqual(scan("word"), "word")
+        self.assertEqual(scan("( a b)"), "( a b)")
+        self.assertEqual(scan("((A b))"), "((A b)")
+        self.assertEqual(scan("(A (B b)"), None)
+        self.assertEqual(scan("(A (B b) (C"), None)
+        self.assertEqual(scan(""), None)
+        self.assertEqual(tree.Tree._scan_tree("(A b) (C d)")[1], 5)
+        root = tree.Tree.from_str("(A (B b) c)").root
+        self.assertEqual([(child.label, child.order, child.parent is root)
+                          for child in root.children],
+                         [('B', 0, True), ('c', 1, True)])
+
+    def test_deep(self):
+        s = "(A " * 5000 + "x" + ")" * 5000
+        self.assertEqual(str(tree.Tree.from_str(s)), s)
+
+    def assertConsistent(self, t):
+        self.assertEqual(t.root.parent, None)
+        for node in t.bottomup():
+            for (i, child) in enumerate(node.children):
+                self.assertTrue(child.parent is node)
+                self.assertEqual(child.order, i)
+
+    def test_transforms_round_trip(self):
+        # preprocess.py followed by postprocess.py gives back the trees
+        pre = [line.rstrip('\n') for line in open('train.trees.pre')]
+        for (line, expected) in zip(open('train.trees'), pre):
+            t = tree.Tree.from_str(line)
+            original = str(t)
+            t.binarize()
+            t.remove_unit()
+            self.assertConsistent(t)
+            self.assertEqual(str(t), expected)
+            t.restore_unit()
+            t.unbinarize()
+            self.assertConsistent(t)
+            self.assertEqual(str(t), original)
+
+    def test_binarize(self):
+        s = "(S (SQ a b c d) (NP e f g) (X_Y h i j))"
+        t = tree.Tree.from_str(s)
+        t.binarize()
+        self.assertEqual(str(t), "(S (S* (SQ a (SQ* b (SQ* c d))) "
+                                 "(NP (NP* e f) g)) (X_Y (X_Y* h i) j))")
+        t.unbinarize()
+        self.assertEqual(str(t), s)
+        t = tree.Tree.from_str(s)
+        t.binarize_right()
+        self.assertConsistent(t)
+        self.assertEqual(str(t), "(S (SQ a (SQ* b (SQ* c d))) (S* "
+                                 "(NP e (NP* f g)) (X_Y h (X_Y* i j))))")
+
+    def test_unit(self):
+        t = tree.Tree.from_str("(TOP (S (NP (NN a_b)) (VP (VB c))))")
+        t.remove_unit()
+        self.assertConsistent(t)
+        self.assertEqual(str(t), "(TOP_S (NP_NN a_b) (VP_VB c))")
+        t.restore_unit()
+        self.assertEqual(str(t), "(TOP (S (NP (NN (a b))) (VP (VB c))))")
+
+    def test_wide(self):
+        s = "(TOP (NP %s))" % " ".join("(NN w%d)" % i for i in range(20000))
+        t = tree.Tree.from_str(s)
+        t.binarize()
+        t.remove_unit()
+        t.restore_unit()
+        t.unbinarize()
+        self.assertEqual(str(t), s)
+
+
+class TestArrayTree(unittest.TestCase):
+
+    def setUp(self):
+        self.trees = list(tree.Tree.iter_file('train.trees.pre'))
+        self.forest = ArrayTree.from_trees(self.trees)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.forest), len(self.trees))
+        self.assertEqual([str(t) for t in self.forest.to_trees()],
+                         [str(t) for t in self.trees])
+        empty = ArrayTree.from_trees([tree.Tree.from_str(''),
+                                      tree.Tree.from_str('(A b)')])
+        self.assertEqual(empty.to_tree(0).root, None)
+        self.assertEqual(str(empty.to_tree(1)), '(A b)')
+
+    def test_traversals(self):
+        forest = self.forest
+        for (k, t) in enumerate(self.trees):
+            self.assertEqual(forest.words(k),
+                             [leaf.label for leaf in t.leaves()])
+            self.assertEqual([forest.labels[i]
+                              for i in forest.label[forest.bottomup(k)]],
+                             [node.label for node in t.bottomup()])
+            root = forest.offsets[k]
+            self.assertEqual((forest.span_start[root], forest.span_end[root]),
+                             (0, len(forest.words(k))))
+
+    def test_spans(self):
+        t = tree.Tree.from_str("(A (B b c) (C (D d) e))")
+        forest = ArrayTree.from_trees([t])
+        spans = [(forest.labels[forest.label[i]], forest.span_start[i],
+                  forest.span_end[i]) for i in range(forest.num_nodes())]
+        self.assertEqual(spans, [('A', 0, 4), ('B', 0, 2), ('b', 0, 1),
+                                 ('c', 1, 2), ('C', 2, 4), ('D', 2, 3),
+                                 ('d', 2, 3), ('e', 3, 4)])
+        self.assertEqual(list(forest.parent), [-1, 0, 1, 1, 0, 4, 5, 4])
+        self.assertEqual(forest.children(0), [1, 4])
+
+    def test_rule_counts(self):
+        expected = defaultdict(float)
+        for t in self.trees:
+            tree.Tree.get_dict(expected, t.root)
+        self.assertEqual(dict(self.forest.rule_counts()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
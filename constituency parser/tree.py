@@ -23,13 +23,28 @@ class Node(object):
         return self.label
 
     def _subtree_str(self):
-        if len(self.children) != 0:
-            return "(%s %s)" % (self.label, " ".join(child._subtree_str() for child in self.children))
-        else:
-            s = '%s' % self.label
-            #s = s.replace("(", "-LRB-")
-            #s = s.replace(")", "-RRB-")
-            return s
+        # Iterative, so deep trees do not hit the recursion limit; the
+        # stack holds nodes still to be written and the strings that
+        # go between them.
+        pieces = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, Node):
+                pieces.append(item)
+            elif len(item.children) != 0:
+                pieces.append("(%s " % item.label)
+                stack.append(")")
+                for (i, child) in enumerate(reversed(item.children)):
+                    if i:
+                        stack.append(" ")
+                    stack.append(child)
+            else:
+                s = '%s' % item.label
+                #s = s.replace("(", "-LRB-")
+                #s = s.replace(")", "-RRB-")
+                pieces.append(s)
+        return "".join(pieces)
 
     def insert_child(self, i, child):
         if child.parent is not None:
@@ -66,18 +81,34 @@ class Node(object):
             parent.delete_clean()
 
     def bottomup(self):
-        for child in self.children:
-            for node in child.bottomup():
+        # Iterative, like _subtree_str; a node is yielded once all of
+        # its children have been.
+        stack = [(self, False)]
+        while stack:
+            (node, expanded) = stack.pop()
+            if expanded or len(node.children) == 0:
                 yield node
-        yield self
+            else:
+                stack.append((node, True))
+                for child in reversed(node.children):
+                    stack.append((child, False))
 
     def leaves(self):
-        if len(self.children) == 0:
-            yield self
-        else:
-            for child in self.children:
-                for leaf in child.leaves():
-                    yield leaf
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if len(node.children) == 0:
+                yield node
+            else:
+                stack.extend(reversed(node.children))
+
+    def _set_children(self, children):
+        # Replace the children all at once, numbering them in one pass.
+        # The old children are not detached.
+        self.children = children
+        for (i, child) in enumerate(children):
+            child.parent = self
+            child.order = i
 
 class Tree(object):
     def __init__(self, root):
@@ -91,33 +122,44 @@ class Tree(object):
     leaf_node = re.compile(r'\s*([^\s)]+)')
 
     @staticmethod
-    def _scan_tree(s):
-        result = Tree.interior_node.match(s)
-        if result != None:
-            label = result.group(1)
-            pos = result.end()
-            children = []
-            (child, length) = Tree._scan_tree(s[pos:])
-            while child != None:
-                children.append(child)
-                pos += length
-                (child, length) = Tree._scan_tree(s[pos:])
-            result = Tree.close_brace.match(s[pos:])
-            if result != None:
-                pos += result.end()
-                return Node(label, children), pos
-            else:
-                return (None, 0)
-        else:
-            result = Tree.leaf_node.match(s)
+    def _scan_tree(s, pos=0):
+        """ Scan the tree that starts at s[pos:], returning (node, length),
+        or (None, 0) if there is none. The scan is iterative, and matches
+        the patterns at positions in s instead of slicing it, so it takes
+        linear time, whatever the depth of the tree. """
+        # Each frame is [label, children, start] for an interior node
+        # whose children are being scanned.
+        stack = []
+        start = pos
+        while True:
+            node = None
+            result = Tree.interior_node.match(s, pos)
             if result != None:
+                stack.append([result.group(1), [], pos])
                 pos = result.end()
-                label = result.group(1)
+                continue
+            result = Tree.leaf_node.match(s, pos)
+            if result != None:
                 #label = label.replace("-LRB-", "(")
                 #label = label.replace("-RRB-", ")")
-                return (Node(label,[]), pos)
-            else:
-                return (None, 0)
+                node = Node(result.group(1), [])
+                pos = result.end()
+            # No child here: close the innermost node, or fail it, in
+            # which case its parent looks for the close brace where the
+            # failed node started.
+            while node is None:
+                if not stack:
+                    return (None, 0)
+                (label, children, node_start) = stack.pop()
+                result = Tree.close_brace.match(s, pos)
+                if result != None:
+                    pos = result.end()
+                    node = Node(label, children)
+                else:
+                    pos = node_start
+            if not stack:
+                return (node, pos - start)
+            stack[-1][1].append(node)
 
     @staticmethod
     def from_str(s):
@@ -125,6 +167,14 @@ class Tree(object):
         (tree, n) = Tree._scan_tree(s)
         return Tree(tree)
 
+    @staticmethod
+    def iter_file(path):
+        """ Generate the trees in a file, one per line. Lines that do not
+        hold a tree give a Tree whose root is None. """
+        with open(path) as f:
+            for line in f:
+                yield Tree.from_str(line)
+
     #added methods here
     @staticmethod
     def get_dict(d,root):
@@ -217,46 +267,59 @@ class Tree(object):
                 child = node.children[0]
                 if len(child.children) > 0:
                     node.label = "%s_%s" % (node.label, child.label)
-                    child.detach()
-                    for grandchild in list(child.children):
-                        node.append_child(grandchild)
+                    node._set_children(child.children)
+                    child.children = []
+                    child.parent = None
+                    child.order = 0
 
     def restore_unit(self):
         """ Restore the unary nodes that were removed by remove_unit(). """
-        def visit(node):
-            children = [visit(child) for child in node.children]
+        # The new nodes are built bottom-up, each from the new nodes of
+        # its children.
+        new = {}
+        for node in list(self.bottomup()):
+            children = [new.pop(id(child)) for child in node.children]
             labels = node.label.split('_')
-            node = Node(labels[-1], children)
+            restored = Node(labels[-1], children)
             for label in reversed(labels[:-1]):
-                node = Node(label, [node])
-            return node
-        self.root = visit(self.root)
+                restored = Node(label, [restored])
+            new[id(node)] = restored
+        self.root = new[id(self.root)]
+
+    @staticmethod
+    def _binarize_node(node, right):
+        # Replace the children c1 ... cn of node by a chain of nodes
+        # labeled node.label+"*": [c1, (* c2 (* ... cn))] if right is
+        # true, else [((* (* c1 c2) ...) c(n-1)), cn]. The children are
+        # taken from node all at once, so no siblings are renumbered.
+        children = node.children
+        for child in children:
+            child.parent = None
+        vlabel = node.label+"*"
+        if right:
+            prev = children[-1]
+            for child in reversed(children[1:-1]):
+                prev = Node(vlabel, [child, prev])
+            node._set_children([children[0], prev])
+        else:
+            prev = children[0]
+            for child in children[1:-1]:
+                prev = Node(vlabel, [prev, child])
+            node._set_children([prev, children[-1]])
 
     def binarize_right(self):
         """ Binarize into a right-branching structure. """
         nodes = list(self.bottomup())
         for node in nodes:
             if len(node.children) > 2:
-                # create a right-branching structure
-                children = list(node.children)
-                children.reverse()
-                vlabel = node.label+"*"
-                prev = children[0]
-                for child in children[1:-1]:
-                    prev = Node(vlabel, [child, prev])
-                node.append_child(prev)
+                Tree._binarize_node(node, True)
 
     def binarize_left(self):
         """ Binarize into a left-branching structure. """
         nodes = list(self.bottomup())
         for node in nodes:
             if len(node.children) > 2:
-                vlabel = node.label+"*"
-                children = list(node.children)
-                prev = children[0]
-                for child in children[1:-1]:
-                    prev = Node(vlabel, [prev, child])
-                node.insert_child(0, prev)
+                Tree._binarize_node(node, False)
 
     def binarize(self):
         """ Binarize into a left-branching or right-branching structure
@@ -265,33 +328,32 @@ class Tree(object):
         nodes = list(self.bottomup())
         for node in nodes:
             if len(node.children) > 2:
-                if node.label in ['SQ']:
-                    # create a right-branching structure
-                    children = list(node.children)
-                    children.reverse()
-                    vlabel = node.label+"*"
-                    prev = children[0]
-                    for child in children[1:-1]:
-                        prev = Node(vlabel, [child, prev])
-                    node.append_child(prev)
-                else:
-                    # create a left-branching structure
-                    vlabel = node.label+"*"
-                    children = list(node.children)
-                    prev = children[0]
-                    for child in children[1:-1]:
-                        prev = Node(vlabel, [prev, child])
-                    node.insert_child(0, prev)
+                Tree._binarize_node(node, node.label in ['SQ'])
 
     def unbinarize(self):
         """ Undo binarization by removing any nodes ending with *. """
-        def visit(node):
-            children = sum([visit(child) for child in node.children], [])
+        # Walk the tree top-down, appending each new node to the list of
+        # children of its nearest ancestor not ending with *. A node
+        # takes its place in that list when it is reached, and is built
+        # once its own children are complete.
+        roots = []
+        stack = [(self.root, roots)]
+        while stack:
+            item = stack.pop()
+            if len(item) == 3:
+                (label, children, (siblings, i)) = item
+                siblings[i] = Node(label, children)
+                continue
+            (node, siblings) = item
             if node.label.endswith('*'):
-                return children
+                children = siblings
             else:
-                return [Node(node.label, children)]
-        roots = visit(self.root)
+                children = []
+                stack.append((node.label, children,
+                              (siblings, len(siblings))))
+                siblings.append(None)
+            for child in reversed(node.children):
+                stack.append((child, children))
         assert len(roots) == 1
         self.root = roots[0]
 
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import sys, fileinput
+import sys
 import collections
 import tree
 
@@ -10,8 +10,7 @@ f = open('train.trees.pre.unk', 'w')
 sys.stdout = f
 trees = []
 
-for line in fileinput.input("train.trees.pre"):
-    t = tree.Tree.from_str(line)
+for t in tree.Tree.iter_file("train.trees.pre"):
     for leaf in t.leaves():
         count[leaf.label] += 1
     trees.append(t)